@@ -1,15 +1,38 @@
 # -*- coding: utf-8 -*-
 # from  MatODM import Documents as DocModule
 from typing import List, Union
+import time
+import json
 from  . import abstract 
+from . import changes
 from warnings import warn
 try:
     from arango import ArangoClient
 except  ModuleNotFoundError:
-    raise warn("arango-python not installed. Access to mongoDB not possible")
+    warn("python-arango not installed. Access to arangodb not possible")
 
 __all__ = ["ArangoDatabase"]
 
+#AQL comparison operators for the filter operators used in templates 
+_AQL_OPERATORS = {"eq":"==","lt":"<","le":"<=","gt":">","ge":">=","in":"IN"}
+
+def _aql_attribute(docvar:str,path:str)->str:
+    """AQL attribute access for the dotted field path"""
+    return docvar + "".join(f".`{name}`" for name in path.split("."))
+
+def _aql_patch(tree:dict,docvar:str)->str:
+    """
+    AQL object expression of the tree of field names to expressions. Nested fields are merged into
+    the stored object so that only the given paths change.
+    """
+    items = []
+    for name,expr in tree.items():
+        if isinstance(expr,dict):
+            attr = _aql_attribute(docvar,name)
+            expr = f"MERGE(IS_OBJECT({attr}) ? {attr} : {{}}, {_aql_patch(expr,attr)})"
+        items.append(f"{json.dumps(name)}: {expr}")
+    return "{" + ", ".join(items) + "}"
+
 class ArangoDatabase(abstract.Database):
     """
     connection to the arangodb database
@@ -25,6 +48,23 @@ class ArangoDatabase(abstract.Database):
         Adds collection  to the database to retrive collection use get database after creating it
         """
         self.db.create_collection(collection_name)
+        self.db.collection(collection_name).add_persistent_index([changes.STAMP_FIELD],sparse=True)
+        self.collections[collection_name] = ArangoCollection(collection_name,self.db, self.db.collection(collection_name))
+        return self.collections[collection_name]
+
+    def _create_edge_collection(self,collection_name:str)->"ArangoCollection":
+        """creates arango edge collection, _from and _to are indexed by its edge index"""
+        self.db.create_collection(collection_name,edge=True)
+        self.db.collection(collection_name).add_persistent_index(["from_collection"])
+        self.db.collection(collection_name).add_persistent_index(["to_collection"])
+        self.collections[collection_name] = ArangoCollection(collection_name,self.db, self.db.collection(collection_name))
+        return self.collections[collection_name]
+    
+    def _create_chunk_collection(self,collection_name:str)->"ArangoCollection":
+        """creates chunk collection with persistent indexes on chunk_key, parent and collection"""
+        self.db.create_collection(collection_name)
+        for field in ("chunk_key","parent","collection"):
+            self.db.collection(collection_name).add_persistent_index([field])
         self.collections[collection_name] = ArangoCollection(collection_name,self.db, self.db.collection(collection_name))
         return self.collections[collection_name]
     
@@ -40,7 +80,6 @@ class ArangoDatabase(abstract.Database):
         Delete the collection from the database
         """
         self.db.delete_collection(collection_name)
-        self.collections.pop(collection_name)
         
     def advanced_query(self,query:str) -> list:
         """
@@ -79,9 +118,6 @@ class ArangoDatabase(abstract.Database):
 
         """
         return self.db.aql.explain(query)
-    
-    def _range_query_translator(self, template):
-        pass 
             
 #TODO: add super user functionality 
     # @staticmethod
@@ -99,6 +135,10 @@ class ArangoCollection(abstract.DatabaseCollection):
     """
     A generic interface for arangodb collection
     """
+    def __init__(self,name:str,dbInst,dbColInst):
+        super().__init__(name,dbInst,dbColInst)
+        #paths with unique index created by this object
+        self._unique_indexes = set()
         
     def insert(self,doc:dict,*args,**kwargs):
         """
@@ -107,6 +147,15 @@ class ArangoCollection(abstract.DatabaseCollection):
         out = self.dbColInst.insert(doc,*args,**kwargs)
         return out["_id"],out["_key"]
     
+    def insert_many(self,docs:List[dict],*args,**kwargs)->List[tuple]:
+        """
+        create new documents with a single bulk insert
+        """
+        out = self.dbColInst.insert_many(docs,*args,**kwargs)
+        for res in out:
+            if isinstance(res,Exception): raise res
+        return [(res["_id"],res["_key"]) for res in out]
+    
     def update(self,doc,*args,**kwargs):
         """
         update existing document
@@ -114,11 +163,113 @@ class ArangoCollection(abstract.DatabaseCollection):
         out = self.dbColInst.update(doc,*args,**kwargs)
         return out["_id"],out["_key"]
     
+    def update_many(self,docs:List[dict],*args,**kwargs)->List[tuple]:
+        """
+        update existing documents with a single bulk update
+        """
+        out = self.dbColInst.update_many(docs,*args,**kwargs)
+        for res in out:
+            if isinstance(res,Exception): raise res
+        return [(res["_id"],res["_key"]) for res in out]
+    
+    def update_versioned(self,docs:List[dict],keyname:str="_id",*args,**kwargs)->List[tuple]:
+        """
+        update documents with a single AQL UPDATE query which filters on the stored version. Top level 
+        fields are replaced and fields with None value removed. Documents which are not returned by the 
+        query were not updated. At most one document is updated per patch.
+        """
+        if len(docs) == 0: return []
+        query = f"""
+                FOR i IN 0..LENGTH(@docs)-1
+                    LET patch = @docs[i]
+                    FOR doc IN @@collection
+                        FILTER {_aql_attribute("doc",keyname)} == {_aql_attribute("patch",keyname)} 
+                            && doc.version == patch.version - 1
+                        LIMIT 1
+                        UPDATE doc WITH UNSET(patch,"_id","_key","_rev") IN @@collection 
+                            OPTIONS {{keepNull: false, mergeObjects: false}}
+                        RETURN [i, NEW._id, NEW._key]
+                """
+        bind_vars = {"@collection":self.name,"docs":docs}
+        out = [None]*len(docs)
+        for i,docid,dockey in self.dbInst.aql.execute(query,bind_vars=bind_vars,*args,**kwargs):
+            out[i] = (docid,dockey)
+        return out
+
+    def _create_unique_index(self,path:str):
+        """creates unique sparse persistent index on the field path once, documents without the field are not indexed"""
+        if path in self._unique_indexes: return
+        self.dbColInst.add_persistent_index([path],unique=True,sparse=True)
+        self._unique_indexes.add(path)
+
+    def upsert_many(self,docs:List[dict],keyname:str,now:str,*args,**kwargs)->List[tuple]:
+        """
+        insert documents or update stored documents with same value of keyname in a single AQL UPSERT query.
+        UPSERT is not atomic, so a unique index on the key keeps concurrent writers from inserting the same key twice.
+        """
+        if len(docs) == 0: return []
+        if keyname != "_key": self._create_unique_index(keyname)
+        protected = ",".join(f'"{name}"' for name in abstract._UPSERT_PROTECTED_FIELDS)
+        query = f"""
+                FOR doc IN @docs
+                    UPSERT {{`{keyname}`: {_aql_attribute("doc",keyname)}}}
+                    INSERT MERGE(UNSET(doc,"_id","_rev"), {{created_on: @now}})
+                    UPDATE MERGE(UNSET(doc,{protected}), {{version: OLD.version + 1, revised_on: @now}})
+                    IN @@collection OPTIONS {{mergeObjects: false}}
+                    RETURN [NEW._id, NEW._key, NEW.version, NEW.created_on, NEW.revised_on]
+                """
+        bind_vars = {"@collection":self.name,"docs":docs,"now":now}
+        return [tuple(res) for res in self.dbInst.aql.execute(query,bind_vars=bind_vars,*args,**kwargs)]
+
     def find(self,criteria:dict,*args,**kwargs):
         """
         find doc with specific criteria
         """
-        return list(self.dbColInst.find(criteria,*args,**kwargs))
+        return self.range_query([(path,"eq",val) for path,val in criteria.items()],*args,**kwargs)
+    
+    def _range_query_aql(self,filters:List[tuple])->(str,dict):
+        """AQL query and bind variables returning documents matching the filters"""
+        filter_str, bind_vars = self._compile_filters(filters)
+        query = f"""
+                FOR doc IN @@collection
+                    {filter_str}
+                    RETURN doc
+                """
+        bind_vars["@collection"] = self.name
+        return query, bind_vars
+    
+    def range_query(self,filters:List[tuple],*args,**kwargs)->List[dict]:
+        """
+        find documents matching (field path, operator, value) filters
+        """
+        query, bind_vars = self._range_query_aql(filters)
+        return list(self.dbInst.aql.execute(query,bind_vars=bind_vars,*args,**kwargs))
+    
+    def explain(self,filters:List[tuple],profile:bool=False)->dict:
+        """
+        query plan of the filters from the arango optimizer. With profile the query runs with profiling
+        and server time is the execution time reported by arango. Network time includes decoding 
+        of the response by the driver, so decode is None.
+        """
+        query, bind_vars = self._range_query_aql(filters)
+        aql = self.dbInst.aql
+        nodes = aql.explain(query,bind_vars=bind_vars)["nodes"]
+        scans = [node for node in nodes if node["type"] in ("EnumerateCollectionNode","IndexNode")]
+        plan = {"query":query,"bind_vars":bind_vars,"plan":nodes,
+                "indexes":[index["name"] for node in scans for index in node.get("indexes",[])],
+                "full_scan":any(node["type"] == "EnumerateCollectionNode" for node in scans),
+                "estimated_rows":sum(node.get("estimatedNrItems",0) for node in scans)}
+        if not profile: return plan
+        start = time.perf_counter()
+        cursor = aql.execute(query,bind_vars=bind_vars,profile=True)
+        plan["docs"] = list(cursor)
+        total = time.perf_counter()-start
+        stats = cursor.statistics()
+        server = stats.get("execution_time",0.)
+        plan.update({"rows_scanned":stats.get("scanned_full",0)+stats.get("scanned_index",0),
+                     "rows_returned":len(plan["docs"]),"profile":cursor.profile(),
+                     "timing":{"server":server,"network":max(total-server,0.),"decode":None}})
+        return plan
     
     def has_doc(self,docID:str)->bool:
         """
@@ -163,10 +314,124 @@ class ArangoCollection(abstract.DatabaseCollection):
         """returns _keys for all document this is specific function to arangodb"""
         return list(self.dbColInst.keys())
     
+    def get_page(self,after_key:str=None,limit:int=1000)->List[dict]:
+        """
+        returns at most limit documents with _key greater than after_key in _key order
+        """
+        query = """
+                FOR doc IN @@collection
+                    FILTER @after_key == null || doc._key > @after_key
+                    SORT doc._key
+                    LIMIT @limit
+                    RETURN doc
+                """
+        bind_vars = {"@collection":self.name,"after_key":after_key,"limit":limit}
+        return list(self.dbInst.aql.execute(query,bind_vars=bind_vars))
+    
+    def find_sorted(self,filters:List[tuple],path:str,limit:int=1000)->List[dict]:
+        """
+        returns at most limit documents matching the filters sorted on the field path
+        """
+        filter_str, bind_vars = self._compile_filters(filters)
+        query = f"""
+                FOR doc IN @@collection
+                    {filter_str}
+                    SORT {_aql_attribute("doc",path)}
+                    LIMIT @limit
+                    RETURN doc
+                """
+        bind_vars.update({"@collection":self.name,"limit":limit})
+        return list(self.dbInst.aql.execute(query,bind_vars=bind_vars))
+
+    def join(self,filters:List[tuple],joins:List[tuple])->List[dict]:
+        """
+        compiles the joins into one AQL query with a nested FOR per relational field filtered on the
+        referenced _id, so that referenced documents are read from the primary index. Joins without
+        filters use a LET subquery and keep documents without referenced document.
+        """
+        filter_str, bind_vars = self._compile_filters(filters)
+        bind_vars["@collection"] = self.name
+        lines = ["FOR doc IN @@collection",filter_str]
+        returns = ["doc: doc"]
+        for i,(field,coll,join_filters) in enumerate(joins):
+            docvar = f"j{i}"
+            reference = _aql_attribute("doc",field+"._id")
+            join_filter_str, join_bind_vars = self._compile_filters(join_filters,docvar)
+            bind_vars.update(join_bind_vars)
+            bind_vars[f"@c{i}"] = coll.name
+            if len(join_filters) > 0:
+                lines += [f"FOR {docvar} IN @@c{i}",f"FILTER {docvar}._id == {reference}",join_filter_str]
+            else:
+                lines.append(f"LET {docvar} = FIRST(FOR ref IN @@c{i} FILTER ref._id == {reference} RETURN ref)")
+            returns.append(f"{json.dumps(field)}: {docvar}")
+        lines.append("RETURN {" + ", ".join(returns) + "}")
+        query = "\n".join(line for line in lines if line != "")
+        return list(self.dbInst.aql.execute(query,bind_vars=bind_vars))
+
+    def traverse(self,start_id:str,depth:int,direction:str,doc_types:List[str]=None)->List[tuple]:
+        """
+        compiles the traversal into AQL graph traversal over this edge collection in breadth first order
+        with globally unique vertices, so that each vertex is returned once at its shortest depth together
+        with its document
+        """
+        type_filter = "" if doc_types is None else "FILTER v.ODM_doc_type IN @doc_types"
+        query = f"""
+                FOR v, e, p IN 1..@depth {direction.upper()} @start @@edges
+                    OPTIONS {{order: "bfs", uniqueVertices: "global"}}
+                    FILTER v != null
+                    {type_filter}
+                    RETURN [v._id, LENGTH(p.edges), v]
+                """
+        bind_vars = {"@edges":self.name,"start":start_id,"depth":depth}
+        if doc_types is not None: bind_vars["doc_types"] = doc_types
+        return [tuple(row) for row in self.dbInst.aql.execute(query,bind_vars=bind_vars)]
+
     def get_random_doc(self,*args,**kwargs):
         """returns random document from the collection"""
         return self.dbColInst.random(*args,**kwargs)
     
+    def get_random_docs(self,n:int,filters:List[tuple]=[],seed:int=None,*args,**kwargs)->List[dict]:
+        """
+        returns n random documents using SORT RAND(). With seed the keys of matching documents 
+        are streamed in primary index order and reservoir sampled so that the sample is reproducible.
+
+        Parameters
+        ----------
+        n : int
+            number of documents.
+        filters : List[tuple], optional
+            (field path, operator, value) filters. The default is [].
+        seed : int, optional
+            seed for reproducible sample. The default is None.
+
+        Returns
+        -------
+        List[dict]
+            sampled documents.
+
+        """
+        filter_str, bind_vars = self._compile_filters(filters)
+        bind_vars["@collection"] = self.name
+        aql = self.dbInst.aql
+        if seed is None:
+            bind_vars["n"] = n
+            query = f"""
+                    FOR doc IN @@collection
+                        {filter_str}
+                        SORT RAND()
+                        LIMIT @n
+                        RETURN doc
+                    """
+            return list(aql.execute(query,bind_vars=bind_vars,*args,**kwargs))
+        query = f"""
+                FOR doc IN @@collection
+                    {filter_str}
+                    SORT doc._key
+                    RETURN doc._key
+                """
+        keys = abstract._reservoir_sample(aql.execute(query,bind_vars=bind_vars,stream=True),n,seed)
+        return self.dbColInst.get_many(keys)
+    
     def get_doc(self, docID:str, *args,**kwargs):
         """
         get document with given _id 
@@ -183,6 +448,25 @@ class ArangoCollection(abstract.DatabaseCollection):
         """    
         return self.dbColInst.get(docID,*args,**kwargs)
     
+    def get_many(self,docIDs:List[str])->List[dict]:
+        """
+        get multiple documents with one DOCUMENT(@ids) lookup on the primary index. Documents are 
+        returned in the order of docIDs and missing documents are skipped.
+        """
+        query = "FOR doc IN DOCUMENT(@ids) RETURN doc"
+        return list(self.dbInst.aql.execute(query,bind_vars={"ids":list(docIDs)}))
+
+    def get_many_with_key(self,keyname:str,keyvals:list)->List[dict]:
+        """
+        get documents whose key is one of the values with one IN query
+        """
+        query = f"""
+                FOR doc IN @@collection
+                    FILTER {_aql_attribute("doc",keyname)} IN @keyvals
+                    RETURN doc
+                """
+        return list(self.dbInst.aql.execute(query,bind_vars={"@collection":self.name,"keyvals":list(keyvals)}))
+
     def get_doc_with_key(self,keyname:str,keyval:Union[str,int,bool,float])->List[dict]:
         """
         Get document with a key
@@ -200,7 +484,7 @@ class ArangoCollection(abstract.DatabaseCollection):
             Documents matching the keys.
 
         """
-        return list(self.dbColInst.find({keyname:keyval}))
+        return self.range_query([(keyname,"eq",keyval)])
         
     def delete(self,docID:str,*args,**kwargs):
         """
@@ -239,14 +523,163 @@ class ArangoCollection(abstract.DatabaseCollection):
 
         """
         if is_field_physical_qty: field +=".value"
+        return self.range_query([(field,"ge",minval),(field,"le",maxval)])
+        
+    def distinct(self,path:str,filters:List[tuple]=[])->list:
+        """
+        distinct values of the field path in documents matching the filters
+        """
+        filter_str, bind_vars = self._compile_filters(filters)
         query = f"""
-                FOR doc IN {self.name}
-                    FILTER doc.{field} >= {minval}  && doc.{field} <= {maxval}
-                    RETURN doc
+                FOR doc IN @@collection
+                    {filter_str}
+                    COLLECT val = {_aql_attribute("doc",path)}
+                    RETURN val
                 """
-        aql = self.dbInst.aql
-        return list(aql.execute(query))
-        
+        bind_vars["@collection"] = self.name
+        return list(self.dbInst.aql.execute(query,bind_vars=bind_vars))
+
+    def count(self,filters:List[tuple]=[])->int:
+        """
+        number of documents matching the filters, counted with COLLECT WITH COUNT
+        """
+        filter_str, bind_vars = self._compile_filters(filters)
+        query = f"""
+                FOR doc IN @@collection
+                    {filter_str}
+                    COLLECT WITH COUNT INTO n
+                    RETURN n
+                """
+        bind_vars["@collection"] = self.name
+        return next(iter(self.dbInst.aql.execute(query,bind_vars=bind_vars)))
+    
+    def aggregate(self,filters:List[tuple],group_by:List[str],metrics:List[tuple])->List[dict]:
+        """
+        compiles grouping and statistics into single AQL COLLECT ... AGGREGATE query. Unit conversion 
+        factors are passed as bind variables and applied in the query.
+        """
+        filter_str, bind_vars = self._compile_filters(filters)
+        bind_vars["@collection"] = self.name
+        lets = []
+        aggregates = []
+        for j,(value_path,unit_path,factors) in enumerate(metrics):
+            value = _aql_attribute("doc",value_path)
+            if factors is None:
+                lets.append(f"LET m{j} = IS_NUMBER({value}) ? {value} : null")
+            else:
+                unit = _aql_attribute("doc",unit_path)
+                bind_vars[f"f{j}"] = factors
+                lets.append(f"LET m{j} = IS_NUMBER({value}) && HAS(@f{j},{unit}) ? "
+                            f"{value} * @f{j}[{unit}][0] + @f{j}[{unit}][1] : null")
+            aggregates += [f"m{j}_mean = AVERAGE(m{j})",f"m{j}_min = MIN(m{j})",f"m{j}_max = MAX(m{j})",
+                           f"m{j}_count = SUM(m{j} == null ? 0 : 1)",f"m{j}_std = STDDEV_SAMPLE(m{j})",
+                           f"m{j}_sum = SUM(m{j})"]
+        groups = [f"g{i} = {_aql_attribute('doc',path)}" for i,path in enumerate(group_by)]
+        returns = [f"g{i}" for i in range(len(group_by))] + [name.split(" = ")[0] for name in aggregates]
+        collect = "COLLECT " + ", ".join(groups)
+        if len(aggregates)>0: collect += " AGGREGATE " + ", ".join(aggregates)
+        query = f"""
+                FOR doc IN @@collection
+                    {filter_str}
+                    {" ".join(lets)}
+                    {collect}
+                    RETURN {{{", ".join(returns)}}}
+                """
+        return list(self.dbInst.aql.execute(query,bind_vars=bind_vars))
+    
     def delete_all_docs(self,*args,**kwargs):
-        """method to delete all documents from the collection"""
-        self.dbColInst.delete_many(self.get_all_ids())
\ No newline at end of file
+        """method to delete all documents from the collection. Collection is truncated on the server"""
+        return self.dbColInst.truncate()
+    
+    def update_where(self,filters:List[tuple],patch:dict,bump_version:bool=True,*args,**kwargs)->int:
+        """
+        update all documents matching the filters with a single AQL UPDATE query. Dotted paths of the patch
+        are merged into the stored objects and fields with None value are removed.
+        """
+        filter_str, bind_vars = self._compile_filters(filters)
+        tree = {}
+        for i,(path,val) in enumerate(patch.items()):
+            names = path.split(".")
+            node = tree
+            for name in names[:-1]: node = node.setdefault(name,{})
+            node[names[-1]] = f"@p{i}"
+            bind_vars[f"p{i}"] = val
+        if bump_version: tree["version"] = "(IS_NUMBER(doc.version) ? doc.version : 0) + 1"
+        query = f"""
+                FOR doc IN @@collection
+                    {filter_str}
+                    UPDATE doc WITH {_aql_patch(tree,"doc")} IN @@collection
+                        OPTIONS {{keepNull: false, mergeObjects: false}}
+                """
+        bind_vars["@collection"] = self.name
+        cursor = self.dbInst.aql.execute(query,bind_vars=bind_vars,*args,**kwargs)
+        return cursor.statistics()["modified"]
+
+    def delete_where(self,filters:List[tuple],*args,return_ids:bool=False,**kwargs)->Union[int,List[str]]:
+        """
+        delete all documents matching the filters with a single AQL REMOVE query
+
+        Parameters
+        ----------
+        filters : List[tuple]
+            (field path, operator, value) filters.
+        return_ids : bool, optional
+            return _id of the removed documents from the REMOVE query. The default is False.
+
+        Returns
+        -------
+        Union[int,List[str]]
+            number of deleted documents or their _id with return_ids.
+
+        """
+        filter_str, bind_vars = self._compile_filters(filters)
+        query = f"""
+                FOR doc IN @@collection
+                    {filter_str}
+                    REMOVE doc IN @@collection
+                    {"RETURN OLD._id" if return_ids else ""}
+                """
+        bind_vars["@collection"] = self.name
+        cursor = self.dbInst.aql.execute(query,bind_vars=bind_vars,*args,**kwargs)
+        return list(cursor) if return_ids else cursor.statistics()["modified"]
+    
+    @staticmethod
+    def _compile_filters(filters:List[tuple],docvar:str="doc")->(str,dict):
+        """
+        compiles (field path, operator, value) filters into AQL FILTER statement
+
+        Parameters
+        ----------
+        filters : List[tuple]
+            (field path, operator, value) filters.
+        docvar : str, optional
+            name of the document variable in the query. The default is "doc".
+
+        Returns
+        -------
+        (str,dict)
+            FILTER statement and its bind variables.
+
+        """
+        if len(filters) == 0:
+            return "", {}
+        conditions, bind_vars = ArangoCollection._compile_conditions(filters,docvar,f"{docvar}_v")
+        return "FILTER " + conditions, bind_vars
+
+    @staticmethod
+    def _compile_conditions(filters:List[tuple],docvar:str,name:str)->(str,dict):
+        """AQL conditions of the filters joined with && and their bind variables named from name"""
+        conditions = []
+        bind_vars = {}
+        for i,(path,operator,val) in enumerate(filters):
+            if operator == "or":
+                branches = []
+                for j,branch in enumerate(val):
+                    branch_conditions, branch_vars = ArangoCollection._compile_conditions(branch,docvar,f"{name}{i}_{j}_")
+                    branches.append(f"({branch_conditions})")
+                    bind_vars.update(branch_vars)
+                conditions.append(f"({' || '.join(branches)})")
+                continue
+            conditions.append(f"{_aql_attribute(docvar,path)} {_AQL_OPERATORS[operator]} @{name}{i}")
+            bind_vars[f"{name}{i}"] = val
+        return " && ".join(conditions), bind_vars
\ No newline at end of file
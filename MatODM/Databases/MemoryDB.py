@@ -0,0 +1,576 @@
+# -*- coding: utf-8 -*-
+from typing import List, Union, Callable
+from copy import deepcopy
+from bisect import bisect_left, bisect_right
+import heapq
+import random
+import time
+import statistics
+import json
+from . import abstract, graph
+
+__all__ = ["MemoryDatabase"]
+
+_MISSING = object()
+
+def _get_path(doc:dict,path:str):
+    """returns value at the dotted field path of the document or _MISSING"""
+    val = doc
+    for name in path.split("."):
+        if not isinstance(val,dict) or name not in val:
+            return _MISSING
+        val = val[name]
+    return val
+
+def _hashable(val):
+    """converts field value to a hashable value for hash indexes"""
+    if isinstance(val,(dict,list)):
+        return json.dumps(val,sort_keys=True)
+    return val
+
+def _is_number(val)->bool:
+    return isinstance(val,(int,float)) and not isinstance(val,bool)
+
+def _compare(val,operator:str,other)->bool:
+    """applies filter operator. Values which cannot be compared do not match"""
+    if val is _MISSING:
+        return False
+    try:
+        if operator == "eq": return val == other
+        if operator == "lt": return val < other
+        if operator == "le": return val <= other
+        if operator == "gt": return val > other
+        if operator == "ge": return val >= other
+        if operator == "in": return val in other
+    except TypeError:
+        return False
+    raise ValueError(f"operator {operator} not recognized")
+
+def _matches(doc:dict,filters:List[tuple])->bool:
+    """whether the document matches all filters"""
+    for path,operator,val in filters:
+        if operator == "or":
+            if not any(_matches(doc,branch) for branch in val): return False
+        elif not _compare(_get_path(doc,path),operator,val):
+            return False
+    return True
+
+def _describe(filters:List[tuple])->str:
+    """readable text of the filters for query plans"""
+    return " AND ".join("("+" OR ".join(_describe(branch) for branch in val)+")" if operator == "or" 
+                        else f"{path} {operator} {val!r}" for path,operator,val in filters)
+
+class MemoryDatabase(abstract.Database):
+    """
+    In-process database backed by python dicts. Collections can have hash indexes for equality
+    lookups and sorted indexes for range queries on numeric fields. This is useful for unit tests,
+    caching and local analytics without a database server.
+    """
+    _parallel_io = False
+    def __init__(self,dbname:str,url:str="memory",*args,**kwargs):
+        super().__init__(dbname,url,*args,**kwargs)
+
+    def _connect(self,username:str,password:str,*args,**kwargs):
+        return {}
+
+    def create_collection(self,collection_name:str,hash_indexes:List[str]=[],sorted_indexes:List[str]=[])->"MemoryCollection":
+        """
+        Adds collection  to the database
+
+        Parameters
+        ----------
+        collection_name : str
+            name of the collection.
+        hash_indexes : List[str], optional
+            field paths with hash index for equality lookups. The default is [].
+        sorted_indexes : List[str], optional
+            numeric field paths with sorted index for range queries e.g. "strength.value" for
+            PhysicalQty field. The default is [].
+
+        Returns
+        -------
+        MemoryCollection
+        """
+        self.db[collection_name] = {}
+        self.collections[collection_name] = MemoryCollection(collection_name,self.db,self.db[collection_name])
+        for path in hash_indexes: self.collections[collection_name].create_hash_index(path)
+        for path in sorted_indexes: self.collections[collection_name].create_sorted_index(path)
+        return self.collections[collection_name]
+
+    def _create_edge_collection(self,collection_name:str)->"MemoryCollection":
+        """creates edge collection with hash indexes on _from, _to and their collections"""
+        return self.create_collection(collection_name,hash_indexes=["_from","_to","from_collection","to_collection"])
+
+    def _create_chunk_collection(self,collection_name:str)->"MemoryCollection":
+        """creates chunk collection with hash indexes on chunk_key, parent and collection"""
+        return self.create_collection(collection_name,hash_indexes=["chunk_key","parent","collection"])
+
+    def _initalize_collections(self):
+        """Initializes collection in the database"""
+        for collection_name,docs in self.db.items():
+            self.collections[collection_name] = MemoryCollection(collection_name,self.db,docs)
+
+    def _del_collection_from_db(self,collection_name:str):
+        """
+        Delete the collection from the database
+        """
+        self.db.pop(collection_name)
+
+    def advanced_query(self,collection_name:str,predicate:Callable[[dict],bool])->List[dict]:
+        """
+        returns all documents of the collection for which predicate returns True
+
+        Parameters
+        ----------
+        collection_name : str
+            name of the collection.
+        predicate : Callable[[dict],bool]
+            function which is called with each document.
+
+        Returns
+        -------
+        List[dict]
+            documents for which predicate is True.
+
+        """
+        docs = self.db[collection_name].values()
+        return [deepcopy(doc) for doc in docs if predicate(doc)]
+
+class MemoryCollection(abstract.DatabaseCollection):
+    """
+    collection of the in-memory database. dbColInst is dict of _key to document.
+    """
+    def __init__(self,name:str,dbInst:dict,dbColInst:dict):
+        super().__init__(name,dbInst,dbColInst)
+        self.hash_indexes = {}
+        self.sorted_indexes = {}
+        keys = [int(key) for key in dbColInst.keys() if key.isdigit()]
+        self._next_key = max(keys,default=0)+1
+
+    def create_hash_index(self,path:str):
+        """
+        creates hash index on the field path which is used for equality filters
+        """
+        index = {}
+        for key,doc in self.dbColInst.items():
+            val = _get_path(doc,path)
+            if val is not _MISSING:
+                index.setdefault(_hashable(val),{})[key] = None
+        self.hash_indexes[path] = index
+
+    def create_sorted_index(self,path:str):
+        """
+        creates sorted index on the numeric field path which is used for range filters
+        """
+        entries = []
+        for key,doc in self.dbColInst.items():
+            val = _get_path(doc,path)
+            if _is_number(val): entries.append((val,key))
+        entries.sort()
+        self.sorted_indexes[path] = ([val for val,_ in entries],[key for _,key in entries])
+
+    def _index_doc(self,key:str,doc:dict):
+        """adds document to all indexes"""
+        for path,index in self.hash_indexes.items():
+            val = _get_path(doc,path)
+            if val is not _MISSING:
+                index.setdefault(_hashable(val),{})[key] = None
+        for path,(values,keys) in self.sorted_indexes.items():
+            val = _get_path(doc,path)
+            if _is_number(val):
+                i = bisect_right(values,val)
+                values.insert(i,val)
+                keys.insert(i,key)
+
+    def _unindex_doc(self,key:str,doc:dict):
+        """removes document from all indexes"""
+        for path,index in self.hash_indexes.items():
+            val = _get_path(doc,path)
+            if val is not _MISSING:
+                bucket = index.get(_hashable(val),{})
+                bucket.pop(key,None)
+                if len(bucket)==0: index.pop(_hashable(val),None)
+        for path,(values,keys) in self.sorted_indexes.items():
+            val = _get_path(doc,path)
+            if _is_number(val):
+                i = bisect_left(values,val)
+                while keys[i] != key: i+=1
+                del values[i]
+                del keys[i]
+
+    def _candidate_keys(self,filters:List[tuple],used_indexes:list=None)->list:
+        """
+        uses hash and sorted indexes to narrow down keys of documents which can match the
+        filters. Without usable index all keys are returned. Names of the used indexes are 
+        appended to used_indexes if given.
+        """
+        candidates = None
+        for path,operator,val in filters:
+            index = "primary" if path in ("_key","_id") else path
+            vals = val if operator == "in" else [val]
+            if operator == "or":
+                #candidates of the disjunction are the union of candidates of its branches
+                keys = list(dict.fromkeys(key for branch in val for key in self._candidate_keys(branch,used_indexes)))
+                index = None
+            elif path == "_key" and operator in ("eq","in"):
+                keys = list(dict.fromkeys(key for key in vals if key in self.dbColInst))
+            elif path == "_id" and operator in ("eq","in"):
+                ids = set(vals)
+                keys = list(dict.fromkeys(str(docid).split("/")[-1] for docid in vals))
+                keys = [key for key in keys if key in self.dbColInst and self.dbColInst[key]["_id"] in ids]
+            elif path in self.hash_indexes and operator in ("eq","in"):
+                hash_index = self.hash_indexes[path]
+                keys = list(dict.fromkeys(key for item in vals for key in hash_index.get(_hashable(item),{})))
+            elif path in self.sorted_indexes and operator != "eq" and _is_number(val):
+                values,index_keys = self.sorted_indexes[path]
+                if operator in ("gt","ge"):
+                    start = bisect_right(values,val) if operator == "gt" else bisect_left(values,val)
+                    keys = index_keys[start:]
+                else:
+                    end = bisect_left(values,val) if operator == "lt" else bisect_right(values,val)
+                    keys = index_keys[:end]
+            else:
+                continue
+            if used_indexes is not None and index is not None and index not in used_indexes: used_indexes.append(index)
+            if candidates is None:
+                candidates = keys
+            else:
+                keys = set(keys)
+                candidates = [key for key in candidates if key in keys]
+        return list(self.dbColInst.keys()) if candidates is None else candidates
+
+    def _match_keys(self,filters:List[tuple])->List[str]:
+        """returns keys of documents matching all filters"""
+        keys = self._candidate_keys(filters)
+        return [key for key in keys if _matches(self.dbColInst[key],filters)]
+
+    def _new_key(self)->str:
+        """next numeric _key which is not in use"""
+        while str(self._next_key) in self.dbColInst: self._next_key += 1
+        return str(self._next_key)
+
+    def insert(self,doc:dict,*args,**kwargs)->(str,str):
+        """
+        create a new document
+        """
+        doc = deepcopy(doc)
+        if doc.get("_key") is None:
+            doc["_key"] = self._new_key() if doc.get("_id") is None else str(doc["_id"]).split("/")[-1]
+        key = doc["_key"]
+        if key in self.dbColInst:
+            raise ValueError(f"document with _key {key} already exists in collection {self.name}")
+        #generated keys continue after explicit numeric keys e.g. of restored documents
+        if str(key).isdigit(): self._next_key = max(self._next_key,int(key)+1)
+        doc["_id"] = f"{self.name}/{key}"
+        self.dbColInst[key] = doc
+        self._index_doc(key,doc)
+        return doc["_id"],key
+
+    def update(self,doc:dict,*args,**kwargs)->(str,str):
+        """
+        update existing document. Fields in doc are replaced in the stored document
+        """
+        key = doc.get("_key")
+        if key is None and doc.get("_id") is not None:
+            key = str(doc["_id"]).split("/")[-1]
+        if key not in self.dbColInst:
+            raise ValueError(f"document with _key {key} does not exist in collection {self.name}")
+        stored = self.dbColInst[key]
+        self._unindex_doc(key,stored)
+        stored.update(deepcopy(doc))
+        stored["_key"] = key
+        stored["_id"] = f"{self.name}/{key}"
+        self._index_doc(key,stored)
+        return stored["_id"],key
+
+    def update_versioned(self,docs:List[dict],keyname:str="_id",*args,**kwargs)->List[tuple]:
+        """
+        update documents whose stored version is one less than version of the document, None for others.
+        Fields with None value are removed from the stored document.
+        """
+        out = []
+        for doc in docs:
+            keys = self._match_keys([(keyname,"eq",doc.get(keyname)),("version","eq",doc["version"]-1)])
+            if len(keys) == 0:
+                out.append(None)
+                continue
+            key = keys[0]
+            stored = self.dbColInst[key]
+            self._unindex_doc(key,stored)
+            for name,val in doc.items():
+                if name in ("_id","_key"): continue
+                if val is None:
+                    stored.pop(name,None)
+                else:
+                    stored[name] = deepcopy(val)
+            self._index_doc(key,stored)
+            out.append((stored["_id"],key))
+        return out
+
+    def upsert_many(self,docs:List[dict],keyname:str,now:str,*args,**kwargs)->List[tuple]:
+        """
+        insert documents or update stored documents with same value of keyname
+        """
+        out = []
+        for doc in docs:
+            keys = self._match_keys([(keyname,"eq",doc.get(keyname))])
+            if len(keys) == 0:
+                key = self.insert(dict(doc,created_on=now))[1]
+                stored = self.dbColInst[key]
+            else:
+                key = keys[0]
+                stored = self.dbColInst[key]
+                self._unindex_doc(key,stored)
+                for name,val in doc.items():
+                    if name not in abstract._UPSERT_PROTECTED_FIELDS: stored[name] = deepcopy(val)
+                stored["version"] = stored.get("version",0)+1
+                stored["revised_on"] = now
+                self._index_doc(key,stored)
+            out.append((stored["_id"],key,stored.get("version"),stored.get("created_on"),stored.get("revised_on")))
+        return out
+
+    def delete(self,docID:str,*args,**kwargs):
+        """
+        Delete document using docID
+        """
+        key = docID.split("/")[-1]
+        doc = self.dbColInst.pop(key)
+        self._unindex_doc(key,doc)
+        return True
+
+    def find(self,criteria:dict,*args,**kwargs)->List[dict]:
+        """
+        find doc with specific criteria
+        """
+        return self.range_query([(path,"eq",val) for path,val in criteria.items()])
+
+    def range_query(self,filters:List[tuple],*args,**kwargs)->List[dict]:
+        """
+        find documents matching (field path, operator, value) filters
+        """
+        return [deepcopy(self.dbColInst[key]) for key in self._match_keys(filters)]
+
+    def explain(self,filters:List[tuple],profile:bool=False)->dict:
+        """
+        query plan of the filters. Estimated rows are the candidates left after index lookups which 
+        are all scanned. Documents are copied from memory so there is no network time and decode is the copy.
+        """
+        indexes = []
+        keys = self._candidate_keys(filters,indexes)
+        plan = {"query":_describe(filters),
+                "indexes":indexes,"full_scan":len(indexes)==0,"estimated_rows":len(keys)}
+        if not profile: return plan
+        start = time.perf_counter()
+        keys = self._match_keys(filters)
+        server = time.perf_counter()-start
+        start = time.perf_counter()
+        plan["docs"] = [deepcopy(self.dbColInst[key]) for key in keys]
+        plan.update({"rows_scanned":plan["estimated_rows"],"rows_returned":len(keys),
+                     "timing":{"server":server,"network":0.,"decode":time.perf_counter()-start}})
+        return plan
+
+    def _ndocs(self):
+        """number of documents"""
+        return len(self.dbColInst)
+
+    def has_doc(self,docID:str)->bool:
+        """
+        Check if document with given docID exist or not.
+        """
+        return len(self._candidate_keys([("_id","eq",docID)]))>0
+
+    def has_doc_with_key(self,keyname:str,keyval:Union[str,int,bool,float])->bool:
+        """
+        checks if document with given key exist.
+        """
+        return len(self._match_keys([(keyname,"eq",keyval)]))>0
+
+    def get_all_ids(self)->List[str]:
+        """get list of all document ids"""
+        return [doc["_id"] for doc in self.dbColInst.values()]
+
+    def get_all_keys(self)->List[str]:
+        """returns _keys for all document"""
+        return list(self.dbColInst.keys())
+
+    def get_page(self,after_key:str=None,limit:int=1000)->List[dict]:
+        """
+        returns at most limit documents with _key greater than after_key in _key order
+        """
+        keys = self.dbColInst.keys() if after_key is None else (key for key in self.dbColInst.keys() if key > after_key)
+        return [deepcopy(self.dbColInst[key]) for key in heapq.nsmallest(limit,keys)]
+
+    def find_sorted(self,filters:List[tuple],path:str,limit:int=1000)->List[dict]:
+        """
+        returns at most limit documents matching the filters sorted on the field path
+        """
+        values = ((_get_path(self.dbColInst[key],path),key) for key in self._match_keys(filters))
+        values = [(val,key) for val,key in values if val is not _MISSING]
+        return [deepcopy(self.dbColInst[key]) for val,key in heapq.nsmallest(limit,values)]
+
+    def join(self,filters:List[tuple],joins:List[tuple])->List[dict]:
+        """
+        hash join on the referenced _id. Keys of referenced documents matching the join filters
+        are collected once per join using the indexes of the referenced collection.
+        """
+        matching = [None if len(join_filters)==0 else set(coll._match_keys(join_filters))
+                    for _,coll,join_filters in joins]
+        rows = []
+        for key in self._match_keys(filters):
+            doc = self.dbColInst[key]
+            row = {"doc":deepcopy(doc)}
+            for (field,coll,_),keys in zip(joins,matching):
+                reference = _get_path(doc,field+"._id")
+                ref_keys = [] if not isinstance(reference,str) else coll._candidate_keys([("_id","eq",reference)])
+                if keys is not None: ref_keys = [ref_key for ref_key in ref_keys if ref_key in keys]
+                if keys is not None and len(ref_keys)==0: break
+                row[field] = deepcopy(coll.dbColInst[ref_keys[0]]) if len(ref_keys)>0 else None
+            else:
+                rows.append(row)
+        return rows
+
+    def traverse(self,start_id:str,depth:int,direction:str,doc_types:List[str]=None)->List[tuple]:
+        """breadth first traversal of this edge collection using the hash indexes on _from and _to"""
+        def find_edges(field,ids):
+            for vertex_id in ids:
+                for key in self._candidate_keys([(field,"eq",vertex_id)]):
+                    yield self.dbColInst[key]
+        return graph.traverse_levels(find_edges,start_id,depth,direction,doc_types)
+
+    def get_random_doc(self,*args,**kwargs)->dict:
+        """returns random document from the collection"""
+        if len(self.dbColInst)==0: return None
+        return deepcopy(random.choice(list(self.dbColInst.values())))
+
+    def get_random_docs(self,n:int,filters:List[tuple]=[],seed:int=None,*args,**kwargs)->List[dict]:
+        """
+        returns n random documents matching the filters. With seed matching keys are
+        reservoir sampled in insertion order so that the sample is reproducible.
+        """
+        keys = self._match_keys(filters)
+        if seed is None:
+            keys = random.sample(keys,min(n,len(keys)))
+        else:
+            keys = abstract._reservoir_sample(keys,n,seed)
+        return [deepcopy(self.dbColInst[key]) for key in keys]
+
+    def get_doc(self,docID:str,*args,**kwargs)->dict:
+        """
+        get document with given _id
+        """
+        keys = self._candidate_keys([("_id","eq",docID)])
+        return deepcopy(self.dbColInst[keys[0]]) if len(keys)>0 else None
+
+    def get_many(self,docIDs:List[str])->List[dict]:
+        """
+        get multiple documents in the order of docIDs. Missing documents are skipped.
+        """
+        docs = [self.get_doc(docID) for docID in docIDs]
+        return [doc for doc in docs if doc is not None]
+
+    def get_many_with_key(self,keyname:str,keyvals:list)->List[dict]:
+        """
+        get documents whose key is one of the values using the hash index of the key if it exists
+        """
+        return [doc for keyval in keyvals for doc in self.range_query([(keyname,"eq",keyval)])]
+
+    def get_doc_with_key(self,keyname:str,keyval:Union[str,int,bool,float])->List[dict]:
+        """
+        Get documents with a key
+        """
+        return self.range_query([(keyname,"eq",keyval)])
+
+    def find_in_range_of_field(self,field:str,minval:Union[int,float],maxval:Union[int,float],is_field_physical_qty:bool,
+                               *args,**kwargs)->List[dict]:
+        """
+        find document that has a specific field in specified range
+        """
+        if is_field_physical_qty: field +=".value"
+        return self.range_query([(field,"ge",minval),(field,"le",maxval)])
+
+    def count(self,filters:List[tuple]=[])->int:
+        """
+        number of documents matching the filters
+        """
+        return len(self._match_keys(filters))
+
+    def distinct(self,path:str,filters:List[tuple]=[])->list:
+        """
+        distinct values of the field path in documents matching the filters
+        """
+        values = {}
+        for key in self._match_keys(filters):
+            val = _get_path(self.dbColInst[key],path)
+            val = None if val is _MISSING else val
+            values.setdefault(_hashable(val),val)
+        return list(values.values())
+
+    def aggregate(self,filters:List[tuple],group_by:List[str],metrics:List[tuple])->List[dict]:
+        """
+        groups documents matching filters and computes statistics of the metrics
+        """
+        groups = {}
+        for key in self._match_keys(filters):
+            doc = self.dbColInst[key]
+            group = [_get_path(doc,path) for path in group_by]
+            group = [None if val is _MISSING else val for val in group]
+            values = groups.setdefault(tuple(_hashable(val) for val in group),(group,[[] for _ in metrics]))[1]
+            for j,(value_path,unit_path,factors) in enumerate(metrics):
+                val = _get_path(doc,value_path)
+                if not _is_number(val): continue
+                if factors is not None:
+                    unit = _get_path(doc,unit_path)
+                    if unit not in factors: continue
+                    scale,offset = factors[unit]
+                    val = val*scale+offset
+                values[j].append(val)
+        rows = []
+        for group,values in groups.values():
+            row = {f"g{i}":val for i,val in enumerate(group)}
+            for j,vals in enumerate(values):
+                row.update({f"m{j}_mean":statistics.fmean(vals) if len(vals)>0 else None,
+                            f"m{j}_min":min(vals,default=None),f"m{j}_max":max(vals,default=None),
+                            f"m{j}_count":len(vals),f"m{j}_std":statistics.stdev(vals) if len(vals)>1 else None,
+                            f"m{j}_sum":sum(vals)})
+            rows.append(row)
+        return rows
+
+    def delete_all_docs(self,*args,**kwargs)->int:
+        """method to delete all documents from the collection"""
+        ndocs = len(self.dbColInst)
+        self.dbColInst.clear()
+        for path in list(self.hash_indexes.keys()): self.create_hash_index(path)
+        for path in list(self.sorted_indexes.keys()): self.create_sorted_index(path)
+        return ndocs
+
+    def update_where(self,filters:List[tuple],patch:dict,bump_version:bool=True,*args,**kwargs)->int:
+        """
+        update all documents matching the filters. Dotted paths of the patch are set on the stored document
+        and fields with None value removed. Returns number of updated documents.
+        """
+        keys = self._match_keys(filters)
+        for key in keys:
+            stored = self.dbColInst[key]
+            self._unindex_doc(key,stored)
+            for path,val in patch.items():
+                *parents,name = path.split(".")
+                node = stored
+                for parent in parents:
+                    node = node.get(parent) if isinstance(node,dict) else None
+                if not isinstance(node,dict): continue
+                if val is None:
+                    node.pop(name,None)
+                else:
+                    node[name] = deepcopy(val)
+            if bump_version: stored["version"] = (stored.get("version") or 0)+1
+            self._index_doc(key,stored)
+        return len(keys)
+
+    def delete_where(self,filters:List[tuple],*args,return_ids:bool=False,**kwargs)->Union[int,List[str]]:
+        """delete all documents matching the filters and return number of deleted documents or their _id"""
+        doc_ids = []
+        for key in self._match_keys(filters):
+            doc = self.dbColInst.pop(key)
+            self._unindex_doc(key,doc)
+            doc_ids.append(doc["_id"])
+        return doc_ids if return_ids else len(doc_ids)
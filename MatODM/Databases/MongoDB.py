@@ -1,153 +1,504 @@
 # -*- coding: utf-8 -*-
-from .abstract import Database, DatabaseCollection
+from typing import List, Union
+from .abstract import Database, DatabaseCollection, _reservoir_sample, _UPSERT_PROTECTED_FIELDS
+from . import changes, graph
 from warnings import warn
-import random 
+import time
 
 try:
-    from pymongo import MongoClient
+    from pymongo import MongoClient, UpdateOne, ASCENDING
+    from bson import ObjectId, CodecOptions, decode
+    from bson.raw_bson import RawBSONDocument
 except  ModuleNotFoundError:
-    raise warn("pymongo not installed. Access to mongoDB not possible")
-    
+    warn("pymongo not installed. Access to mongoDB not possible")
+
 __all__ = ["MongoDatabase"]
+
+#mongo query operators for the filter operators used in templates
+_MONGO_OPERATORS = {"eq":"$eq","lt":"$lt","le":"$lte","gt":"$gt","ge":"$gte","in":"$in"}
+
+def _prefix_filters(filters:list,prefix:str)->list:
+    """filters on the field paths below prefix"""
+    return [(None,operator,[_prefix_filters(branch,prefix) for branch in val]) if operator == "or" 
+            else (prefix+path,operator,val) for path,operator,val in filters]
+
 class MongoDatabase(Database):
     """
-    connection to the arangodb database
+    connection to the mongodb database. Documents are stored with arango like _id ("collection/key")
+    and _key so that documents and relational data are same for all database backends.
     """
     def _connect(self,username:str,password:str,*args,**kwargs):
-        client = MongoClient(self.url,username=username,password=password)
+        #number of documents fetched from the server per cursor batch
+        self.batch_size = kwargs.pop("batch_size",1000)
+        client = MongoClient(self.url,username=username,password=password,*args,**kwargs)
         self.client = client
         return client[self.dbname]
-    
-    def create_collection(self,collectionClass):
+
+    def create_collection(self,collection_name:str)->"MongoCollection":
         """
         Adds collection  to the database to retrive collection use get database after creating it
         """
-        self.db.create_collection(name=collectionClass.name)
+        self.db.create_collection(collection_name)
+        self.db[collection_name].create_index([("_key",ASCENDING)],unique=True,sparse=True)
+        self.db[collection_name].create_index([(changes.STAMP_FIELD,ASCENDING)],sparse=True)
+        self.collections[collection_name] = MongoCollection(collection_name,self.db,self.db[collection_name],
+                                                            self.batch_size)
+        return self.collections[collection_name]
 
-    def get_collection(self,collection_name):
-        """
-        Get a collection from the database using collection name
-        """
-        return MongoCollection(self.db,self.db[collection_name])
+    def _create_edge_collection(self,collection_name:str)->"MongoCollection":
+        """creates edge collection with indexes on _from, _to and their collections"""
+        coll = self.create_collection(collection_name)
+        for field in ("_from","_to","from_collection","to_collection"):
+            coll.dbColInst.create_index([(field,ASCENDING)])
+        return coll
+
+    def _create_chunk_collection(self,collection_name:str)->"MongoCollection":
+        """creates chunk collection with indexes on chunk_key, parent and collection"""
+        coll = self.create_collection(collection_name)
+        for field in ("chunk_key","parent","collection"):
+            coll.dbColInst.create_index([(field,ASCENDING)])
+        return coll
 
-    def del_collection(self,collection_name):
+    def _initalize_collections(self):
+        """Initializes collection in the database"""
+        for collection_name in self.db.list_collection_names():
+            if not collection_name.startswith("system."):
+                self.collections[collection_name] = MongoCollection(collection_name,self.db,self.db[collection_name],
+                                                                    self.batch_size)
+
+    def _del_collection_from_db(self,collection_name:str):
         """
         Delete the collection from the database
         """
-        self.db.delete_collection(collection_name)
+        self.db.drop_collection(collection_name)
 
-    def _get_collection_names(self):
-        """
-        Get list of all existing collections in the database
-        """
-        return self.db.list_collection_names()
-        
     def _delete_db(self):
         """Method to delete the database"""
         self.client.drop_database(self.dbname)
-            
-    def query(self, aql_query):
+
+    def advanced_query(self,collection_name:str,pipeline:list,*args,**kwargs)->list:
+        """
+        aggregation pipeline executed in mongodb
+
+        Parameters
+        ----------
+        collection_name : str
+            name of the collection on which the pipeline is executed.
+        pipeline : list
+            mongodb aggregation pipeline.
+
+        Returns
+        -------
+        list
+            documents returned by the pipeline.
+
+        """
+        return list(self.db[collection_name].aggregate(pipeline,batchSize=self.batch_size,*args,**kwargs))
+
+    def explain_query(self,collection_name:str,criteria:dict):
         """
-        Provides interface to AQL query for the ArangoDB database
+        provides mongodb execution plan for a find query.
         """
-        
+        return self.db[collection_name].find(criteria).explain()
+
 class MongoCollection(DatabaseCollection):
     """
-    A generic interface for arangodb collection
+    A generic interface for mongodb collection
     """
-        
-    def insert_document(self,doc:dict):
+    def __init__(self,name:str,dbInst,dbColInst,batch_size:int=1000):
+        super().__init__(name,dbInst,dbColInst)
+        self.batch_size = batch_size
+        self._unique_indexes = set()
+
+    def _new_ids(self,doc:dict)->dict:
+        """adds _key and _id ("collection/key") to the document if not already present"""
+        if doc.get("_key") is None:
+            doc["_key"] = str(ObjectId()) if doc.get("_id") is None else str(doc["_id"]).split("/")[-1]
+        doc["_id"] = f"{self.name}/{doc['_key']}"
+        return doc
+
+    def insert(self,doc:dict,*args,**kwargs):
         """
         create a new document
         """
-        self.dbColInst.insert_one(doc)
+        doc = self._new_ids(dict(doc))
+        self.dbColInst.insert_one(doc,*args,**kwargs)
+        return doc["_id"],doc["_key"]
 
-    def update_document(self,doc):
+    def insert_many(self,docs:List[dict],*args,**kwargs)->List[tuple]:
         """
-        update existing document
+        create new documents with a single unordered bulk insert
         """
-        self.update_document(doc)
+        docs = [self._new_ids(dict(doc)) for doc in docs]
+        if len(docs)>0:
+            self.dbColInst.insert_many(docs,ordered=False,*args,**kwargs)
+        return [(doc["_id"],doc["_key"]) for doc in docs]
 
-    def _get_name(self):
-        """method to get name of collection"""
-        return self.dbColInst.name
-        
-    def _get_db_name(self):
-        """Implements method to get database name"""
-        return self.dbColInst.fullname.split(".")[0]
-        
-    def get_document(self,key:str):
+    def update(self,doc:dict,*args,**kwargs):
         """
-        get document from the key
+        update existing document
         """
-        return self.dbColInst.find({"_key":key})
-    
-    def get_multiple_documents(self,keys:list,*args,**kwargs):
+        doc = self._new_ids(dict(doc))
+        self.dbColInst.update_one({"_id":doc["_id"]},{"$set":doc},*args,**kwargs)
+        return doc["_id"],doc["_key"]
+
+    def update_many(self,docs:List[dict],*args,**kwargs)->List[tuple]:
         """
-        get multiple documents from the collection usin list of keys 
+        update existing documents with a single unordered bulk_write
         """
-        out  = []
-        for key in keys:
-            out.append(self.get_document(key))
+        docs = [self._new_ids(dict(doc)) for doc in docs]
+        if len(docs)>0:
+            self.dbColInst.bulk_write([UpdateOne({"_id":doc["_id"]},{"$set":doc}) for doc in docs],
+                                      ordered=False,*args,**kwargs)
+        return [(doc["_id"],doc["_key"]) for doc in docs]
+
+    def update_versioned(self,docs:List[dict],keyname:str="_id",*args,**kwargs)->List[tuple]:
+        """
+        update documents with a single unordered bulk_write which filters on the stored version. Each write
+        sets a new arango like _rev and fields with None value are unset. If not all documents are matched
+        on _id, the updated documents are found by their _rev in one query.
+        """
+        if len(docs) == 0: return []
+        docs = [dict(doc,_rev=str(ObjectId())) for doc in docs]
+        requests = []
+        for doc in docs:
+            update = {"$set":{name:val for name,val in doc.items() if val is not None}}
+            removed = {name:"" for name,val in doc.items() if val is None}
+            if len(removed)>0: update["$unset"] = removed
+            requests.append(UpdateOne({keyname:doc.get(keyname),"version":doc["version"]-1},update))
+        result = self.dbColInst.bulk_write(requests,ordered=False,*args,**kwargs)
+        if keyname == "_id" and result.matched_count == len(docs):
+            return [(doc["_id"],doc.get("_key",doc["_id"].split("/")[-1])) for doc in docs]
+        updated = {}
+        criteria = {keyname:{"$in":[doc.get(keyname) for doc in docs]},"_rev":{"$in":[doc["_rev"] for doc in docs]}}
+        for stored in self.dbColInst.find(criteria,{"_id":1,"_key":1,"_rev":1},batch_size=self.batch_size):
+            updated[stored["_rev"]] = (stored["_id"],stored["_key"])
+        return [updated.get(doc["_rev"]) for doc in docs]
+
+    def _create_unique_index(self,path:str):
+        """creates unique index on the field path once, documents without the field are not indexed"""
+        if path in self._unique_indexes: return
+        self.dbColInst.create_index([(path,ASCENDING)],unique=True,sparse=True,name=f"{path}_unique")
+        self._unique_indexes.add(path)
+
+    def upsert_many(self,docs:List[dict],keyname:str,now:str,*args,**kwargs)->List[tuple]:
+        """
+        insert documents or update stored documents with same value of keyname with a single unordered
+        bulk_write of atomic pipeline upserts on a unique index of the key. A document without created_on
+        is being inserted: it gets _id, _key, created_on and version 0. Stored documents get the fields,
+        revised_on and their version incremented. Updated documents are read back in one query by the new
+        _rev set by the upsert.
+        """
+        if len(docs) == 0: return []
+        if keyname != "_key": self._create_unique_index(keyname)
+        docs = [dict(doc,_rev=str(ObjectId())) for doc in docs]
+        requests = []
+        for doc in docs:
+            if doc.get(keyname) is None:
+                raise ValueError(f"document without {keyname} can not be upserted")
+            #values are literals so that strings starting with $ are not read as field paths
+            fields = {name:{"$literal":val} for name,val in doc.items() if name not in _UPSERT_PROTECTED_FIELDS}
+            stored = {"$ifNull":["$created_on",False]}
+            new_doc = self._new_ids(dict(doc))
+            for name in ("_id","_key"):
+                if name != keyname: fields[name] = {"$cond":[stored,f"${name}",new_doc[name]]}
+            fields.update(_rev=doc["_rev"],version={"$add":[{"$ifNull":["$version",-1]},1]},
+                          revised_on={"$cond":[stored,now,None]},created_on={"$ifNull":["$created_on",now]})
+            requests.append(UpdateOne({keyname:doc[keyname]},[{"$set":fields}],upsert=True))
+        result = self.dbColInst.bulk_write(requests,ordered=False,*args,**kwargs)
+        out = [None]*len(docs)
+        for i,docid in result.upserted_ids.items():
+            out[i] = (docid,docid.split("/")[-1],0,now,None)
+        updated = [i for i,res in enumerate(out) if res is None]
+        if len(updated) == 0: return out
+        names = ("_id","_key","version","created_on","revised_on")
+        projection = {name:1 for name in names+("_rev",)}
+        stored = {}
+        for stored_doc in self.dbColInst.find({"_rev":{"$in":[docs[i]["_rev"] for i in updated]}},projection,
+                                              batch_size=self.batch_size):
+            stored[stored_doc["_rev"]] = tuple(stored_doc.get(name) for name in names)
+        for i in updated:
+            if docs[i]["_rev"] not in stored:
+                #changed again by another writer since the upsert
+                stored_doc = self.dbColInst.find_one({keyname:docs[i][keyname]},projection)
+                stored[docs[i]["_rev"]] = None if stored_doc is None else tuple(stored_doc.get(name) for name in names)
+            out[i] = stored[docs[i]["_rev"]]
         return out
-                
-    def delete_document(self,key:str):
+
+    def find(self,criteria:dict,projection:Union[list,dict]=None,*args,**kwargs)->List[dict]:
+        """
+        find doc with specific criteria
+        """
+        return list(self.dbColInst.find(criteria,projection,batch_size=self.batch_size,*args,**kwargs))
+
+    def range_query(self,filters:List[tuple],projection:Union[list,dict]=None,*args,**kwargs)->List[dict]:
+        """
+        find documents matching (field path, operator, value) filters
+        """
+        return self.find(self._compile_filters(filters),projection,*args,**kwargs)
+
+    def explain(self,filters:list,profile:bool=False)->dict:
+        """
+        query plan of the filters from mongodb explain command. With profile the server statistics are 
+        taken from explain with executionStats verbosity. Documents are fetched as raw BSON so that 
+        decoding is timed apart from the network.
+        """
+        criteria = self._compile_filters(filters)
+        verbosity = "executionStats" if profile else "queryPlanner"
+        explained = self.dbInst.command("explain",{"find":self.name,"filter":criteria},verbosity=verbosity)
+        winning_plan = explained["queryPlanner"]["winningPlan"]
+        stages = [winning_plan.get("queryPlan",winning_plan)]
+        indexes = []
+        full_scan = False
+        while len(stages)>0:
+            stage = stages.pop()
+            if stage.get("stage") == "COLLSCAN": full_scan = True
+            if "indexName" in stage and stage["indexName"] not in indexes: indexes.append(stage["indexName"])
+            stages += stage.get("inputStages",[]) + ([stage["inputStage"]] if "inputStage" in stage else [])
+        plan = {"query":criteria,"plan":explained["queryPlanner"],"indexes":indexes,"full_scan":full_scan,
+                "estimated_rows":None}
+        if not profile: return plan
+        stats = explained["executionStats"]
+        raw_coll = self.dbColInst.with_options(codec_options=CodecOptions(document_class=RawBSONDocument))
+        start = time.perf_counter()
+        raw_docs = list(raw_coll.find(criteria,batch_size=self.batch_size))
+        total = time.perf_counter()-start
+        start = time.perf_counter()
+        plan["docs"] = [decode(doc.raw) for doc in raw_docs]
+        decode_time = time.perf_counter()-start
+        server = stats["executionTimeMillis"]/1000
+        plan.update({"rows_scanned":stats["totalKeysExamined"]+stats["totalDocsExamined"],
+                     "rows_returned":len(raw_docs),
+                     "timing":{"server":server,"network":max(total-server,0.),"decode":decode_time}})
+        return plan
+
+    def has_doc(self,docID:str)->bool:
+        """
+        Check if document with given docID exist or not.
+        """
+        return self.dbColInst.count_documents({"_id":docID},limit=1) > 0
+
+    def has_doc_with_key(self,keyname:str,keyval:Union[str,int,bool,float])->bool:
+        """
+        checks if document with given key exist.
         """
-        delete document from collection using a key        
+        return self.dbColInst.find_one({keyname:keyval},projection={"_id":True}) is not None
+
+    def get_all_ids(self)->List[str]:
+        """get list of all document ids"""
+        cursor = self.dbColInst.find({},projection={"_id":True},batch_size=self.batch_size)
+        return [doc["_id"] for doc in cursor]
+
+    def get_all_keys(self)->List[str]:
+        """
+        Get all keys of all documents in the collection
+        """
+        cursor = self.dbColInst.find({},projection={"_key":True,"_id":False},batch_size=self.batch_size)
+        return [doc["_key"] for doc in cursor]
+
+    def get_page(self,after_key:str=None,limit:int=1000)->List[dict]:
+        """
+        returns at most limit documents with _key greater than after_key in _key order
+        """
+        criteria = {} if after_key is None else {"_key":{"$gt":after_key}}
+        return list(self.dbColInst.find(criteria,batch_size=self.batch_size).sort("_key",ASCENDING).limit(limit))
+
+    def find_sorted(self,filters:list,path:str,limit:int=1000)->List[dict]:
+        """
+        returns at most limit documents matching the filters sorted on the field path
         """
-        self.dbColInst.delete_one({"_key":key})
-    
-    def delete_multiple_documents(self,keys:list):
+        cursor = self.dbColInst.find(self._compile_filters(filters),batch_size=self.batch_size)
+        return list(cursor.sort(path,ASCENDING).limit(limit))
+
+    def join(self,filters:list,joins:List[tuple])->List[dict]:
+        """
+        compiles the joins into one aggregation pipeline with a $lookup on the referenced _id and
+        $unwind per relational field. Filters of a join are matched right after its $unwind.
+        """
+        pipeline = [{"$match":self._compile_filters(filters)}]
+        for i,(field,coll,join_filters) in enumerate(joins):
+            joined = f"ODM_join_{i}"
+            pipeline += [{"$lookup":{"from":coll.dbColInst.name,"localField":field+"._id","foreignField":"_id","as":joined}},
+                         {"$unwind":{"path":"$"+joined,"preserveNullAndEmptyArrays":len(join_filters)==0}}]
+            if len(join_filters) > 0:
+                pipeline.append({"$match":self._compile_filters(_prefix_filters(join_filters,joined+"."))})
+        rows = []
+        for doc in self.dbColInst.aggregate(pipeline,batchSize=self.batch_size):
+            row = {"doc":doc}
+            for i,(field,_,_) in enumerate(joins):
+                row[field] = doc.pop(f"ODM_join_{i}",None)
+            rows.append(row)
+        return rows
+
+    def traverse(self,start_id:str,depth:int,direction:str,doc_types:List[str]=None)->List[tuple]:
+        """
+        outbound and inbound traversals are one aggregation of the edges of start with $graphLookup for 
+        the deeper levels. Traversal in any direction follows both fields and runs one $in query per level.
+        """
+        if direction == "any":
+            find_edges = lambda field,ids: self.dbColInst.find({field:{"$in":list(ids)}},batch_size=self.batch_size)
+            return graph.traverse_levels(find_edges,start_id,depth,direction,doc_types)
+        source,target,type_field = graph.edge_steps(direction)[0]
+        pipeline = [{"$match":{source:start_id}}]
+        if depth > 1:
+            pipeline.append({"$graphLookup":{"from":self.dbColInst.name,"startWith":"$"+target,"connectFromField":target,
+                                             "connectToField":source,"as":"ODM_path","maxDepth":depth-2,
+                                             "depthField":"ODM_depth"}})
+        rows = []
+        for edge in self.dbColInst.aggregate(pipeline,batchSize=self.batch_size):
+            rows.append((edge[target],edge[type_field],1))
+            rows += [(path_edge[target],path_edge[type_field],path_edge["ODM_depth"]+2) for path_edge in edge.get("ODM_path",[])]
+        return graph.shortest_depths(start_id,rows,doc_types)
+
+    def get_random_doc(self):
+        """gets random document form database"""
+        return next(self.dbColInst.aggregate([{"$sample":{"size":1}}]),None)
+
+    def get_random_docs(self,n:int,filters:list=[],seed:int=None,*args,**kwargs)->list:
+        """
+        returns n random documents using $sample. With seed the _id index is streamed in order
+        and reservoir sampled so that the sample is reproducible.
+        """
+        criteria = self._compile_filters(filters)
+        if seed is None:
+            pipeline = [{"$match":criteria},{"$sample":{"size":n}}]
+            return list(self.dbColInst.aggregate(pipeline,*args,**kwargs))
+        ids = (doc["_id"] for doc in self.dbColInst.find(criteria,projection={"_id":True},
+                                                         batch_size=self.batch_size).sort("_id",1))
+        ids = _reservoir_sample(ids,n,seed)
+        docs = {doc["_id"]:doc for doc in self.dbColInst.find({"_id":{"$in":ids}})}
+        return [docs[_id] for _id in ids if _id in docs]
+
+    def get_doc(self,docID:str,projection:Union[list,dict]=None,*args,**kwargs)->dict:
+        """
+        get document with given _id
+        """
+        return self.dbColInst.find_one({"_id":docID},projection,*args,**kwargs)
+
+    def get_many(self,docIDs:List[str],projection:Union[list,dict]=None)->List[dict]:
         """
-        delete multiple documents from collection using a key
+        get multiple documents using $in queries of at most batch_size ids. Documents are
+        returned in the order of docIDs and missing documents are skipped.
         """
-        for key in keys:
-            self.delete_document(key)
-    
-    def delete_documents_by_filtering(self,criteria):
-        self.dbColInst.delete_many(criteria)
-           
+        docs = {}
+        for i in range(0,len(docIDs),self.batch_size):
+            chunk = docIDs[i:i+self.batch_size]
+            for doc in self.dbColInst.find({"_id":{"$in":chunk}},projection,batch_size=self.batch_size):
+                docs[doc["_id"]] = doc
+        return [docs[docID] for docID in docIDs if docID in docs]
+
+    def get_many_with_key(self,keyname:str,keyvals:list)->List[dict]:
+        """
+        get documents whose key is one of the values using $in queries of at most batch_size values
+        """
+        docs = []
+        for i in range(0,len(keyvals),self.batch_size):
+            docs += self.dbColInst.find({keyname:{"$in":list(keyvals[i:i+self.batch_size])}},batch_size=self.batch_size)
+        return docs
+
+    def get_doc_with_key(self,keyname:str,keyval:Union[str,int,bool,float])->List[dict]:
+        """
+        Get document with a key
+        """
+        return self.find({keyname:keyval})
+
+    def delete(self,docID:str,*args,**kwargs):
+        """
+        delete document using docID
+        """
+        return self.dbColInst.delete_one({"_id":docID},*args,**kwargs).deleted_count
+
     def _ndocs(self):
         """
         here is the method to compute number of documents implemented
         """
         return self.dbColInst.estimated_document_count()
 
-    def replace_docs(self,criteria:dict,new_fields:dict):
+    def find_in_range_of_field(self,field:str,minval:Union[int,float],maxval:Union[int,float],is_field_physical_qty:bool,
+                               *args,**kwargs)->List[dict]:
         """
-        replace a field in documents with new_fields which match the criteria
+        find document that has a specific field in specified range
         """
-        self.dbColInst.update_many(criteria, new_fields)
-     
-    def replace_docs_using_key(self,key,new_fields:dict):
+        if is_field_physical_qty: field +=".value"
+        return self.find({field:{"$gte":minval,"$lte":maxval}},*args,**kwargs)
+
+    def distinct(self,path:str,filters:list=[])->list:
         """
-        replace a field in documents with new_fields using a key
+        distinct values of the field path in documents matching the filters
         """
-        self.dbColInst.update_one({'_key': key}, new_fields)
+        return self.dbColInst.distinct(path,self._compile_filters(filters))
 
-    def find_docs(self,criteria,skip,limit):
+    def count(self,filters:list=[])->int:
         """
-        find a documents using a specific criteria
+        number of documents matching the filters, counted with count_documents
         """
-        self.dbColInst.find(criteria,skip=skip,limit=limit)
-        
+        return self.dbColInst.count_documents(self._compile_filters(filters))
 
-    def has_doc(self,doc_key:str):
-        """
-        Method to check if document with given key exists in the collection or not
+    def aggregate(self,filters:list,group_by:List[str],metrics:List[tuple])->List[dict]:
+        """
+        compiles grouping and statistics into $match, $project and $group pipeline. Unit conversion
+        factors are applied in the $project stage with $switch on the unit.
+        """
+        project = {f"g{i}":"$"+path for i,path in enumerate(group_by)}
+        group = {"_id":{f"g{i}":f"$g{i}" for i in range(len(group_by))} or None}
+        for j,(value_path,unit_path,factors) in enumerate(metrics):
+            value = "$"+value_path
+            if factors is None:
+                converted = value
+            elif len(factors)==0:
+                converted = None
+            else:
+                branches = [{"case":{"$eq":["$"+unit_path,unit]},"then":{"$add":[{"$multiply":[value,scale]},offset]}}
+                            for unit,(scale,offset) in factors.items()]
+                converted = {"$switch":{"branches":branches,"default":None}}
+            project[f"m{j}"] = {"$cond":[{"$isNumber":value},converted,None]}
+            group.update({f"m{j}_mean":{"$avg":f"$m{j}"},f"m{j}_min":{"$min":f"$m{j}"},f"m{j}_max":{"$max":f"$m{j}"},
+                          f"m{j}_count":{"$sum":{"$cond":[{"$eq":[f"$m{j}",None]},0,1]}},
+                          f"m{j}_std":{"$stdDevSamp":f"$m{j}"},f"m{j}_sum":{"$sum":f"$m{j}"}})
+        pipeline = [{"$match":self._compile_filters(filters)},{"$project":project},{"$group":group}]
+        rows = []
+        for row in self.dbColInst.aggregate(pipeline,batchSize=self.batch_size):
+            row.update(row.pop("_id") or {})
+            rows.append(row)
+        return rows
+
+    def delete_all_docs(self,*args,**kwargs):
+        """method to delete all documents from the collection in a single server side operation"""
+        return self.dbColInst.delete_many({},*args,**kwargs).deleted_count
+
+    def update_where(self,filters:list,patch:dict,bump_version:bool=True,*args,**kwargs)->int:
         """
-        return self.dbColInst.count_documents({"_key":doc_key}) > 0
-    
-    def get_all_keys(self):
-        
+        update all documents matching the filters with a single update_many. Dotted paths of the patch 
+        are set with $set and fields with None value removed with $unset.
         """
-        Get all keys of all documents in the collection
-        """
-        docs = self.dbColInst.find({},projection={"_key":True,"_id":False})
-        keys = [doc["_key"] for doc in docs]
-        return keys
-    
-    def get_random_doc(self):
-        """gets random document form database"""
-        return self.get_document(random.choice(self.get_all_keys()))
+        update = {"$set":{path:val for path,val in patch.items() if val is not None}}
+        removed = {path:"" for path,val in patch.items() if val is None}
+        if len(removed)>0: update["$unset"] = removed
+        if bump_version: update["$inc"] = {"version":1}
+        if len(update["$set"])==0: update.pop("$set")
+        return self.dbColInst.update_many(self._compile_filters(filters),update,*args,**kwargs).modified_count
+
+    def delete_where(self,filters:list,*args,return_ids:bool=False,**kwargs)->Union[int,List[str]]:
+        """
+        delete all documents matching (field path, operator, value) filters and return number of deleted documents.
+        With return_ids the _id of matching documents are read first and exactly those documents are deleted
+        in batches, so that documents inserted in the meantime are not deleted.
+        """
+        if not return_ids:
+            return self.dbColInst.delete_many(self._compile_filters(filters),*args,**kwargs).deleted_count
+        doc_ids = [doc["_id"] for doc in self.dbColInst.find(self._compile_filters(filters),{"_id":1},
+                                                             batch_size=self.batch_size)]
+        for i in range(0,len(doc_ids),self.batch_size):
+            self.dbColInst.delete_many({"_id":{"$in":doc_ids[i:i+self.batch_size]}},*args,**kwargs)
+        return doc_ids
 
+    @staticmethod
+    def _compile_filters(filters:list)->dict:
+        """compiles (field path, operator, value) filters into mongo query document"""
+        criteria = {}
+        for path,operator,val in filters:
+            if operator == "or":
+                criteria.setdefault("$and",[]).append({"$or":[MongoCollection._compile_filters(branch) for branch in val]})
+            else:
+                criteria.setdefault(path,{})[_MONGO_OPERATORS[operator]] = val
+        return criteria
@@ -0,0 +1,575 @@
+# -*- coding: utf-8 -*-
+from typing import List, Union
+import sqlite3
+import json
+import math
+import os
+import re
+import time
+import uuid
+from . import abstract, changes, graph
+
+__all__ = ["SqliteDatabase"]
+
+#SQL comparison operators for the filter operators used in templates
+_SQL_OPERATORS = {"eq":"=","lt":"<","le":"<=","gt":">","ge":">="}
+#maximum number of bound variables used in a single IN (...) statement
+_MAX_VARS = 500
+
+def _quote(name:str)->str:
+    """quotes SQL identifier"""
+    return '"' + name.replace('"','""') + '"'
+
+def _json_path(path:str)->str:
+    """SQL string literal of the JSON path for the dotted field path"""
+    json_path = "$." + ".".join('"' + name + '"' for name in path.split("."))
+    return "'" + json_path.replace("'","''") + "'"
+
+def _json_path_expr(path:str,column:str="doc")->str:
+    """
+    json_extract expression for the dotted field path. Expression indexes and queries use this
+    same text so that sqlite can use the index.
+    """
+    return f"json_extract({column},{_json_path(path)})"
+
+def _sql_value(val):
+    """converts python value to value comparable with output of json_extract"""
+    if isinstance(val,bool):
+        return int(val)
+    if isinstance(val,(dict,list)):
+        return json.dumps(val,separators=(",",":"))
+    return val
+
+class SqliteDatabase(abstract.Database):
+    """
+    Embedded file based database on sqlite. Every collection is a table with _key and JSON
+    document columns. Declared fields are indexed with json_extract expression indexes. File
+    databases use WAL journal so that readers are not blocked by writer.
+
+    url is the directory in which <dbname>.sqlite is stored or ":memory:".
+    """
+    _parallel_io = False
+    def __init__(self,dbname:str,url:str=".",*args,**kwargs):
+        super().__init__(dbname,url,*args,**kwargs)
+
+    def _connect(self,username:str,password:str,*args,**kwargs):
+        path = self.url if self.url == ":memory:" else os.path.join(self.url,self.dbname+".sqlite")
+        db = sqlite3.connect(path,check_same_thread=False,*args,**kwargs)
+        if self.url != ":memory:":
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def create_collection(self,collection_name:str,indexes:List[str]=[])->"SqliteCollection":
+        """
+        Adds collection  to the database
+
+        Parameters
+        ----------
+        collection_name : str
+            name of the collection.
+        indexes : List[str], optional
+            field paths with expression index e.g. "name" or "strength.value". The default is [].
+
+        Returns
+        -------
+        SqliteCollection
+        """
+        with self.db:
+            self.db.execute(f"CREATE TABLE {_quote(collection_name)} (_key TEXT PRIMARY KEY, doc TEXT NOT NULL)")
+        self.collections[collection_name] = SqliteCollection(collection_name,self.db,collection_name)
+        for path in [changes.STAMP_FIELD]+indexes: self.collections[collection_name].create_index(path)
+        return self.collections[collection_name]
+
+    def _create_edge_collection(self,collection_name:str)->"SqliteCollection":
+        """creates edge collection with expression indexes on _from, _to and their collections"""
+        return self.create_collection(collection_name,indexes=["_from","_to","from_collection","to_collection"])
+
+    def _create_chunk_collection(self,collection_name:str)->"SqliteCollection":
+        """creates chunk collection with expression indexes on chunk_key, parent and collection"""
+        return self.create_collection(collection_name,indexes=["chunk_key","parent","collection"])
+
+    def _initalize_collections(self):
+        """Initializes collection in the database"""
+        cursor = self.db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
+        for (collection_name,) in cursor.fetchall():
+            self.collections[collection_name] = SqliteCollection(collection_name,self.db,collection_name)
+
+    def _del_collection_from_db(self,collection_name:str):
+        """
+        Delete the collection from the database
+        """
+        with self.db:
+            self.db.execute(f"DROP TABLE {_quote(collection_name)}")
+
+    def advanced_query(self,query:str,parameters:Union[tuple,dict]=())->list:
+        """
+        SQL query executed in sqlite
+
+        Parameters
+        ----------
+        query : str
+            SQL query. Documents are in doc column of the collection tables.
+        parameters : Union[tuple,dict], optional
+            parameters of the query. The default is ().
+
+        Returns
+        -------
+        list
+            rows returned by the query.
+
+        """
+        return self.db.execute(query,parameters).fetchall()
+
+    def explain_query(self,query:str,parameters:Union[tuple,dict]=())->list:
+        """
+        provides sqlite query plan for SQL query.
+        """
+        return self.db.execute("EXPLAIN QUERY PLAN "+query,parameters).fetchall()
+
+class SqliteCollection(abstract.DatabaseCollection):
+    """
+    collection of the sqlite database. dbInst is the sqlite connection and dbColInst the table name.
+    """
+    @property
+    def _table(self)->str:
+        return _quote(self.dbColInst)
+
+    def create_index(self,path:str,unique:bool=False):
+        """
+        creates json_extract expression index on the field path. Unique indexes allow any number of
+        documents without the field.
+        """
+        index_name = _quote(f"{'uidx' if unique else 'idx'}_{self.dbColInst}_{path}")
+        try:
+            with self.dbInst:
+                self.dbInst.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {index_name} "
+                                    f"ON {self._table}({_json_path_expr(path)})")
+        except sqlite3.IntegrityError:
+            raise ValueError(f"unique index on {path} can not be created, collection {self.name} has duplicates")
+
+    @staticmethod
+    def _compile_filters(filters:List[tuple],alias:str=None,keyword:str="WHERE")->(str,list):
+        """
+        compiles (field path, operator, value) filters into SQL WHERE statement. With alias columns
+        of the table alias are used and keyword is the statement the conditions follow, e.g. AND.
+
+        Returns
+        -------
+        (str,list)
+            WHERE statement and its parameters.
+        """
+        if len(filters) == 0:
+            return "", []
+        conditions = []
+        parameters = []
+        for path,operator,val in filters:
+            prefix = "" if alias is None else alias+"."
+            if operator == "or":
+                branches = []
+                for branch in val:
+                    branch_conditions, branch_parameters = SqliteCollection._compile_filters(branch,alias,"")
+                    branches.append(f"({branch_conditions.strip()})")
+                    parameters += branch_parameters
+                conditions.append(f"({' OR '.join(branches)})")
+                continue
+            expr = prefix+"_key" if path == "_key" else _json_path_expr(path,prefix+"doc")
+            if val is None and operator == "eq":
+                conditions.append(f"{expr} IS NULL")
+            elif operator == "in":
+                conditions.append(f"{expr} IN ({','.join('?'*len(val))})")
+                parameters += [_sql_value(item) for item in val]
+            else:
+                conditions.append(f"{expr} {_SQL_OPERATORS[operator]} ?")
+                parameters.append(_sql_value(val))
+        return keyword + " " + " AND ".join(conditions), parameters
+
+    def _select(self,filters:List[tuple],column:str="doc",suffix:str="",parameters:list=[])->sqlite3.Cursor:
+        """executes select on the collection table with the filters"""
+        where, where_parameters = self._compile_filters(filters)
+        return self.dbInst.execute(f"SELECT {column} FROM {self._table} {where} {suffix}",where_parameters+parameters)
+
+    def _key_from_id(self,docID:str)->str:
+        """returns _key if the docID belongs to this collection else None"""
+        collection_name,_,key = docID.rpartition("/")
+        return key if collection_name == self.name else None
+
+    def _new_ids(self,doc:dict)->dict:
+        """adds _key and _id ("collection/key") to the document if not already present"""
+        if doc.get("_key") is None:
+            doc["_key"] = uuid.uuid4().hex if doc.get("_id") is None else str(doc["_id"]).split("/")[-1]
+        doc["_id"] = f"{self.name}/{doc['_key']}"
+        return doc
+
+    def insert(self,doc:dict,*args,**kwargs)->(str,str):
+        """
+        create a new document
+        """
+        return self.insert_many([doc])[0]
+
+    def insert_many(self,docs:List[dict],*args,**kwargs)->List[tuple]:
+        """
+        create new documents in a single transaction
+        """
+        docs = [self._new_ids(dict(doc)) for doc in docs]
+        with self.dbInst:
+            self.dbInst.executemany(f"INSERT INTO {self._table} (_key,doc) VALUES (?,?)",
+                                    ((doc["_key"],json.dumps(doc)) for doc in docs))
+        return [(doc["_id"],doc["_key"]) for doc in docs]
+
+    def update(self,doc:dict,*args,**kwargs)->(str,str):
+        """
+        update existing document. Fields in doc are merged into the stored document
+        """
+        return self.update_many([doc])[0]
+
+    def update_many(self,docs:List[dict],*args,**kwargs)->List[tuple]:
+        """
+        update existing documents in a single transaction using json_patch
+        """
+        docs = [self._new_ids(dict(doc)) for doc in docs]
+        with self.dbInst:
+            for doc in docs:
+                cursor = self.dbInst.execute(f"UPDATE {self._table} SET doc = json_patch(doc,?) WHERE _key = ?",
+                                             (json.dumps(doc),doc["_key"]))
+                if cursor.rowcount == 0:
+                    raise ValueError(f"document with _key {doc['_key']} does not exist in collection {self.name}")
+        return [(doc["_id"],doc["_key"]) for doc in docs]
+
+    def update_versioned(self,docs:List[dict],keyname:str="_id",*args,**kwargs)->List[tuple]:
+        """
+        update documents in a single transaction with the stored version in the WHERE statement. Top level
+        fields are replaced with json_set and fields with None value are removed with json_remove. Each
+        UPDATE changes at most one row. Returns None for documents which were not updated.
+        """
+        out = []
+        with self.dbInst:
+            for doc in docs:
+                if keyname == "_id":
+                    match = ("_key","eq",self._key_from_id(str(doc.get("_id"))))
+                else:
+                    match = (keyname,"eq",doc.get(keyname))
+                if match[2] is None:
+                    raise ValueError(f"document without {keyname} of collection {self.name} can not be updated")
+                where, parameters = self._compile_filters([match,("version","eq",doc["version"]-1)])
+                where = f"WHERE rowid = (SELECT rowid FROM {self._table} {where} LIMIT 1)"
+                fields = {name:val for name,val in doc.items() if name not in ("_id","_key")}
+                expr = "doc"
+                removed = [_json_path(name) for name,val in fields.items() if val is None]
+                if len(removed)>0: expr = f"json_remove({expr},{','.join(removed)})"
+                kept = [name for name,val in fields.items() if val is not None]
+                if len(kept)>0: expr = f"json_set({expr},{','.join(_json_path(name)+',json(?)' for name in kept)})"
+                row = self.dbInst.execute(f"UPDATE {self._table} SET doc = {expr} {where} RETURNING _key",
+                                          [json.dumps(fields[name]) for name in kept]+parameters).fetchone()
+                out.append(None if row is None else (f"{self.name}/{row[0]}",row[0]))
+        return out
+
+    def upsert_many(self,docs:List[dict],keyname:str,now:str,*args,**kwargs)->List[tuple]:
+        """
+        insert documents or update stored documents with same value of keyname in a single transaction.
+        Update increments the stored version in the UPDATE statement and documents which are not updated
+        are inserted. The key gets a unique expression index so that a key matches at most one document.
+        """
+        out = []
+        version = _json_path_expr("version")
+        if keyname != "_key": self.create_index(keyname,unique=True)
+        with self.dbInst:
+            for doc in docs:
+                if doc.get(keyname) is None:
+                    raise ValueError(f"document without {keyname} can not be upserted")
+                where, parameters = self._compile_filters([(keyname,"eq",doc.get(keyname))])
+                where = f"WHERE rowid = (SELECT rowid FROM {self._table} {where} LIMIT 1)"
+                fields = {name:val for name,val in doc.items() if name not in abstract._UPSERT_PROTECTED_FIELDS}
+                assignments = "".join(f"{_json_path(name)},json(?)," for name in fields)
+                expr = (f"json_set(doc,{assignments}{_json_path('version')},COALESCE({version},0)+1,"
+                        f"{_json_path('revised_on')},?)")
+                rows = self.dbInst.execute(f"UPDATE {self._table} SET doc = {expr} {where} RETURNING _key,{version},"
+                                           f"{_json_path_expr('created_on')},{_json_path_expr('revised_on')}",
+                                           [json.dumps(val) for val in fields.values()]+[now]+parameters).fetchall()
+                if len(rows)>0:
+                    key,*stored = rows[0]
+                    out.append((f"{self.name}/{key}",key,*stored))
+                    continue
+                doc = self._new_ids(dict(doc,created_on=now))
+                self.dbInst.execute(f"INSERT INTO {self._table} (_key,doc) VALUES (?,?)",(doc["_key"],json.dumps(doc)))
+                out.append((doc["_id"],doc["_key"],doc.get("version"),now,doc.get("revised_on")))
+        return out
+
+    def delete(self,docID:str,*args,**kwargs):
+        """
+        Delete document using docID
+        """
+        with self.dbInst:
+            cursor = self.dbInst.execute(f"DELETE FROM {self._table} WHERE _key = ?",(self._key_from_id(docID),))
+        return cursor.rowcount > 0
+
+    def find(self,criteria:dict,*args,**kwargs)->List[dict]:
+        """
+        find doc with specific criteria
+        """
+        return self.range_query([(path,"eq",val) for path,val in criteria.items()])
+
+    def range_query(self,filters:List[tuple],*args,**kwargs)->List[dict]:
+        """
+        find documents matching (field path, operator, value) filters
+        """
+        return [json.loads(doc) for (doc,) in self._select(filters)]
+
+    def explain(self,filters:List[tuple],profile:bool=False)->dict:
+        """
+        query plan of the filters from EXPLAIN QUERY PLAN. Sqlite does not estimate or count scanned 
+        rows so they are known only for full scans. Database runs in process so there is no network time.
+        """
+        where, parameters = self._compile_filters(filters)
+        query = f"SELECT doc FROM {self._table} {where}"
+        details = [row[-1] for row in self.dbInst.execute("EXPLAIN QUERY PLAN "+query,parameters)]
+        full_scan = any(detail.startswith("SCAN") for detail in details)
+        indexes = re.findall(r"USING (?:COVERING )?INDEX (\S+)","\n".join(details))
+        plan = {"query":query,"parameters":parameters,"plan":details,"indexes":indexes,"full_scan":full_scan,
+                "estimated_rows":None}
+        if not profile: return plan
+        start = time.perf_counter()
+        rows = self.dbInst.execute(query,parameters).fetchall()
+        server = time.perf_counter()-start
+        start = time.perf_counter()
+        plan["docs"] = [json.loads(doc) for (doc,) in rows]
+        plan.update({"rows_scanned":self._ndocs() if full_scan else None,"rows_returned":len(rows),
+                     "timing":{"server":server,"network":0.,"decode":time.perf_counter()-start}})
+        return plan
+
+    def _ndocs(self):
+        """number of documents"""
+        return self.dbInst.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+
+    def has_doc(self,docID:str)->bool:
+        """
+        Check if document with given docID exist or not.
+        """
+        return self._select([("_key","eq",self._key_from_id(docID))],"1","LIMIT 1").fetchone() is not None
+
+    def has_doc_with_key(self,keyname:str,keyval:Union[str,int,bool,float])->bool:
+        """
+        checks if document with given key exist.
+        """
+        return self._select([(keyname,"eq",keyval)],"1","LIMIT 1").fetchone() is not None
+
+    def get_all_ids(self)->List[str]:
+        """get list of all document ids"""
+        return [f"{self.name}/{key}" for (key,) in self._select([],"_key")]
+
+    def get_all_keys(self)->List[str]:
+        """returns _keys for all document"""
+        return [key for (key,) in self._select([],"_key")]
+
+    def get_page(self,after_key:str=None,limit:int=1000)->List[dict]:
+        """
+        returns at most limit documents with _key greater than after_key in _key order
+        """
+        filters = [] if after_key is None else [("_key","gt",after_key)]
+        return [json.loads(doc) for (doc,) in self._select(filters,"doc","ORDER BY _key LIMIT ?",[limit])]
+
+    def find_sorted(self,filters:List[tuple],path:str,limit:int=1000)->List[dict]:
+        """
+        returns at most limit documents matching the filters sorted on the field path
+        """
+        return [json.loads(doc) for (doc,) in self._select(filters,"doc",f"ORDER BY {_json_path_expr(path)} LIMIT ?",[limit])]
+
+    def join(self,filters:List[tuple],joins:List[tuple])->List[dict]:
+        """
+        compiles the joins into one SELECT with a JOIN per relational field on the _key of the
+        referenced _id, so that referenced documents are read with the primary key. Joins without
+        filters are LEFT JOIN.
+        """
+        columns = ["d.doc"]
+        clauses = []
+        parameters = []
+        for i,(field,coll,join_filters) in enumerate(joins):
+            alias = f"j{i}"
+            reference = _json_path_expr(field+"._id","d.doc")
+            on_filters, on_parameters = self._compile_filters(join_filters,alias,"AND")
+            clauses.append(f"{'' if len(join_filters)>0 else 'LEFT '}JOIN {coll._table} {alias} "
+                           f"ON {alias}._key = substr({reference},instr({reference},'/')+1) "
+                           f"AND {reference} = ? || '/' || {alias}._key {on_filters}")
+            parameters += [coll.name]+on_parameters
+            columns.append(f"{alias}.doc")
+        where, where_parameters = self._compile_filters(filters,"d")
+        query = f"SELECT {', '.join(columns)} FROM {self._table} d {' '.join(clauses)} {where}"
+        rows = []
+        for row in self.dbInst.execute(query,parameters+where_parameters):
+            out = {"doc":json.loads(row[0])}
+            for (field,_,_),doc in zip(joins,row[1:]):
+                out[field] = None if doc is None else json.loads(doc)
+            rows.append(out)
+        return rows
+
+    def traverse(self,start_id:str,depth:int,direction:str,doc_types:List[str]=None)->List[tuple]:
+        """
+        compiles the traversal into one recursive common table expression over this edge collection.
+        Each step joins the edges on the indexed _from or _to expression of the reached vertices.
+        """
+        steps = []
+        for source,target,type_field in graph.edge_steps(direction):
+            steps.append(f"SELECT {_json_path_expr(target,'e.doc')}, {_json_path_expr(type_field,'e.doc')}, walk.depth+1 "
+                         f"FROM walk JOIN {self._table} e ON {_json_path_expr(source,'e.doc')} = walk.vertex "
+                         f"WHERE walk.depth < ?")
+        query = (f"WITH RECURSIVE walk(vertex,doc_type,depth) AS (SELECT ?,NULL,0 UNION {' UNION '.join(steps)}) "
+                 f"SELECT vertex,doc_type,depth FROM walk")
+        rows = self.dbInst.execute(query,[start_id]+[depth]*len(steps)).fetchall()
+        return graph.shortest_depths(start_id,rows,doc_types)
+
+    def get_random_doc(self,*args,**kwargs)->dict:
+        """returns random document from the collection"""
+        row = self._select([],"doc","ORDER BY RANDOM() LIMIT 1").fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def get_random_docs(self,n:int,filters:List[tuple]=[],seed:int=None,*args,**kwargs)->List[dict]:
+        """
+        returns n random documents matching the filters. With seed keys are streamed in primary
+        key order and reservoir sampled so that the sample is reproducible.
+        """
+        if seed is None:
+            return [json.loads(doc) for (doc,) in self._select(filters,"doc","ORDER BY RANDOM() LIMIT ?",[n])]
+        keys = abstract._reservoir_sample((key for (key,) in self._select(filters,"_key","ORDER BY _key")),n,seed)
+        return self.get_many([f"{self.name}/{key}" for key in keys])
+
+    def get_doc(self,docID:str,*args,**kwargs)->dict:
+        """
+        get document with given _id
+        """
+        row = self._select([("_key","eq",self._key_from_id(docID))]).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def get_many(self,docIDs:List[str])->List[dict]:
+        """
+        get multiple documents in the order of docIDs using IN queries. Missing documents are skipped.
+        """
+        keys = [self._key_from_id(docID) for docID in docIDs]
+        docs = {}
+        for i in range(0,len(keys),_MAX_VARS):
+            chunk = keys[i:i+_MAX_VARS]
+            placeholders = ",".join("?"*len(chunk))
+            cursor = self.dbInst.execute(f"SELECT _key,doc FROM {self._table} WHERE _key IN ({placeholders})",chunk)
+            for key,doc in cursor:
+                docs[key] = json.loads(doc)
+        return [docs[key] for key in keys if key in docs]
+
+    def get_many_with_key(self,keyname:str,keyvals:list)->List[dict]:
+        """
+        get documents whose key is one of the values using IN queries on the key expression
+        """
+        expr = "_key" if keyname == "_key" else _json_path_expr(keyname)
+        docs = []
+        for i in range(0,len(keyvals),_MAX_VARS):
+            chunk = [_sql_value(val) for val in keyvals[i:i+_MAX_VARS]]
+            placeholders = ",".join("?"*len(chunk))
+            cursor = self.dbInst.execute(f"SELECT doc FROM {self._table} WHERE {expr} IN ({placeholders})",chunk)
+            docs += [json.loads(doc) for (doc,) in cursor]
+        return docs
+
+    def get_doc_with_key(self,keyname:str,keyval:Union[str,int,bool,float])->List[dict]:
+        """
+        Get documents with a key
+        """
+        return self.range_query([(keyname,"eq",keyval)])
+
+    def find_in_range_of_field(self,field:str,minval:Union[int,float],maxval:Union[int,float],is_field_physical_qty:bool,
+                               *args,**kwargs)->List[dict]:
+        """
+        find document that has a specific field in specified range
+        """
+        if is_field_physical_qty: field +=".value"
+        return self.range_query([(field,"ge",minval),(field,"le",maxval)])
+
+    def distinct(self,path:str,filters:List[tuple]=[])->list:
+        """
+        distinct values of the field path in documents matching the filters
+        """
+        return [val for (val,) in self._select(filters,f"DISTINCT {_json_path_expr(path)}")]
+
+    def count(self,filters:List[tuple]=[])->int:
+        """
+        number of documents matching the filters
+        """
+        return self._select(filters,"COUNT(*)").fetchone()[0]
+
+    def aggregate(self,filters:List[tuple],group_by:List[str],metrics:List[tuple])->List[dict]:
+        """
+        compiles grouping and statistics into SQL GROUP BY query. Unit conversion factors are 
+        applied with CASE on the unit. Standard deviation is computed in two passes, from squared deviations
+        of the metrics against the mean of their group, to avoid cancellation for large values with small spread.
+        """
+        where, parameters = self._compile_filters(filters)
+        columns = [f"{_json_path_expr(path)} AS g{i}" for i,path in enumerate(group_by)]
+        case_parameters = []
+        aggregates = []
+        means = []
+        for j,(value_path,unit_path,factors) in enumerate(metrics):
+            value = _json_path_expr(value_path)
+            if factors is None:
+                converted = value
+            elif len(factors)==0:
+                converted = "NULL"
+            else:
+                cases = []
+                for unit,(scale,offset) in factors.items():
+                    cases.append(f"WHEN ? THEN {value}*?+?")
+                    case_parameters += [unit,scale,offset]
+                converted = f"CASE {_json_path_expr(unit_path)} {' '.join(cases)} ELSE NULL END"
+            columns.append(f"CASE WHEN typeof({value}) IN ('integer','real') THEN {converted} END AS m{j}")
+            means.append(f"AVG(m{j}) AS a{j}")
+            aggregates += [f"AVG(v.m{j})",f"MIN(v.m{j})",f"MAX(v.m{j})",f"COUNT(v.m{j})",f"SUM(v.m{j})",
+                           f"SUM((v.m{j}-a.a{j})*(v.m{j}-a.a{j}))"]
+        groups = [f"g{i}" for i in range(len(group_by))]
+        group_by_clause = f" GROUP BY {', '.join(groups)}" if len(groups)>0 else ""
+        joined_groups = " AND ".join(f"v.{g} IS a.{g}" for g in groups) or "1"
+        query = (f"WITH v AS (SELECT {', '.join(columns)} FROM {self._table} {where}), "
+                 f"a AS (SELECT {', '.join(groups+means)} FROM v{group_by_clause}) "
+                 f"SELECT {', '.join([f'v.{g}' for g in groups]+aggregates)} FROM v JOIN a ON {joined_groups}")
+        if len(groups)>0: query += f" GROUP BY {', '.join(f'v.{g}' for g in groups)}"
+        rows = []
+        for result in self.dbInst.execute(query,case_parameters+parameters):
+            row = {f"g{i}":val for i,val in enumerate(result[:len(groups)])}
+            for j in range(len(metrics)):
+                mean,minval,maxval,count,total,squared_deviations = result[len(groups)+6*j:len(groups)+6*(j+1)]
+                std = math.sqrt(squared_deviations/(count-1)) if count>1 else None
+                row.update({f"m{j}_mean":mean,f"m{j}_min":minval,f"m{j}_max":maxval,f"m{j}_count":count,
+                            f"m{j}_std":std,f"m{j}_sum":total if count>0 else 0})
+            rows.append(row)
+        return rows
+
+    def delete_all_docs(self,*args,**kwargs)->int:
+        """method to delete all documents from the collection"""
+        with self.dbInst:
+            cursor = self.dbInst.execute(f"DELETE FROM {self._table}")
+        return cursor.rowcount
+
+    def update_where(self,filters:List[tuple],patch:dict,bump_version:bool=True,*args,**kwargs)->int:
+        """
+        update all documents matching the filters with a single UPDATE statement. Dotted paths of the patch 
+        are set with json_set and fields with None value are removed with json_remove.
+        """
+        where, parameters = self._compile_filters(filters)
+        expr = "doc"
+        removed = [_json_path(path) for path,val in patch.items() if val is None]
+        if len(removed)>0: expr = f"json_remove({expr},{','.join(removed)})"
+        kept = [path for path,val in patch.items() if val is not None]
+        assignments = [_json_path(path)+",json(?)" for path in kept]
+        if bump_version: assignments.append(f"{_json_path('version')},COALESCE({_json_path_expr('version')},0)+1")
+        if len(assignments)>0: expr = f"json_set({expr},{','.join(assignments)})"
+        with self.dbInst:
+            cursor = self.dbInst.execute(f"UPDATE {self._table} SET doc = {expr} {where}",
+                                         [json.dumps(patch[path]) for path in kept]+parameters)
+        return cursor.rowcount
+
+    def delete_where(self,filters:List[tuple],*args,return_ids:bool=False,**kwargs)->Union[int,List[str]]:
+        """
+        delete all documents matching the filters and return number of deleted documents, or with return_ids
+        their _id from DELETE ... RETURNING
+        """
+        where, parameters = self._compile_filters(filters)
+        with self.dbInst:
+            if return_ids:
+                rows = self.dbInst.execute(f"DELETE FROM {self._table} {where} RETURNING _key",parameters).fetchall()
+                return [f"{self.name}/{key}" for (key,) in rows]
+            cursor = self.dbInst.execute(f"DELETE FROM {self._table} {where}",parameters)
+        return cursor.rowcount
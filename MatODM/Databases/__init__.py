@@ -1,3 +1,6 @@
 # -*- coding: utf-8 -*-
+from .abstract import ConflictError
 from .ArangoDB import ArangoDatabase
 from .MongoDB import MongoDatabase
+from .MemoryDB import MemoryDatabase
+from .SqliteDB import SqliteDatabase
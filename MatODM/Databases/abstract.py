@@ -2,17 +2,60 @@
 from abc import ABC, abstractmethod 
 from datetime import datetime
 from .. import Documents as DocModule
-from typing import Union, List
-ExampleDocTemplate = DocModule.ExampleDocTemplate 
+from typing import Union, List, Iterable, Dict
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+ExampleDocTemplate = DocModule._ExampleDocTemplate 
 Document = DocModule.Document
-RangeQueryTemplate = DocModule.RangeQueryTemplate
-from ..Fields import PhysicalQty
+RangeQueryTemplate = DocModule._RangeQueryTemplate
+from ..Fields import PhysicalQty, PhysicalQtyArray, deferred_unit_conversion
+from ..UnitConverter.converter import conversion_factors
+from . import backup, changes, chunks, graph
+from .cache import QueryCache
+from copy import deepcopy
+from .ingest import IngestPipeline
+from .joins import JoinQuery
+    
+#fields managed by the database which are not overwritten when upsert updates a document
+_UPSERT_PROTECTED_FIELDS = ("_id","_key","_rev","created_on","revised_on","version")
+#statistics supported by Database.aggregate
+_AGGREGATE_STATS = ("mean","min","max","count","std","sum")
+
+class ConflictError(ValueError):
+    """
+    raised when documents were changed in the database after the client read them, so that
+    their stored version is not the version known to the client. ids are the _id or duplicate
+    check key values of the conflicting documents.
+    """
+    def __init__(self,message:str,ids:list):
+        super().__init__(message)
+        self.ids = ids
+
+def _reservoir_sample(items:Iterable,n:int,seed:int=None)->list:
+    """
+    reservoir sampling of n items from a stream of items. For the same stream order and
+    seed the sample is reproducible while only n items are held in memory.
+    """
+    rng = random.Random(seed)
+    sample = []
+    for i,item in enumerate(items):
+        if i < n:
+            sample.append(item)
+        else:
+            j = rng.randint(0,i)
+            if j < n: sample[j] = item
+    return sample
     
 class Database(ABC):
     """
     A generic interface implementation for database
     """
     _allowed_collections=[]
+    _parallel_io = True #whether collections can be read and written from multiple threads in parallel
+    _query_cache = None #QueryCache of find and range_query results, see enable_query_cache
+    _edge_collection = None #name of the edge collection of relational fields in graph mode, see enable_graph
+    _chunk_storage = None #ChunkStorage of large arrays, see enable_chunked_storage
     def __init__(self,dbname,url,username="",password="",*args,**kwargs):
         self.collections = {}
         self.dbname = dbname
@@ -46,7 +89,16 @@ class Database(ABC):
         Delete the collection from the database
         """
         self._del_collection_from_db(collection_name)
-        self.collections.pop(collection_name)
+        self.collections.pop(collection_name,None)
+        self.invalidate_query_cache(collection_name)
+        if collection_name == self._edge_collection:
+            self._edge_collection = None
+        elif self._edge_collection is not None:
+            graph.remove_edges(self,collection_name=collection_name)
+        if self._chunk_storage is not None:
+            if collection_name == self._chunk_storage.collection: self._chunk_storage = None
+            else: self._chunk_storage.remove(self,collection_name=collection_name)
+        if collection_name != changes.TOMBSTONES: changes.record_deletes(self,collection_name,None)
         
     @abstractmethod
     def _del_collection_from_db(self,collection_name):
@@ -90,52 +142,312 @@ class Database(ABC):
                 collections_created.append(collection.name)
         if len(collections_created) > 0: print(f"New collections created: {collections_created}")
     
-    def insert_multiple(self,docs:List[Document],*args,**kwargs):
+    def insert_multiple(self,docs:List[Document],*args,workers:int=None,**kwargs):
+        """
+        inserts multiple documents. Documents which are new for sure (no _id, _key and no key for checking 
+        duplicates) are bulk inserted per collection while others are upserted in one query per collection. 
+        With workers documents are serialized in a process pool using IngestPipeline.
+        """
+        if workers is not None:
+            docs = list(docs)
+            kwargs.setdefault("verbose",False)
+            self.ingest(docs,workers=workers,**kwargs)
+            return docs
         out = []
+        new_docs = {}
+        existing_docs = []
         for doc in docs:
-            out.append(self.insert(doc,*args,**kwargs))
+            if (getattr(doc,"_id",None) is None and getattr(doc,"_key",None) is None 
+                and doc.key_for_checking_duplicates is None):
+                new_docs.setdefault(doc.collection,[]).append(doc)
+            else:
+                existing_docs.append(doc)
+            out.append(doc)
+        if len(existing_docs)>0: self.upsert_multiple(existing_docs,*args,**kwargs)
+        for collection_name,coll_docs in new_docs.items():
+            created_on = self._get_current_time_string()
+            for doc in coll_docs: 
+                setattr(doc,"created_on",created_on)
+                setattr(doc,"change_stamp",changes.next_change_stamp())
+            serialized_docs, arrays = self._split_arrays([doc.serialize() for doc in coll_docs])
+            ids = self.get_collection(collection_name).insert_many(serialized_docs,*args,**kwargs)
+            self.invalidate_query_cache(collection_name)
+            for doc,(docid,dockey) in zip(coll_docs,ids):
+                setattr(doc,"_id",docid)
+                setattr(doc,"_key",dockey)
+                doc._mark_clean()
+            if self._chunk_storage is not None: self._chunk_storage.write(self,coll_docs,arrays or [[]]*len(coll_docs))
+            if self._edge_collection is not None: graph.write_edges(self,coll_docs)
         return out 
     
+    def ingest(self,docs:Iterable[Document],workers:int=None,writers:int=1,chunk_size:int=500,
+               max_pending:int=None,verbose:bool=True)->int:
+        """
+        inserts stream of documents with serialization in a process pool and bulk inserts
+        in writer threads. See IngestPipeline for details.
+
+        Parameters
+        ----------
+        docs : Iterable[Document]
+            documents to insert. Can be a generator.
+        workers : int, optional
+            number of serialization processes. The default is None.
+        writers : int, optional
+            number of writer threads. The default is 1.
+        chunk_size : int, optional
+            number of documents per chunk. The default is 500.
+        max_pending : int, optional
+            maximum number of chunks in flight. The default is None.
+        verbose : bool, optional
+            print throughput. The default is True.
+
+        Returns
+        -------
+        int
+            number of inserted documents.
+
+        """
+        pipeline = IngestPipeline(self,workers,writers,chunk_size,max_pending,verbose)
+        try:
+            return pipeline.run(docs)
+        finally:
+            self.invalidate_query_cache()
+    
     def insert(self,doc:Document,*args,**kwargs):
+        """
+        inserts the document. Documents with key_for_checking_duplicates, _key or _id may already be 
+        in the database and are upserted in a single query, see upsert_multiple.
+        """
+        if (getattr(doc,"_id",None) is not None or getattr(doc,"_key",None) is not None 
+            or doc.key_for_checking_duplicates is not None):
+            return self.upsert_multiple([doc],*args,**kwargs)[0]
         coll = self.get_collection(doc.collection)
-        already_in_db=False
-        #check if document exist in the database 
-        if hasattr(doc,"_id"):
-            #then search using doc id 
-            already_in_db = coll.has_doc(doc._id)
-        if doc.key_for_checking_duplicates is not None:
-            #this means that user think this is new insert but we might have a duplicate in the database 
-            already_in_db = coll.has_doc_with_key(doc.key_for_checking_duplicates,
-                                                  getattr(doc,doc.key_for_checking_duplicates ))
-        #if doc exist then update it else insert it 
-        if already_in_db: 
-            doc.version+=1
-            doc.revised_on = self._get_current_time_string()
-            docid, dockey = coll.update(doc.serialize(),*args,**kwargs)
-        else:
-            setattr(doc,"created_on",self._get_current_time_string())
-            serialized_doc  = doc.serialize()
-            docid, dockey = coll.insert(serialized_doc,*args,**kwargs)
+        setattr(doc,"created_on",self._get_current_time_string())
+        setattr(doc,"change_stamp",changes.next_change_stamp())
+        serialized_docs, arrays = self._split_arrays([doc.serialize()])
+        docid, dockey = coll.insert(serialized_docs[0],*args,**kwargs)
+        self.invalidate_query_cache(doc.collection)
         setattr(doc,"_id",docid)
         setattr(doc,"_key",dockey)
+        doc._mark_clean()
+        if self._chunk_storage is not None: self._chunk_storage.write(self,[doc],arrays or [[]])
+        if self._edge_collection is not None: graph.write_edges(self,[doc])
         return doc 
     
-    def find(self,doc:Union[ExampleDocTemplate,Document],return_as_obj=True,*args,**kwargs):
+    def upsert_multiple(self,docs:List[Document],*args,**kwargs)->List[Document]:
+        """
+        inserts documents or updates the documents already in the database with one query per collection.
+        Documents are matched on key_for_checking_duplicates or on _key if the document has no such key.
+        Insert and update are decided in the database: inserted documents get created_on while updated
+        documents get their stored version incremented and revised_on set.
+
+        Parameters
+        ----------
+        docs : List[Document]
+            documents to insert or update.
+
+        Returns
+        -------
+        List[Document]
+            documents with _id, _key, version, created_on and revised_on as stored in the database.
+
+        """
+        groups = {}
+        for doc in docs:
+            keyname = doc.key_for_checking_duplicates if doc.key_for_checking_duplicates is not None else "_key"
+            groups.setdefault((doc.collection,keyname),[]).append(doc)
+        #all documents are checked before the first group is written
+        serialized_groups = {}
+        for (collection_name,keyname),group in groups.items():
+            serialized_docs = serialized_groups[(collection_name,keyname)] = []
+            for doc in group:
+                setattr(doc,"change_stamp",changes.next_change_stamp())
+                serialized_doc = doc.serialize()
+                if keyname == "_key" and serialized_doc.get("_key") is None:
+                    if serialized_doc.get("_id") is None:
+                        raise ValueError("document without _id, _key or key_for_checking_duplicates can not be upserted")
+                    serialized_doc["_key"] = str(serialized_doc["_id"]).split("/")[-1]
+                elif serialized_doc.get(keyname) is None:
+                    #a missing key would match every stored document without the key
+                    raise ValueError(f"document without {keyname} can not be upserted")
+                serialized_docs.append(serialized_doc)
+        for (collection_name,keyname),group in groups.items():
+            serialized_docs = serialized_groups[(collection_name,keyname)]
+            coll = self.get_collection(collection_name)
+            serialized_docs, arrays = self._split_arrays(serialized_docs)
+            results = coll.upsert_many(serialized_docs,keyname,self._get_current_time_string(),*args,**kwargs)
+            self.invalidate_query_cache(collection_name)
+            for doc,result in zip(group,results):
+                for name,val in zip(("_id","_key","version","created_on","revised_on"),result):
+                    setattr(doc,name,val)
+                doc._mark_clean()
+            if self._chunk_storage is not None:
+                #stored documents are replaced, so are their chunks
+                self._chunk_storage.remove(self,[doc._id for doc in group])
+                self._chunk_storage.write(self,group,arrays or [[]]*len(group))
+            if self._edge_collection is not None: graph.write_edges(self,group,replace=True)
+        return docs
+    
+    def find(self,doc:Union[ExampleDocTemplate,Document],return_as_obj=True,*args,explain:bool=False,profile:bool=False,
+             cache:bool=True,**kwargs):
         coll = self.get_collection(doc.collection)
-        cursor = coll.find(doc.serialize(),*args,**kwargs)
+        if explain or profile:
+            return self._explain(coll,self._range_query_translator(doc),profile,return_as_obj)
+        if cache and self._query_cache is not None:
+            cursor = self._cached_query(coll,"find",self._range_query_translator(doc),return_as_obj,
+                                        lambda: coll.find(doc.serialize(),*args,**kwargs),*args,**kwargs)
+        else:
+            cursor = coll.find(doc.serialize(),*args,**kwargs)
         if return_as_obj:
             return self._convert_cursor_docs2obj(cursor)
         else:
             return cursor
     
-    def range_query(self,doc:RangeQueryTemplate,return_as_obj=True,*args,**kwargs):
+    def range_query(self,doc:RangeQueryTemplate,return_as_obj=True,*args,explain:bool=False,profile:bool=False,
+                    cache:bool=True,**kwargs):
         coll = self.get_collection(doc.collection)
-        cursor = coll.range_query(self._range_query_translator(doc),*args,**kwargs)
+        filters = self._range_query_translator(doc)
+        if explain or profile:
+            return self._explain(coll,filters,profile,return_as_obj)
+        if cache and self._query_cache is not None:
+            cursor = self._cached_query(coll,"range_query",filters,return_as_obj,
+                                        lambda: coll.range_query(filters,*args,**kwargs),*args,**kwargs)
+        else:
+            cursor = coll.range_query(filters,*args,**kwargs)
         if return_as_obj:
             return self._convert_cursor_docs2obj(cursor)
         else:
             return cursor
 
+    def join(self,template:Union[ExampleDocTemplate,RangeQueryTemplate])->JoinQuery:
+        """
+        starts join query on documents matching the template. Relational fields to join are added
+        with follow and the query is run on the server with run, see JoinQuery.
+
+        Parameters
+        ----------
+        template : Union[ExampleDocTemplate,RangeQueryTemplate]
+            template of the documents the join starts from.
+
+        Returns
+        -------
+        JoinQuery
+            query builder.
+
+        """
+        return JoinQuery(self,template)
+
+    def enable_graph(self,edge_collection:str=graph.EDGES):
+        """
+        turns on graph mode. References of relational fields in documents written through this database
+        object are also written as edges into the edge collection so that traverse runs on the server.
+        Documents written before graph mode was enabled have no edges.
+
+        Parameters
+        ----------
+        edge_collection : str, optional
+            name of the edge collection. It is created if it does not exist. The default is "odm_edges".
+
+        """
+        if not self.has_collection(edge_collection): self._create_edge_collection(edge_collection)
+        self._edge_collection = edge_collection
+
+    def _create_edge_collection(self,collection_name:str):
+        """creates edge collection with indexes on _from and _to. Backends override this for their edge types"""
+        return self.create_collection(collection_name)
+
+    def enable_chunked_storage(self,threshold:int=100000,chunk_size:int=100000,workers:int=1,
+                               chunk_collection:str=chunks.CHUNKS)->chunks.ChunkStorage:
+        """
+        turns on chunked storage of large arrays. Numeric lists of documents written through this
+        database object which are longer than the threshold, e.g. values of large TimeSeries or
+        Profile3D fields, are stored as chunk documents in the chunk collection and the document
+        holds a stub with length and statistics of the array. See chunks module for details.
+
+        Parameters
+        ----------
+        threshold : int, optional
+            arrays with more values are chunked. The default is 100000.
+        chunk_size : int, optional
+            number of values per chunk document. The default is 100000.
+        workers : int, optional
+            number of threads fetching chunks in parallel on backends with parallel io. The default is 1.
+        chunk_collection : str, optional
+            name of the chunk collection. It is created if it does not exist. The default is "odm_chunks".
+
+        Returns
+        -------
+        ChunkStorage
+            the chunk storage.
+
+        """
+        storage = chunks.ChunkStorage(chunk_collection,threshold,chunk_size,workers)
+        if not self.has_collection(chunk_collection): self._create_chunk_collection(chunk_collection)
+        self._chunk_storage = storage
+        return storage
+
+    def _create_chunk_collection(self,collection_name:str):
+        """creates chunk collection with indexes on chunk_key, parent and collection. Backends override this"""
+        return self.create_collection(collection_name)
+
+    def _split_arrays(self,docs:List[dict])->(List[dict],List[list]):
+        """serialized documents with large arrays replaced by stubs and the arrays per document, None if there are none"""
+        if self._chunk_storage is None: return docs,None
+        split = [self._chunk_storage.split(doc) for doc in docs]
+        if all(len(arrays)==0 for _,arrays in split): return docs,None
+        return [doc for doc,_ in split],[arrays for _,arrays in split]
+
+    def load_chunks(self,docs:List[dict])->List[dict]:
+        """
+        documents read with return_as_obj=False with the stubs of chunked arrays replaced by the arrays.
+        Documents are copied along the stubs, see enable_chunked_storage.
+        """
+        if self._chunk_storage is None: return docs
+        return self._chunk_storage.load(self,list(docs))
+
+    def traverse(self,start:Union[Document,str],depth:int=1,direction:str="outbound",doc_types:list=None,
+                 return_as_obj=True)->list:
+        """
+        documents reachable from the start document over relational fields in one server side traversal
+        of the edge collection. Requires graph mode, see enable_graph.
+
+        Parameters
+        ----------
+        start : Union[Document,str]
+            document or _id the traversal starts from. It is not returned.
+        depth : int, optional
+            maximum number of edges between start and returned documents. The default is 1.
+        direction : str, optional
+            outbound to documents referenced by relational fields, inbound to documents referencing
+            them or any. The default is "outbound".
+        doc_types : list, optional
+            document classes or their names to return. All documents are traversed but only these
+            are returned. The default is None for all.
+        return_as_obj : bool, optional
+            convert documents to objects. The default is True.
+
+        Returns
+        -------
+        list
+            documents ordered on their shortest distance from start.
+
+        """
+        if self._edge_collection is None:
+            raise ValueError("graph mode is not enabled, see enable_graph")
+        if direction not in graph.DIRECTIONS:
+            raise ValueError(f"direction {direction} not recognized. Available directions are {graph.DIRECTIONS}")
+        if depth < 1:
+            raise ValueError("depth of traversal should be at least 1")
+        start_id = start if isinstance(start,str) else start._id
+        if doc_types is not None:
+            doc_types = [doc_type if isinstance(doc_type,str) else doc_type.__name__ for doc_type in doc_types]
+        vertices = self.get_collection(self._edge_collection).traverse(start_id,depth,direction,doc_types)
+        docs = graph.fetch_vertices(self,vertices)
+        if return_as_obj:
+            return self._convert_cursor_docs2obj(docs)
+        else:
+            return docs
+
     def get_random_doc(self,collection_name:str,return_as_obj=True,*args,**kwargs):
         coll = self.get_collection(collection_name)
         doc = coll.get_random_doc(*args,**kwargs)
@@ -144,6 +456,38 @@ class Database(ABC):
         else:
             return doc
 
+    def get_random_docs(self,collection_name:str,n:int,template:Union[ExampleDocTemplate,RangeQueryTemplate]=None,
+                        seed:int=None,return_as_obj=True,*args,**kwargs)->list:
+        """
+        get n random documents from the collection in a single query
+
+        Parameters
+        ----------
+        collection_name : str
+            name of the collection.
+        n : int
+            number of documents to sample.
+        template : Union[ExampleDocTemplate,RangeQueryTemplate], optional
+            only documents matching the template are sampled. The default is None.
+        seed : int, optional
+            seed for reproducible samples. Without seed the database samples the documents. The default is None.
+        return_as_obj : bool, optional
+            convert documents to objects. The default is True.
+
+        Returns
+        -------
+        list
+            sampled documents.
+
+        """
+        coll = self.get_collection(collection_name)
+        filters = [] if template is None else self._range_query_translator(template)
+        cursor = coll.get_random_docs(n,filters,seed,*args,**kwargs)
+        if return_as_obj:
+            return self._convert_cursor_docs2obj(cursor)
+        else:
+            return cursor
+
     def get_doc(self,collection_name:str,doc_id:str,return_as_obj=True,*args,**kwargs):
         coll = self.get_collection(collection_name)
         doc = coll.get_doc(doc_id,*args,**kwargs)
@@ -152,8 +496,130 @@ class Database(ABC):
         else:
             return doc
         
-    def get_doc_with_key(self,collection_name:str,keyname:Union[str,int,bool,float],keyval:str,return_as_obj=True,*args,**kwargs):
+    def get_docs(self,doc_ids:List[str],return_as_obj=True,chunk_size:int=1000,workers:int=1,
+                 raise_missing:bool=False)->list:
+        """
+        get documents of any collections by _id, e.g. to resolve many RelationalData. Ids are grouped 
+        by collection and read with one lookup per chunk of ids instead of one query per document.
+
+        Parameters
+        ----------
+        doc_ids : List[str]
+            _id of the documents.
+        return_as_obj : bool, optional
+            convert documents to objects. The default is True.
+        chunk_size : int, optional
+            maximum number of ids per lookup. The default is 1000.
+        workers : int, optional
+            number of lookups running in parallel on backends with parallel io. The default is 1.
+        raise_missing : bool, optional
+            raise ValueError with the missing ids if any document is not found. The default is False.
+
+        Returns
+        -------
+        list
+            documents in the order of doc_ids, None for ids which are not in the database.
+
+        """
+        groups = {}
+        for doc_id in dict.fromkeys(doc_ids):
+            groups.setdefault(str(doc_id).split("/")[0],[]).append(doc_id)
+        chunks = [(collection_name,ids[i:i+chunk_size]) for collection_name,ids in groups.items() 
+                  if self.has_collection(collection_name) for i in range(0,len(ids),chunk_size)]
+        fetch = lambda collection_name,ids: self.get_collection(collection_name).get_many(ids)
+        found = {doc["_id"]:doc for doc in self._fetch_chunks(fetch,chunks,workers)}
+        return self._docs_in_order(doc_ids,found,return_as_obj,raise_missing)
+
+    def get_docs_with_key(self,collection_name:str,keyname:str,keyvals:list,return_as_obj=True,chunk_size:int=1000,
+                          workers:int=1,raise_missing:bool=False)->list:
+        """
+        get documents of the collection by values of a unique key such as key_for_checking_duplicates
+        with one lookup per chunk of values. See get_docs for the parameters.
+
+        Returns
+        -------
+        list
+            documents in the order of keyvals, None for values without document. If several documents
+            have the same value one of them is returned.
+
+        """
+        keyvals = list(keyvals)
+        unique = list(dict.fromkeys(keyvals))
+        chunks = [(collection_name,unique[i:i+chunk_size]) for i in range(0,len(unique),chunk_size)]
+        fetch = lambda collection_name,vals: self.get_collection(collection_name).get_many_with_key(keyname,vals)
+        found = {}
+        for doc in self._fetch_chunks(fetch,chunks,workers):
+            val = doc
+            for name in keyname.split("."): val = val.get(name) if isinstance(val,dict) else None
+            found.setdefault(val,doc)
+        return self._docs_in_order(keyvals,found,return_as_obj,raise_missing)
+
+    def _fetch_chunks(self,fetch,chunks:List[tuple],workers:int)->list:
+        """runs fetch(collection_name,chunk) for all chunks, in parallel threads if the backend allows it"""
+        if workers > 1 and self._parallel_io and len(chunks) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(lambda chunk:fetch(*chunk),chunks))
+        else:
+            results = [fetch(*chunk) for chunk in chunks]
+        return [doc for docs in results for doc in docs]
+
+    def _docs_in_order(self,keys:list,found:dict,return_as_obj:bool,raise_missing:bool)->list:
+        """documents found for the keys in order of the keys with None for missing keys"""
+        missing = [key for key in keys if key not in found]
+        if raise_missing and len(missing)>0:
+            raise ValueError(f"{len(missing)} documents not found: {missing[:10]}")
+        docs = [found.get(key) for key in keys]
+        if not return_as_obj: return docs
+        objs = iter(self._convert_cursor_docs2obj([doc for doc in docs if doc is not None]))
+        return [None if doc is None else next(objs) for doc in docs]
+
+    def get_column(self,template:Union[ExampleDocTemplate,RangeQueryTemplate],field:str,unit:str=None,
+                   cache:bool=True)->PhysicalQtyArray:
+        """
+        physical quantity field of all documents matching the template as one PhysicalQtyArray. Values
+        are read from the stored documents without building document or PhysicalQty objects and values
+        in other units are converted to the unit with one array operation per stored unit.
+
+        Parameters
+        ----------
+        template : Union[ExampleDocTemplate,RangeQueryTemplate]
+            template describing the documents.
+        field : str
+            field name or dotted path of the physical quantity, e.g. "strength".
+        unit : str, optional
+            unit of the array. The default is None for the most common stored unit.
+        cache : bool, optional
+            uses the query cache if enabled. The default is True.
+
+        Returns
+        -------
+        PhysicalQtyArray
+            values in the order of the documents, nan for documents without the field.
+
+        """
+        coll = self.get_collection(template.collection)
+        filters = self._range_query_translator(template)
+        if cache and self._query_cache is not None:
+            rows = self._cached_query(coll,"range_query",filters,True,lambda: coll.range_query(filters))
+        else:
+            rows = coll.range_query(filters)
+        path = field.split(".")
+        values, units, std_devs = [], [], []
+        for row in rows:
+            qty = row
+            for name in path:
+                qty = qty.get(name) if isinstance(qty,dict) else None
+            if not isinstance(qty,dict): qty = {}
+            values.append(qty.get("value"))
+            units.append(qty.get("unit"))
+            std_devs.append(qty.get("std_dev"))
+        return PhysicalQtyArray.from_columns(values,units,std_devs,unit)
+
+    def get_doc_with_key(self,collection_name:str,keyname:Union[str,int,bool,float],keyval:str,return_as_obj=True,*args,
+                         explain:bool=False,profile:bool=False,**kwargs):
         coll = self.get_collection(collection_name)
+        if explain or profile:
+            return self._explain(coll,[(keyname,"eq",keyval)],profile,return_as_obj)
         doc = coll.get_doc_with_key(keyname,keyval,*args,**kwargs)
         if return_as_obj:
             return self._convert_cursor_docs2obj([doc])[0]
@@ -162,7 +628,7 @@ class Database(ABC):
     
     
     def find_in_range_of_field(self,collection_name:str, field:str, minval:[int,float,PhysicalQty], maxval:[int,float,PhysicalQty],
-                             return_as_obj=True,*args,**kwargs):
+                             return_as_obj=True,*args,explain:bool=False,profile:bool=False,**kwargs):
         coll = self.get_collection(collection_name)
         try:
             assert type(minval) == type(maxval)
@@ -185,39 +651,251 @@ class Database(ABC):
             except AssertionError:
                 raise ValueError("minimum value type not recognized. Physical quantity only with int or float values can be used")
             maxval = maxval.value
+        if explain or profile:
+            path = field+".value" if is_field_physical_qty else field
+            return self._explain(coll,[(path,"ge",minval),(path,"le",maxval)],profile,return_as_obj)
         cursor = coll.find_in_range_of_field(field,minval,maxval,is_field_physical_qty,*args,**kwargs)
         if return_as_obj:
             return self._convert_cursor_docs2obj(cursor)
         else:
             return cursor
     
-    @abstractmethod
-    def _range_query_translator(self,template):
-        """provides translation of range_query object in terms of database query language"""
+    def _range_query_translator(self,template:Union[ExampleDocTemplate,RangeQueryTemplate])->List[tuple]:
+        """
+        translates example or range query template into list of (field path, operator, value) filters.
+        Each collection driver compiles these filters into its own query language.
+
+        Parameters
+        ----------
+        template : Union[ExampleDocTemplate,RangeQueryTemplate]
+            template with the fields to filter on.
+
+        Returns
+        -------
+        List[tuple]
+            filters with operators from eq, lt, le, gt and ge. Bounds given as PhysicalQty are converted
+            to each unit the field is stored in and compared on the value, with an or filter of one
+            branch per stored unit if the field is stored in other units than the bound.
+
+        """
+        filters = []
+        if not isinstance(template,RangeQueryTemplate):
+            for path,val in template.serialize().items():
+                filters.append((path,"eq",val))
+            return filters
+        for key in template.annotations.keys():
+            expression = getattr(template,key,None)
+            if not hasattr(expression,"operators"): continue
+            bounds = []
+            for operator,val in expression.operators.items():
+                if isinstance(val,dict) and val.get("ODM_field_type") == "PhysicalQty":
+                    bounds.append((operator,val["value"],val["unit"]))
+                else:
+                    filters.append((key,operator,val))
+            if len(bounds) > 0:
+                filters += self._physical_qty_filters(template.collection,key,bounds)
+        return filters
+
+    def _physical_qty_filters(self,collection_name:str,key:str,bounds:List[tuple])->List[tuple]:
+        """
+        filters comparing the PhysicalQty field on its value with (operator, value, unit) bounds. The 
+        bounds are converted to each unit the field is stored in, stored units which can not be converted
+        to the units of the bounds can not match.
+        """
+        bound_units = {unit for _,_,unit in bounds}
+        stored_units = [unit for unit in self.get_collection(collection_name).distinct(key+".unit") if unit is not None]
+        if len(bound_units) == 1 and set(stored_units) <= bound_units:
+            #common case of one unit is filtered without disjunction so that indexes on the value are used
+            return [(key+".unit","eq",bounds[0][2])]+[(key+".value",operator,val) for operator,val,_ in bounds]
+        branches = []
+        for stored_unit in stored_units:
+            branch = [(key+".unit","eq",stored_unit)]
+            try:
+                for operator,val,unit in bounds:
+                    scale, offset = conversion_factors(unit,stored_unit)
+                    branch.append((key+".value",operator,val*scale+offset))
+            except ValueError:
+                continue
+            branches.append(branch)
+        if len(branches) == 0:
+            return [(key+".unit","eq",bounds[0][2])]+[(key+".value",operator,val) for operator,val,_ in bounds]
+        if len(branches) == 1:
+            return branches[0]
+        return [(None,"or",branches)]
     
+    def _explain(self,coll,filters:List[tuple],profile:bool,return_as_obj:bool)->dict:
+        """
+        returns query plan of the filters from the collection. With profile the query is executed
+        and time spent on constructing document objects is added to the timing of the collection.
+        Query methods call this when explain or profile is True instead of returning documents.
+
+        Returns
+        -------
+        dict
+            query : generated query text (with bind_vars or parameters if the backend uses them),
+            indexes : names of the indexes chosen by the query planner,
+            full_scan : whether the planner scans the whole collection,
+            estimated_rows : rows the planner expects to scan or None if backend does not estimate,
+            rows_scanned, rows_returned : with profile, documents and index entries examined and documents returned,
+            timing : with profile, seconds spent on server, network, decode and construct. Parts which
+            can not be measured separately by the backend are None and included in the preceding part.
+        """
+        plan = coll.explain(filters,profile)
+        if profile:
+            docs = plan.pop("docs")
+            start = time.perf_counter()
+            if return_as_obj: self._convert_cursor_docs2obj(docs)
+            plan["timing"]["construct"] = time.perf_counter()-start
+        return plan
+
+    def enable_query_cache(self,max_entries:int=1000,ttl:float=300.)->QueryCache:
+        """
+        caches results of find and range_query. Results of a collection are dropped when it is written
+        through this database object, writes from other clients are seen after ttl seconds. Queries
+        can bypass the cache with cache=False.
+
+        Parameters
+        ----------
+        max_entries : int, optional
+            maximum number of cached results, least recently used results are evicted. The default is 1000.
+        ttl : float, optional
+            seconds after which a result expires. The default is 300. None keeps results until evicted.
+
+        Returns
+        -------
+        QueryCache
+            the cache of this database.
+
+        """
+        self._query_cache = QueryCache(max_entries,ttl)
+        return self._query_cache
+
+    def disable_query_cache(self):
+        """stops caching query results and drops the cache"""
+        self._query_cache = None
+
+    def invalidate_query_cache(self,collection_name:str=None):
+        """drops cached results of the collection or of all collections if collection_name is None"""
+        if self._query_cache is not None: self._query_cache.invalidate(collection_name)
+
+    def query_cache_stats(self)->dict:
+        """hits, misses, evictions, expirations, invalidations, entries and hit_ratio of the query cache"""
+        if self._query_cache is None:
+            raise ValueError("query cache is not enabled, see enable_query_cache")
+        return self._query_cache.stats()
+
+    def _cached_query(self,coll,query_name:str,filters:List[tuple],return_as_obj:bool,run,*args,**kwargs)->list:
+        """returns rows of the query from the cache or runs it and caches the rows"""
+        key = self._query_cache.make_key(coll.name,[query_name]+filters,*args,**kwargs)
+        rows = self._query_cache.get(key)
+        if rows is None:
+            generation = self._query_cache.generation(coll.name)
+            rows = list(run())
+            self._query_cache.put(key,coll.name,rows,generation)
+        #rows are shared by all hits, only objects built from them are handed out without copy
+        return rows if return_as_obj else deepcopy(rows)
+
     def _convert_cursor_docs2obj(self,cursor:list):
+        if self._chunk_storage is not None:
+            cursor = list(cursor)
+            chunked = [chunks.chunked_fields(doc) for doc in cursor]
+            cursor = self._chunk_storage.load(self,cursor)
         output = []
-        for doc in cursor:
-            doc_type = doc["ODM_doc_type"]
-            doc_class = getattr(DocModule,doc_type) 
-            output.append(doc_class.doc2obj(doc))
+        #quantities with preferred unit are converted together per stored unit after the batch is built
+        with deferred_unit_conversion():
+            for doc in cursor:
+                doc_type = doc["ODM_doc_type"]
+                doc_class = getattr(DocModule,doc_type) 
+                output.append(doc_class.doc2obj(doc))
+        for obj in output:
+            #attributes without type checked property were snapshot before the conversion
+            if obj.__skip_type_checks__: obj._mark_clean()
+        if self._chunk_storage is not None:
+            for obj,fields in zip(output,chunked): chunks.mark_chunked(obj,fields)
         return output
                 
-    def update(self,doc:Document, *args,**kwargs):
-        coll = self.get_collection(doc.collection)
-        if hasattr(doc,"_id"):
-            doc_from_db = coll.get_doc(doc._id)
-            doc = doc.merge(doc_from_db)
-        elif doc.key_for_checking_duplicates is not None:
-            doc_from_db = coll.get_doc_with_key(doc.key_for_checking_duplicates,
-                                                getattr(doc,doc.key_for_checking_duplicates)
-                                                ) 
-            doc = doc.merge(doc_from_db)
-        setattr(doc,"revised_on", self._get_current_time_string())
-        setattr(doc,"version", getattr(doc,"version")+1)
-        coll.update(doc.serialize())
-        return doc 
-    
+    def update(self,doc:Document,*args,**kwargs)->Document:
+        """
+        updates the document without reading it from the database. Version of the document is the
+        precondition of the write: document is updated only if its stored version is still the version
+        of the object, otherwise ConflictError is raised. Document is matched with _id or with
+        key_for_checking_duplicates if it has no _id. Documents read from or written to the database
+        send only their changed fields and are not written at all if nothing changed.
+        """
+        return self.update_multiple([doc],*args,**kwargs)[0]
+
+    def update_multiple(self,docs:List[Document],*args,**kwargs)->List[Document]:
+        """
+        updates documents with one bulk conditional update per collection. Documents which were changed
+        in the database since they were read are not written and ConflictError is raised after all
+        other documents are updated. Version and revised_on of conflicting documents are kept unchanged.
+
+        Parameters
+        ----------
+        docs : List[Document]
+            documents to update.
+
+        Returns
+        -------
+        List[Document]
+            updated documents with incremented version.
+
+        """
+        groups = {}
+        for doc in docs:
+            if doc.dirty_fields() == []:
+                continue
+            if getattr(doc,"_id",None) is not None:
+                keyname = "_id"
+            elif doc.key_for_checking_duplicates is not None and getattr(doc,doc.key_for_checking_duplicates,None) is not None:
+                keyname = doc.key_for_checking_duplicates
+            else:
+                raise ValueError("document without _id or value of key_for_checking_duplicates can not be updated")
+            groups.setdefault((doc.collection,keyname),[]).append(doc)
+        conflicts = []
+        for (collection_name,keyname),group in groups.items():
+            coll = self.get_collection(collection_name)
+            previous = [(doc.version,doc.revised_on,getattr(doc,"change_stamp",None)) for doc in group]
+            dirty = [doc.dirty_fields() for doc in group]
+            revised_on = self._get_current_time_string()
+            patches = []
+            for doc in group:
+                setattr(doc,"revised_on",revised_on)
+                setattr(doc,"version",doc.version+1)
+                setattr(doc,"change_stamp",changes.next_change_stamp())
+                patch = doc.serialize_patch()
+                patch[keyname] = getattr(doc,keyname)
+                patches.append(patch)
+            patches, arrays = self._split_arrays(patches)
+            results = coll.update_versioned(patches,keyname,*args,**kwargs)
+            self.invalidate_query_cache(collection_name)
+            if self._edge_collection is not None:
+                #edges of fields read from the database are replaced only if the fields changed
+                updated = [(doc,fields) for doc,fields,result in zip(group,dirty,results) if result is not None]
+                graph.write_edges(self,[doc for doc,_ in updated],[fields for _,fields in updated],replace=True)
+            for doc,(version,old_revised_on,change_stamp),result in zip(group,previous,results):
+                if result is None:
+                    setattr(doc,"version",version)
+                    setattr(doc,"revised_on",old_revised_on)
+                    setattr(doc,"change_stamp",change_stamp)
+                    conflicts.append(getattr(doc,keyname))
+                else:
+                    setattr(doc,"_id",result[0])
+                    setattr(doc,"_key",result[1])
+                    doc._mark_clean()
+            if self._chunk_storage is not None:
+                #chunks of the fields in the patch are replaced, all chunks for full updates
+                updated = [(doc,fields,i) for i,(doc,fields,result) in enumerate(zip(group,dirty,results)) if result is not None]
+                self._chunk_storage.remove(self,[doc._id for doc,_,_ in updated],
+                                           fields=[None if fields is None else chunks.stored_chunked_fields(doc,fields)
+                                                   for doc,fields,_ in updated])
+                self._chunk_storage.write(self,[doc for doc,_,_ in updated],
+                                          [[] if arrays is None else arrays[i] for _,_,i in updated],
+                                          [fields for _,fields,_ in updated])
+        if len(conflicts)>0:
+            raise ConflictError(f"{len(conflicts)} documents were changed or deleted in the database since they were read",
+                                conflicts)
+        return docs
      
     @staticmethod
     def _get_current_time_string()->str:
@@ -232,19 +910,226 @@ class Database(ABC):
         """
         return datetime.now().astimezone().strftime("%Y-%m-%d %H:%M:%S %Z")
     
+    def aggregate(self,collection_name:str,group_by:List[str]=[],metrics:Dict[str,List[str]]={},
+                  target_unit:Union[str,Dict[str,str]]=None,template:Union[ExampleDocTemplate,RangeQueryTemplate]=None
+                  )->List[dict]:
+        """
+        computes statistics of fields grouped by other fields on the database server. Only the summary 
+        rows are returned. 
+
+        Parameters
+        ----------
+        collection_name : str
+            name of the collection.
+        group_by : List[str], optional
+            field paths to group documents by e.g. ["property_type","age.value"]. The default is [].
+        metrics : Dict[str,List[str]], optional
+            statistics computed for the fields e.g. {"strength":["mean","min","max","count","std"]}. 
+            Available statistics are mean, min, max, count, std (sample standard deviation) and sum. The default is {}.
+        target_unit : Union[str,Dict[str,str]], optional
+            unit for PhysicalQty fields, either one unit for all metrics or dict of field to unit. Values are 
+            converted from their stored unit on the server. PhysicalQty fields without target unit are 
+            aggregated on their value if all of them are stored in one unit, otherwise ValueError is raised.
+            Other metrics are aggregated on the numeric field path as they are. The default is None.
+        template : Union[ExampleDocTemplate,RangeQueryTemplate], optional
+            only documents matching the template are aggregated. The default is None.
+
+        Returns
+        -------
+        List[dict]
+            one row per group with group field paths and dict of statistics for each metric field.
+
+        """
+        if len(group_by)==0 and len(metrics)==0:
+            raise ValueError("group_by or metrics should be given for aggregation")
+        coll = self.get_collection(collection_name)
+        filters = [] if template is None else self._range_query_translator(template)
+        metric_specs = []
+        for field,stats in metrics.items():
+            for stat in stats:
+                if stat not in _AGGREGATE_STATS:
+                    raise ValueError(f"statistic {stat} not recognized. Available statistics are {_AGGREGATE_STATS}")
+            unit = target_unit.get(field) if isinstance(target_unit,dict) else target_unit
+            stored_units = [from_unit for from_unit in coll.distinct(field+".unit",filters) if from_unit is not None]
+            if unit is None:
+                if len(stored_units) > 1:
+                    raise ValueError(f"{field} is stored in units {sorted(stored_units)}, target_unit is required for aggregation")
+                metric_specs.append((field if len(stored_units)==0 else field+".value",None,None))
+                continue
+            #conversion factors are computed once per stored unit and applied on the server
+            factors = {from_unit:conversion_factors(from_unit,unit) for from_unit in stored_units}
+            metric_specs.append((field+".value",field+".unit",factors))
+        output = []
+        for row in coll.aggregate(filters,group_by,metric_specs):
+            out = {path:row.get(f"g{i}") for i,path in enumerate(group_by)}
+            for j,(field,stats) in enumerate(metrics.items()):
+                out[field] = {stat:row[f"m{j}_{stat}"] for stat in stats}
+            output.append(out)
+        return output
+    
     def delete_all_documents_from_collection(self,collection_name,*args,**kwargs):
         coll = self.get_collection(collection_name)
-        coll.delete_all_docs()
+        out = coll.delete_all_docs(*args,**kwargs)
+        self.invalidate_query_cache(collection_name)
+        if self._edge_collection not in (None,collection_name): graph.remove_edges(self,collection_name=collection_name)
+        if self._chunk_storage is not None and collection_name != self._chunk_storage.collection:
+            self._chunk_storage.remove(self,collection_name=collection_name)
+        if collection_name != changes.TOMBSTONES: changes.record_deletes(self,collection_name,None)
+        return out
+    
+    def delete_where(self,template:Union[ExampleDocTemplate,RangeQueryTemplate],*args,**kwargs)->int:
+        """
+        delete all documents matching the example or range query template in a single
+        server side operation.
+
+        Parameters
+        ----------
+        template : Union[ExampleDocTemplate,RangeQueryTemplate]
+            template describing documents to delete.
+
+        Returns
+        -------
+        int
+            number of deleted documents.
+
+        """
+        coll = self.get_collection(template.collection)
+        filters = self._range_query_translator(template)
+        doc_ids = coll.delete_where(filters,*args,return_ids=True,**kwargs)
+        self.invalidate_query_cache(template.collection)
+        if self._edge_collection not in (None,template.collection): graph.remove_edges(self,doc_ids)
+        if self._chunk_storage is not None: self._chunk_storage.remove(self,doc_ids)
+        changes.record_deletes(self,template.collection,doc_ids)
+        return len(doc_ids)
+
+    def update_where(self,template:Union[ExampleDocTemplate,RangeQueryTemplate],patch:dict,bump_version:bool=True,
+                     dry_run:bool=False,*args,**kwargs)->int:
+        """
+        update all documents matching the example or range query template with the patch in a single
+        server side operation without reading the documents. Keys of the patch are field names or
+        dotted paths into fields, e.g. "strength.unit", and values are the new values or None to remove
+        the field. All updated documents get the same revised_on and change stamp.
+
+        Parameters
+        ----------
+        template : Union[ExampleDocTemplate,RangeQueryTemplate]
+            template describing documents to update.
+        patch : dict
+            dotted field paths and their new values.
+        bump_version : bool, optional
+            increments version of updated documents. The default is True.
+        dry_run : bool, optional
+            only counts the matching documents without updating them. The default is False.
+
+        Returns
+        -------
+        int
+            number of updated documents or of matching documents with dry_run.
+
+        """
+        coll = self.get_collection(template.collection)
+        filters = self._range_query_translator(template)
+        doc_class = getattr(template,"doc_class",None)
+        paths = sorted(patch.keys())
+        for i,path in enumerate(paths):
+            field = path.split(".")[0]
+            if field in _UPSERT_PROTECTED_FIELDS or field == changes.STAMP_FIELD:
+                raise ValueError(f"{field} is managed by the database and can not be updated")
+            if doc_class is not None and field not in doc_class.annotations:
+                raise ValueError(f"{field} is not a field of {doc_class.__name__}")
+            if doc_class is not None and self._edge_collection is not None and field in (doc_class.relational_fields or []):
+                raise ValueError(f"relational field {field} can not be updated with update_where in graph mode")
+            if i+1 < len(paths) and paths[i+1].startswith(path+"."):
+                raise ValueError(f"{path} and {paths[i+1]} of the patch overlap")
+        if dry_run:
+            return coll.count(filters)
+        patch = {path:val.serialize() if hasattr(val,"serialize") else val for path,val in patch.items()}
+        patch["revised_on"] = self._get_current_time_string()
+        patch[changes.STAMP_FIELD] = changes.next_change_stamp()
+        nupdated = coll.update_where(filters,patch,bump_version,*args,**kwargs)
+        self.invalidate_query_cache(template.collection)
+        return nupdated
+
+    def changes_since(self,collection_name:str,token:str=None,limit:int=1000)->(List[dict],str):
+        """
+        inserted, updated and deleted documents of the collection since the resume token. Call again
+        with returned token to get the next page. See changes.changes_since for details.
+
+        Parameters
+        ----------
+        collection_name : str
+            name of the collection.
+        token : str, optional
+            resume token from the previous call. The default is None for all changes.
+        limit : int, optional
+            maximum number of changes in the page. The default is 1000.
+
+        Returns
+        -------
+        (List[dict],str)
+            changes in the order they were made and the resume token.
+
+        """
+        return changes.changes_since(self,collection_name,token,limit)
+    
+    def dump(self,path:str,collections:List[str]=None,workers:int=1,*args,**kwargs)->dict:
+        """
+        dumps collections into compressed JSON-Lines shards using keyset paged reads. 
+        See backup.dump_database for all options.
+
+        Parameters
+        ----------
+        path : str
+            directory to write the dump.
+        collections : List[str], optional
+            names of collections to dump. The default is None for all collections.
+        workers : int, optional
+            number of collections dumped in parallel. The default is 1.
+
+        Returns
+        -------
+        dict
+            number of documents dumped per collection.
+
+        """
+        return backup.dump_database(self,path,collections,workers,*args,**kwargs)
+    
+    def restore(self,path:str,collections:List[str]=None,workers:int=1,*args,**kwargs)->dict:
+        """
+        restores collections from a dump with parallel bulk inserts. Documents keep their _key, _id,
+        version and created_on. See backup.restore_database for all options.
+
+        Parameters
+        ----------
+        path : str
+            directory of the dump.
+        collections : List[str], optional
+            names of collections to restore. The default is None for all collections in the dump.
+        workers : int, optional
+            number of bulk inserts running in parallel. The default is 1.
+
+        Returns
+        -------
+        dict
+            number of documents restored per collection.
+
+        """
+        try:
+            return backup.restore_database(self,path,collections,workers,*args,**kwargs)
+        finally:
+            self.invalidate_query_cache()
     
     def get_all_ids_in_collection(self,collection_name,*args,**kwargs):
         coll = self.get_collection(collection_name)
-        coll.get_all_ids()
+        return coll.get_all_ids()
 
 class DatabaseCollection(ABC):
     """
     DatabaseCollection is aim to unify the behaviour of drivers of different databases.
     This class is an abstract class which defines interface to the key methods
-    that are used in the ODM.
+    that are used in the ODM. Filters are (field path, operator, value) tuples with
+    operator eq, lt, le, gt, ge or in, whose value is a list. (None, "or", branches) matches
+    documents matching all filters of any of the branches, which are lists of filters.
     """    
     def __init__(self,name:str,dbInst,dbColInst):
         self.name  = name
@@ -258,6 +1143,36 @@ class DatabaseCollection(ABC):
         """
         
 
+    def insert_many(self,docs:List[dict],*args,**kwargs)->List[tuple]:
+        """
+        create new documents and return list of (_id,_key). Drivers should override this with bulk insert.
+        """
+        return [self.insert(doc,*args,**kwargs) for doc in docs]
+    
+    def update_many(self,docs:List[dict],*args,**kwargs)->List[tuple]:
+        """
+        update existing documents and return list of (_id,_key). Drivers should override this with bulk update.
+        """
+        return [self.update(doc,*args,**kwargs) for doc in docs]
+
+    @abstractmethod
+    def update_versioned(self,docs:List[dict],keyname:str="_id",*args,**kwargs)->List[tuple]:
+        """
+        update documents matched on keyname only if their stored version is one less than version of 
+        the document. Documents can be partial: top level fields in them replace the stored fields and 
+        fields with None value are removed. Returns (_id,_key) for each updated document and None for 
+        documents which do not exist or have another version in the database.
+        """
+
+    @abstractmethod
+    def upsert_many(self,docs:List[dict],keyname:str,now:str,*args,**kwargs)->List[tuple]:
+        """
+        insert documents or update stored documents with same value of keyname in a single query.
+        Inserted documents get created_on=now. Updated documents get the fields of the document except
+        _UPSERT_PROTECTED_FIELDS, their stored version incremented and revised_on=now. Returns
+        (_id,_key,version,created_on,revised_on) of the stored documents.
+        """
+
     @property
     def dbname(self):
         """Returns name of the database to which this collection belongs"""
@@ -283,6 +1198,12 @@ class DatabaseCollection(ABC):
         find a documents using a specific criteria
         """
     
+    @abstractmethod
+    def range_query(self,filters:List[tuple],*args,**kwargs)->List[dict]:
+        """
+        find documents matching (field path, operator, value) filters
+        """
+    
     @abstractmethod
     def update(self,doc:dict,*args,**kwargs)->(str,str):
         """
@@ -314,17 +1235,68 @@ class DatabaseCollection(ABC):
         Get all keys of all documents in the collection
         """
     
+    @abstractmethod
+    def get_page(self,after_key:str=None,limit:int=1000)->List[dict]:
+        """
+        get at most limit documents ordered by _key which have _key greater than after_key. This 
+        is used for keyset paged reads of the whole collection.
+        """
+    
+    @abstractmethod
+    def find_sorted(self,filters:List[tuple],path:str,limit:int=1000)->List[dict]:
+        """
+        get at most limit documents matching (field path, operator, value) filters in ascending
+        order of the field path. This is used for reading the change feed on change_stamp.
+        """
+    
+    @abstractmethod
+    def join(self,filters:List[tuple],joins:List[tuple])->List[dict]:
+        """
+        returns documents matching the filters with the documents referenced by their relational fields.
+        joins are (relational field, DatabaseCollection of referenced documents, filters on them). Joins 
+        with filters drop documents without matching referenced document. Rows have the document under 
+        "doc" and the referenced documents under the field names, None if they do not exist.
+        """
+
+    @abstractmethod
+    def traverse(self,start_id:str,depth:int,direction:str,doc_types:List[str]=None)->List[tuple]:
+        """
+        traverses this edge collection from the start _id up to depth edges in the direction (outbound,
+        inbound or any). Returns (vertex _id, shortest depth, document) of reached vertices with one of
+        the doc_types, ordered on depth. Document is None if the backend does not read vertices during
+        the traversal, they are read by Database.traverse.
+        """
+
     @abstractmethod
     def get_random_doc(self)->dict:
         """
         get a random document from the collection. This is useful for demonstrations. 
         """
     @abstractmethod
+    def get_random_docs(self,n:int,filters:List[tuple]=[],seed:int=None)->List[dict]:
+        """
+        get n random documents matching (field path, operator, value) filters. Given seed the
+        sample should be reproducible.
+        """
+        
+    @abstractmethod
     def get_doc(self,docID:str) -> dict:
         """
         get document using document id 
         """
     
+    @abstractmethod
+    def get_many(self,docIDs:List[str])->List[dict]:
+        """
+        get documents of this collection with the _ids in one lookup. Missing documents are skipped.
+        """
+
+    @abstractmethod
+    def get_many_with_key(self,keyname:str,keyvals:list)->List[dict]:
+        """
+        get documents of this collection whose key has one of the values in one lookup
+        """
+
     @abstractmethod 
     def get_doc_with_key(self,keyname:str,keyval:Union[str,int,bool,float])->dict:
         """
@@ -337,6 +1309,49 @@ class DatabaseCollection(ABC):
         find all documents which are in the range of the 
         """
     
+    @abstractmethod
+    def explain(self,filters:List[tuple],profile:bool=False)->dict:
+        """
+        query plan of the query compiled from (field path, operator, value) filters with the keys query, 
+        indexes, full_scan and estimated_rows. With profile the query is executed and rows_scanned, 
+        rows_returned, timing with server, network and decode seconds and the fetched docs are added.
+        """
+    
+    @abstractmethod
+    def distinct(self,path:str,filters:List[tuple]=[])->list:
+        """
+        distinct values of the field path in documents matching the filters
+        """
+
+    @abstractmethod
+    def count(self,filters:List[tuple]=[])->int:
+        """
+        number of documents matching the filters, counted in the database
+        """
+    
+    @abstractmethod
+    def aggregate(self,filters:List[tuple],group_by:List[str],metrics:List[tuple])->List[dict]:
+        """
+        groups documents matching filters by group_by field paths and computes statistics of metrics. 
+        Each metric is (value path, unit path, conversion factors) where factors map unit to (scale, offset)
+        or are None when value is used without conversion. Rows have group values as g0, g1, ... and
+        statistics as m0_mean, m0_min, m0_max, m0_count, m0_std and m0_sum for metric 0.
+        """
+    
     @abstractmethod 
     def delete_all_docs(self,*args,**kwargs):
-        """method to delete all documents from the collection"""
\ No newline at end of file
+        """method to delete all documents from the collection"""
+    
+    @abstractmethod 
+    def update_where(self,filters:List[tuple],patch:dict,bump_version:bool=True,*args,**kwargs)->int:
+        """
+        update all documents matching (field path, operator, value) filters with the dotted paths of the patch,
+        removing paths with None value, and return number of updated documents
+        """
+    
+    @abstractmethod 
+    def delete_where(self,filters:List[tuple],*args,return_ids:bool=False,**kwargs)->Union[int,List[str]]:
+        """
+        delete all documents matching (field path, operator, value) filters and return number of deleted documents,
+        or with return_ids their _id as returned by the delete itself
+        """
\ No newline at end of file
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming dump and restore of databases into compressed JSON-Lines shards. These functions
+work with every database backend through the DatabaseCollection interface and are available
+as Database.dump and Database.restore.
+
+Layout of the dump directory::
+
+    manifest.json                  collections with their shards and number of documents
+    <collection>.<n>.jsonl.gz      shard n of the collection, one document per line
+"""
+from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import gzip
+import json
+import os
+import time
+
+MANIFEST = "manifest.json"
+
+def _report(verbose:bool,action:str,collection_name:str,ndocs:int,start:float):
+    """prints number of documents and throughput"""
+    if verbose:
+        elapsed = max(time.perf_counter()-start,1e-9)
+        print(f"{action} {collection_name}: {ndocs} documents in {elapsed:.2f} s ({ndocs/elapsed:.0f} docs/s)")
+
+def _dump_collection(coll,path:str,page_size:int,shard_size:int,verbose:bool)->dict:
+    """streams collection into shards using keyset paging on _key"""
+    start = time.perf_counter()
+    shards = []
+    ndocs = 0
+    shard = None
+    after_key = None
+    while True:
+        page = coll.get_page(after_key,page_size)
+        if len(page) == 0: break
+        for doc in page:
+            if ndocs % shard_size == 0:
+                if shard is not None: 
+                    shard.close()
+                    _report(verbose,"dumped",coll.name,ndocs,start)
+                shards.append(f"{coll.name}.{len(shards)}.jsonl.gz")
+                shard = gzip.open(os.path.join(path,shards[-1]),"wt",encoding="utf-8")
+            shard.write(json.dumps(doc)+"\n")
+            ndocs += 1
+        after_key = page[-1]["_key"]
+    if shard is not None: shard.close()
+    _report(verbose,"dumped",coll.name,ndocs,start)
+    return {"shards":shards,"ndocs":ndocs}
+
+def dump_database(db,path:str,collections:List[str]=None,workers:int=1,page_size:int=1000,
+                  shard_size:int=100000,verbose:bool=True)->Dict[str,int]:
+    """
+    dumps collections of the database into compressed JSON-Lines shards
+
+    Parameters
+    ----------
+    db : Database
+        database to dump.
+    path : str
+        directory to write the dump. It is created if it does not exist.
+    collections : List[str], optional
+        names of the collections to dump. The default is None for all collections.
+    workers : int, optional
+        number of collections dumped in parallel. The default is 1.
+    page_size : int, optional
+        number of documents read per query. The default is 1000.
+    shard_size : int, optional
+        maximum number of documents per shard. The default is 100000.
+    verbose : bool, optional
+        print progress and throughput. The default is True.
+
+    Returns
+    -------
+    Dict[str,int]
+        number of documents dumped per collection.
+    """
+    os.makedirs(path,exist_ok=True)
+    if collections is None: collections = db.collection_names
+    if not db._parallel_io: workers = 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(lambda name:_dump_collection(db.get_collection(name),path,page_size,shard_size,verbose),
+                           collections)
+        manifest = dict(zip(collections,results))
+    with open(os.path.join(path,MANIFEST),"w") as f:
+        json.dump({"dbname":db.dbname,"collections":manifest},f,indent=4)
+    return {name:info["ndocs"] for name,info in manifest.items()}
+
+def _read_chunks(path:str,shard:str,chunk_size:int):
+    """yields lists of at most chunk_size documents from the shard"""
+    with gzip.open(os.path.join(path,shard),"rt",encoding="utf-8") as f:
+        docs = (json.loads(line) for line in f)
+        while True:
+            chunk = list(itertools.islice(docs,chunk_size))
+            if len(chunk) == 0: break
+            yield chunk
+
+def restore_database(db,path:str,collections:List[str]=None,workers:int=1,chunk_size:int=1000,
+                     verbose:bool=True)->Dict[str,int]:
+    """
+    restores collections from the dump written by dump_database. Documents are bulk inserted as
+    they are, so _key, _id, version, created_on and revised_on are preserved. Missing collections
+    are created.
+
+    Parameters
+    ----------
+    db : Database
+        database to restore the documents in.
+    path : str
+        directory of the dump.
+    collections : List[str], optional
+        names of the collections to restore. The default is None for all collections in the dump.
+    workers : int, optional
+        number of chunks inserted in parallel. The default is 1.
+    chunk_size : int, optional
+        number of documents per bulk insert. The default is 1000.
+    verbose : bool, optional
+        print progress and throughput. The default is True.
+
+    Returns
+    -------
+    Dict[str,int]
+        number of documents restored per collection.
+    """
+    with open(os.path.join(path,MANIFEST),"r") as f:
+        manifest = json.load(f)["collections"]
+    if collections is None: collections = list(manifest.keys())
+    if not db._parallel_io: workers = 1
+    restored = {}
+    for name in collections:
+        start = time.perf_counter()
+        if not db.has_collection(name): db.create_collection(name)
+        coll = db.get_collection(name)
+        chunks = (chunk for shard in manifest[name]["shards"] for chunk in _read_chunks(path,shard,chunk_size))
+        restored[name] = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            #keep at most two chunks per worker in memory
+            pending = []
+            for i,chunk in enumerate(chunks):
+                pending.append(pool.submit(coll.insert_many,chunk))
+                if len(pending) >= 2*workers:
+                    restored[name] += len(pending.pop(0).result())
+                if (i+1) % 100 == 0:
+                    _report(verbose,"restored",name,restored[name],start)
+            for future in pending:
+                restored[name] += len(future.result())
+        _report(verbose,"restored",name,restored[name],start)
+    return restored
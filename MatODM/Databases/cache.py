@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Result cache of find and range_query. Entries are keyed by a hash of the canonical filters of
+the template, the collection and the extra query arguments like projection, and hold the raw
+rows returned by the collection so that document objects are rebuilt from them on every hit.
+
+The cache is invalidated per collection on writes made through the Database. Writes made by
+other processes or clients are not seen, entries of them expire after ttl seconds.
+"""
+from typing import List, Dict
+from collections import OrderedDict
+import hashlib
+import threading
+import json
+import time
+
+class QueryCache:
+    """
+    least recently used cache of query results bounded by number of entries and age
+
+    Parameters
+    ----------
+    max_entries : int, optional
+        maximum number of cached results. The default is 1000.
+    ttl : float, optional
+        seconds after which a result expires. The default is 300. None keeps results until evicted.
+    """
+    def __init__(self,max_entries:int=1000,ttl:float=300.):
+        if max_entries < 1:
+            raise ValueError("max_entries of the query cache should be at least 1")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict() #key -> (collection name, expiry time, rows)
+        self._keys_of_collection = {}
+        self._generations = {} #collection name -> number of invalidations
+        self._epoch = 0 #number of invalidations of all collections
+        self._lock = threading.Lock()
+        self._stats = {"hits":0,"misses":0,"evictions":0,"expirations":0,"invalidations":0}
+
+    @staticmethod
+    def make_key(collection_name:str,filters:List[tuple],*args,**kwargs)->str:
+        """
+        hash of the collection, filters and query arguments. Filters are sorted so that templates
+        setting the same fields in a different order share the entry.
+        """
+        canonical = json.dumps([collection_name,sorted(json.dumps(f,sort_keys=True,default=str) for f in filters),
+                                list(args),kwargs],sort_keys=True,default=str)
+        return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+    def get(self,key:str)->List[dict]:
+        """returns cached rows of the key or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] < time.monotonic():
+                self._remove(key)
+                self._stats["expirations"] += 1
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[2]
+
+    def generation(self,collection_name:str)->tuple:
+        """invalidations of all collections and of the collection, taken before running a query which is put later"""
+        with self._lock:
+            return (self._epoch,self._generations.get(collection_name,0))
+
+    def put(self,key:str,collection_name:str,rows:List[dict],generation:tuple=None):
+        """
+        stores rows of the key and evicts the least recently used results above max_entries. Rows are
+        not stored if the collection was invalidated since generation, as they may be older than the write.
+        """
+        expiry = None if self.ttl is None else time.monotonic()+self.ttl
+        with self._lock:
+            if generation is not None and generation != (self._epoch,self._generations.get(collection_name,0)): return
+            if key in self._entries: self._remove(key)
+            self._entries[key] = (collection_name,expiry,rows)
+            self._keys_of_collection.setdefault(collection_name,set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def invalidate(self,collection_name:str=None):
+        """drops results of the collection or all results if collection_name is None"""
+        with self._lock:
+            if collection_name is None:
+                self._epoch += 1
+                names = list(self._keys_of_collection)
+            else:
+                self._generations[collection_name] = self._generations.get(collection_name,0)+1
+                names = [collection_name]
+            for name in names:
+                keys = self._keys_of_collection.pop(name,set())
+                for key in keys:
+                    self._entries.pop(key,None)
+                if len(keys)>0: self._stats["invalidations"] += 1
+
+    def _remove(self,key:str):
+        """removes the entry and its collection reference, lock has to be held"""
+        collection_name = self._entries.pop(key)[0]
+        keys = self._keys_of_collection.get(collection_name,set())
+        keys.discard(key)
+        if len(keys)==0: self._keys_of_collection.pop(collection_name,None)
+
+    def stats(self)->Dict[str,float]:
+        """hits, misses, evictions, expirations, invalidations, number of entries and hit ratio"""
+        with self._lock:
+            out = dict(self._stats)
+            out["entries"] = len(self._entries)
+        lookups = out["hits"]+out["misses"]
+        out["hit_ratio"] = out["hits"]/lookups if lookups > 0 else 0.
+        return out
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Change feed of collections. Every insert, update and upsert through Database writes a change
+stamp in the change_stamp field of the document. Stamps are zero padded nanoseconds which sort
+as strings and increase within the process, so that a stamp is a resume token of the feed.
+Deleted documents are recorded in the tombstone collection with the stamp of the delete.
+
+Writers in other processes stamp with their own clock. Consumers which need every change from
+many writers should read with a small lag behind the newest stamp.
+"""
+from typing import List
+import threading
+import time
+
+TOMBSTONES = "odm_tombstones"
+STAMP_FIELD = "change_stamp"
+
+_lock = threading.Lock()
+_last_stamp = 0
+
+def next_change_stamp()->str:
+    """returns change stamp which is greater than all stamps returned before in this process"""
+    global _last_stamp
+    with _lock:
+        _last_stamp = max(time.time_ns(),_last_stamp+1)
+        return f"{_last_stamp:020d}"
+
+def record_deletes(db,collection_name:str,doc_ids:List[str]):
+    """
+    writes tombstones of deleted documents. doc_ids None records that all documents of the
+    collection were deleted.
+    """
+    if not db.has_collection(TOMBSTONES): db.create_collection(TOMBSTONES)
+    doc_ids = [None] if doc_ids is None else doc_ids
+    tombstones = [{"collection":collection_name,"doc_id":doc_id,STAMP_FIELD:next_change_stamp()} for doc_id in doc_ids]
+    if len(tombstones)>0: db.get_collection(TOMBSTONES).insert_many(tombstones)
+
+def changes_since(db,collection_name:str,token:str=None,limit:int=1000)->(List[dict],str):
+    """
+    returns page of changes of the collection after the token in stamp order
+
+    Parameters
+    ----------
+    db : Database
+        database with the collection.
+    collection_name : str
+        name of the collection.
+    token : str, optional
+        resume token returned by the previous call. The default is None for all changes.
+    limit : int, optional
+        maximum number of changes. The default is 1000.
+
+    Returns
+    -------
+    (List[dict],str)
+        changes and resume token for the next call. Each change has type (insert, update, delete
+        or clear when all documents were deleted), collection, _id, change_stamp and doc which is
+        the stored document for insert and update. Changes with the same stamp, written by one
+        update_where, are not split between pages so that a page can have more than limit changes.
+    """
+    changes = _read_changes(db,collection_name,[(STAMP_FIELD,"gt",token or "")],limit)
+    if len(changes) > limit or len(changes) == limit > 0:
+        #documents written by one update_where share the stamp, the page ends after all of them
+        last = changes[limit-1][STAMP_FIELD]
+        changes = ([change for change in changes[:limit] if change[STAMP_FIELD] != last]
+                   + _read_changes(db,collection_name,[(STAMP_FIELD,"eq",last)]))
+    return changes, (changes[-1][STAMP_FIELD] if len(changes)>0 else token)
+
+def _read_changes(db,collection_name:str,filters:List[tuple],limit:int=None)->List[dict]:
+    """changes matching the stamp filters in stamp order, at most limit from documents and from tombstones"""
+    def read(coll,filters):
+        return coll.range_query(filters) if limit is None else coll.find_sorted(filters,STAMP_FIELD,limit)
+    changes = []
+    if db.has_collection(collection_name):
+        for doc in read(db.get_collection(collection_name),filters):
+            changes.append({"type":"insert" if doc.get("revised_on") is None else "update",
+                            "collection":collection_name,"_id":doc["_id"],STAMP_FIELD:doc[STAMP_FIELD],"doc":doc})
+    if db.has_collection(TOMBSTONES):
+        for tombstone in read(db.get_collection(TOMBSTONES),filters+[("collection","eq",collection_name)]):
+            changes.append({"type":"clear" if tombstone["doc_id"] is None else "delete",
+                            "collection":collection_name,"_id":tombstone["doc_id"],
+                            STAMP_FIELD:tombstone[STAMP_FIELD],"doc":None})
+    return sorted(changes,key=lambda change:change[STAMP_FIELD])
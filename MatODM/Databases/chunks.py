@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Chunked storage of large arrays. Documents embedding large TimeSeries or Profile arrays can
+exceed the document size limits of the backends and make every read of the document slow.
+With chunked storage numeric lists of a serialized document longer than the threshold are
+written as fixed size chunk documents into a sidecar collection::
+
+    {"chunk_key": "<array id>:3", "array_id": "<array id>", "index": 3, "values": [...],
+     "parent": "profiles/12", "collection": "profiles", "field": "temperature"}
+
+and the document holds a stub with the metadata and statistics of the array::
+
+    {"ODM_chunks": "<array id>", "length": 1000000, "chunk_size": 100000, "nchunks": 10,
+     "dtype": "float64", "min": 12.1, "max": 86.3, "mean": 40.2}
+
+Documents converted to objects get their arrays back. Chunks are fetched with one lookup per
+batch of chunk keys, in parallel threads on backends with parallel io, and copied straight into
+a preallocated numpy array. Documents read with return_as_obj=False keep the stubs until they
+are passed to Database.load_chunks.
+
+Queries can not filter on the values of chunked arrays.
+"""
+from typing import List
+import uuid
+import numpy as np
+
+CHUNKS = "odm_chunks"
+STUB_KEY = "ODM_chunks"
+#number of document ids per delete of their chunks
+DELETE_BATCH_SIZE = 500
+
+class ChunkStorage:
+    """
+    splits large arrays of documents into chunk documents and reassembles them. Used through
+    Database.enable_chunked_storage.
+    """
+    def __init__(self,collection:str=CHUNKS,threshold:int=100000,chunk_size:int=100000,workers:int=1,
+                 batch_size:int=16):
+        if threshold < 1 or chunk_size < 1:
+            raise ValueError("threshold and chunk_size of chunked storage must be positive")
+        self.collection = collection
+        self.threshold = threshold
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.batch_size = batch_size
+
+    def split(self,doc:dict)->(dict,List[tuple]):
+        """
+        replaces numeric lists longer than the threshold by stubs. Returns the document, copied
+        only along the replaced lists, and (field, array id, array) of the replaced lists.
+        """
+        arrays = []
+        out = {}
+        for field,val in doc.items():
+            out[field] = self._split(val,field,arrays)
+        return (out,arrays) if len(arrays)>0 else (doc,arrays)
+
+    def _split(self,val,field:str,arrays:list):
+        if isinstance(val,dict):
+            out = None
+            for key,item in val.items():
+                new = self._split(item,field,arrays)
+                if new is not item:
+                    if out is None: out = dict(val)
+                    out[key] = new
+            return val if out is None else out
+        if isinstance(val,list) and len(val)>0 and isinstance(val[0],dict):
+            new = [self._split(item,field,arrays) for item in val]
+            return val if all(a is b for a,b in zip(new,val)) else new
+        if isinstance(val,(list,np.ndarray)) and len(val) > self.threshold:
+            array = np.asarray(val)
+            if array.ndim != 1 or array.dtype.kind not in "iuf":
+                return val
+            array_id = uuid.uuid4().hex
+            arrays.append((field,array_id,array))
+            return {STUB_KEY:array_id,"length":len(array),"chunk_size":self.chunk_size,
+                    "nchunks":-(-len(array)//self.chunk_size),"dtype":array.dtype.name,
+                    "min":array.min().item(),"max":array.max().item(),"mean":array.mean().item()}
+        return val
+
+    def write(self,db,docs:list,arrays:List[list],replaced:List[List[str]]=None):
+        """
+        writes chunks of the arrays returned by split for each written document with one bulk insert and
+        records the chunked fields on the documents. replaced are the fields written per document by an update.
+        """
+        chunk_docs = []
+        for i,(doc,doc_arrays) in enumerate(zip(docs,arrays)):
+            mark_chunked(doc,{field for field,_,_ in doc_arrays},None if replaced is None else replaced[i])
+            parent = doc._id
+            for field,array_id,array in doc_arrays:
+                for index,start in enumerate(range(0,len(array),self.chunk_size)):
+                    chunk_docs.append({"chunk_key":f"{array_id}:{index}","array_id":array_id,"index":index,
+                                       "values":array[start:start+self.chunk_size].tolist(),
+                                       "parent":parent,"collection":str(parent).split("/")[0],"field":field})
+        if len(chunk_docs)>0: db.get_collection(self.collection).insert_many(chunk_docs)
+
+    def remove(self,db,doc_ids:List[str]=None,collection_name:str=None,fields:List[List[str]]=None):
+        """
+        removes chunks of the documents with one delete per batch of documents, only of the given fields
+        per document if fields are given, or of the collection
+        """
+        coll = db.get_collection(self.collection)
+        if collection_name is not None:
+            coll.delete_where([("collection","eq",collection_name)])
+        groups = {}
+        for i,doc_id in enumerate(doc_ids or []):
+            doc_fields = None if fields is None or fields[i] is None else tuple(sorted(fields[i]))
+            if doc_fields != (): groups.setdefault(doc_fields,[]).append(doc_id)
+        for doc_fields,ids in groups.items():
+            for i in range(0,len(ids),DELETE_BATCH_SIZE):
+                filters = [("parent","in",ids[i:i+DELETE_BATCH_SIZE])]
+                if doc_fields is not None: filters.append(("field","in",list(doc_fields)))
+                coll.delete_where(filters)
+
+    def load(self,db,rows:List[dict])->List[dict]:
+        """
+        rows with stubs replaced by the reassembled arrays. Rows without stubs are returned as they
+        are, others are copied along the stubs so that rows shared with the query cache are unchanged.
+        """
+        stubs = {}
+        for row in rows: _find_stubs(row,stubs)
+        if len(stubs)==0: return rows
+        arrays = {array_id:np.empty(stub["length"],dtype=stub["dtype"]) for array_id,stub in stubs.items()}
+        keys = [f"{array_id}:{index}" for array_id,stub in stubs.items() for index in range(stub["nchunks"])]
+        batches = [(self.collection,keys[i:i+self.batch_size]) for i in range(0,len(keys),self.batch_size)]
+        fetch = lambda collection_name,batch: db.get_collection(collection_name).get_many_with_key("chunk_key",batch)
+        nfound = {array_id:0 for array_id in stubs}
+        for chunk in db._fetch_chunks(fetch,batches,self.workers):
+            array_id = chunk["array_id"]
+            start = chunk["index"]*stubs[array_id]["chunk_size"]
+            arrays[array_id][start:start+len(chunk["values"])] = chunk["values"]
+            nfound[array_id] += 1
+        missing = [array_id for array_id,stub in stubs.items() if nfound[array_id] != stub["nchunks"]]
+        if len(missing)>0:
+            raise ValueError(f"chunks of {len(missing)} arrays are missing in {self.collection}: {missing[:10]}")
+        return [_resolve_stubs(row,arrays) for row in rows]
+
+def chunked_fields(doc:dict)->set:
+    """top level fields of the serialized document with stubs of chunked arrays"""
+    fields = set()
+    for field,val in doc.items():
+        stubs = {}
+        _find_stubs(val,stubs)
+        if len(stubs)>0: fields.add(field)
+    return fields
+
+def mark_chunked(doc,fields:set,replaced:List[str]=None):
+    """
+    records the fields of the document object stored as chunks. With replaced only these fields
+    were written and chunked fields recorded before are kept for the others.
+    """
+    if replaced is not None:
+        fields = fields | (doc.__dict__.get("_chunked_fields",set()) - set(replaced))
+    doc.__dict__["_chunked_fields"] = fields
+
+def stored_chunked_fields(doc,fields:List[str])->List[str]:
+    """fields of the document object which may have chunks in the database, all fields if this is not known"""
+    known = doc.__dict__.get("_chunked_fields")
+    return list(fields) if known is None else [field for field in fields if field in known]
+
+def _find_stubs(val,stubs:dict):
+    """collects stubs of the serialized document by array id"""
+    if isinstance(val,dict):
+        if STUB_KEY in val:
+            stubs[val[STUB_KEY]] = val
+            return
+        for item in val.values(): _find_stubs(item,stubs)
+    elif isinstance(val,list) and len(val)>0 and isinstance(val[0],dict):
+        for item in val: _find_stubs(item,stubs)
+
+def _resolve_stubs(val,arrays:dict):
+    """copy of the serialized document with stubs replaced by the arrays"""
+    if isinstance(val,dict):
+        if STUB_KEY in val:
+            return arrays[val[STUB_KEY]]
+        out = None
+        for key,item in val.items():
+            new = _resolve_stubs(item,arrays)
+            if new is not item:
+                if out is None: out = dict(val)
+                out[key] = new
+        return val if out is None else out
+    if isinstance(val,list) and len(val)>0 and isinstance(val[0],dict):
+        new = [_resolve_stubs(item,arrays) for item in val]
+        return val if all(a is b for a,b in zip(new,val)) else new
+    return val
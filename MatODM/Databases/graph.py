@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Graph mode of the database. Relational fields are stored as embedded _id of the referenced
+document. With graph mode every reference is also written as edge document::
+
+    {"_from": "results/1", "_to": "samples/7", "field": "sample",
+     "from_type": "ExperimentResult", "to_type": "Sample",
+     "from_collection": "results", "to_collection": "samples"}
+
+into the edge collection when documents are written through the Database, so that multi level
+provenance queries run as one traversal on the server (AQL graph traversal in arangodb,
+$graphLookup in mongodb and recursive CTE in sqlite).
+
+Direction of the traversal follows the edges: outbound goes from a document to the documents
+it references, inbound to the documents referencing it and any in both directions.
+"""
+from typing import List
+from ..Utilities import RelationalData
+
+EDGES = "odm_edges"
+DIRECTIONS = ("outbound","inbound","any")
+#number of document ids per delete of their edges
+BATCH_SIZE = 500
+
+def edges_of(doc,fields:List[str]=None)->List[dict]:
+    """edges from the document to the documents referenced by its relational fields"""
+    edges = []
+    for field in doc.relational_fields or []:
+        if fields is not None and field not in fields: continue
+        val = getattr(doc,field,None)
+        refs = val.values() if isinstance(val,dict) else val if isinstance(val,list) else [val]
+        for ref in refs:
+            if not isinstance(ref,RelationalData): continue
+            edges.append({"_from":doc._id,"_to":ref._id,"field":field,
+                          "from_type":doc.ODM_doc_type,"to_type":ref.ODM_doc_type,
+                          "from_collection":doc.collection,"to_collection":ref.collection})
+    return edges
+
+def write_edges(db,docs:list,fields:List[List[str]]=None,replace:bool=False):
+    """
+    writes edges of the relational fields of documents with one bulk insert. With replace stored
+    edges of the documents are removed first, only of the given fields per document if fields are given.
+    """
+    coll = db.get_collection(db._edge_collection)
+    edges = []
+    replaced = {}
+    for i,doc in enumerate(docs):
+        doc_fields = None if fields is None else fields[i]
+        if replace:
+            relational_fields = doc.relational_fields or []
+            doc_fields_replaced = tuple(field for field in (relational_fields if doc_fields is None else doc_fields)
+                                        if field in relational_fields)
+            if len(doc_fields_replaced)>0: replaced.setdefault(doc_fields_replaced,[]).append(doc._id)
+        edges += edges_of(doc,doc_fields)
+    #one delete per batch of documents with same replaced fields
+    for replaced_fields,doc_ids in replaced.items():
+        for i in range(0,len(doc_ids),BATCH_SIZE):
+            coll.delete_where([("_from","in",doc_ids[i:i+BATCH_SIZE]),("field","in",list(replaced_fields))])
+    if len(edges)>0: coll.insert_many(edges)
+
+def remove_edges(db,doc_ids:List[str]=None,collection_name:str=None):
+    """removes edges from and to the deleted documents or to all documents of the collection"""
+    coll = db.get_collection(db._edge_collection)
+    if collection_name is not None:
+        coll.delete_where([("from_collection","eq",collection_name)])
+        coll.delete_where([("to_collection","eq",collection_name)])
+    doc_ids = doc_ids or []
+    for i in range(0,len(doc_ids),BATCH_SIZE):
+        coll.delete_where([("_from","in",doc_ids[i:i+BATCH_SIZE])])
+        coll.delete_where([("_to","in",doc_ids[i:i+BATCH_SIZE])])
+
+def fetch_vertices(db,vertices:List[tuple])->List[dict]:
+    """
+    documents of the (vertex _id, depth, document) rows returned by the traversal of the edge
+    collection. Documents not returned by the traversal are read with Database.get_docs.
+    """
+    missing = [vertex_id for vertex_id,_,doc in vertices if doc is None]
+    docs = dict(zip(missing,db.get_docs(missing,return_as_obj=False)))
+    out = []
+    for vertex_id,_,doc in vertices:
+        doc = docs.get(vertex_id) if doc is None else doc
+        if doc is not None: out.append(doc)
+    return out
+
+def shortest_depths(start_id:str,rows:List[tuple],doc_types:List[str]=None)->List[tuple]:
+    """
+    keeps the shortest depth of each (vertex _id, doc type, depth) row without the start and with
+    one of the doc types and returns (vertex _id, depth, None) rows ordered on depth
+    """
+    depths = {}
+    for vertex_id,doc_type,depth in rows:
+        if vertex_id == start_id or vertex_id is None: continue
+        if doc_types is not None and doc_type not in doc_types: continue
+        if vertex_id not in depths or depth < depths[vertex_id]: depths[vertex_id] = depth
+    return sorted(((vertex_id,depth,None) for vertex_id,depth in depths.items()),key=lambda row:row[1])
+
+#fields of the edge with the next vertex and its doc type when following the edge forward or backward
+_FORWARD = ("_from","_to","to_type")
+_BACKWARD = ("_to","_from","from_type")
+
+def edge_steps(direction:str)->tuple:
+    """(field matched with current vertex, field of next vertex, field of its doc type) per followed edge direction"""
+    if direction == "outbound": return (_FORWARD,)
+    if direction == "inbound": return (_BACKWARD,)
+    return (_FORWARD,_BACKWARD)
+
+def traverse_levels(find_edges,start_id:str,depth:int,direction:str,doc_types:List[str]=None)->List[tuple]:
+    """
+    breadth first traversal with one edge lookup per level for backends without server side traversal
+    in the requested direction. find_edges(field,vertex_ids) returns edges with field in vertex_ids.
+    """
+    seen = {start_id}
+    frontier = {start_id}
+    rows = []
+    for level in range(1,depth+1):
+        if len(frontier) == 0: break
+        next_frontier = set()
+        for source,target,type_field in edge_steps(direction):
+            for edge in find_edges(source,frontier):
+                if edge[target] in seen: continue
+                seen.add(edge[target])
+                next_frontier.add(edge[target])
+                rows.append((edge[target],edge[type_field],level))
+        frontier = next_frontier
+    return shortest_depths(start_id,rows,doc_types)
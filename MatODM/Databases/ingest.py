@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel ingest pipeline. Serialization, data validation and key generation of documents are
+CPU bound python and run in a process pool while bulk inserts run in writer threads.
+"""
+from typing import Iterable, List
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future
+from collections import deque
+import time
+from . import changes, graph
+
+def _serialize_chunk(docs:list)->List[dict]:
+    """regenerates keys, runs data validators and serializes the documents. Runs in worker process"""
+    out = []
+    for doc in docs:
+        for key,func in doc.keygenfunc.items():
+            setattr(doc,key,func(doc))
+        out.append(doc.serialize())
+    return out
+
+class _InlineExecutor:
+    """executor running submitted functions in calling thread when no process pool is requested"""
+    def submit(self,func,*args,**kwargs)->Future:
+        future = Future()
+        future.set_result(func(*args,**kwargs))
+        return future
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        return False
+
+class IngestPipeline:
+    """
+    Inserts large number of documents by serializing them in a process pool and writing
+    serialized chunks with bulk inserts from writer threads. Number of chunks in flight is
+    bounded so that memory stays bounded for any length of input stream.
+
+    Documents with _id, _key or key_for_checking_duplicates may already exist in the database.
+    They are collected and upserted with Database.upsert_multiple, chunk by chunk, after the
+    writer threads are drained, so that no two threads write to the connection at the same time.
+
+    Parameters
+    ----------
+    db : Database
+        database in which documents are inserted.
+    workers : int, optional
+        number of serialization processes. The default is None for serialization in the calling process.
+    writers : int, optional
+        number of writer threads. Backends without parallel io use one writer. The default is 1.
+    chunk_size : int, optional
+        number of documents serialized and inserted together. The default is 500.
+    max_pending : int, optional
+        maximum number of chunks being serialized or written. The default is None for 2*(workers+writers).
+    verbose : bool, optional
+        print number of documents and throughput at the end. The default is False.
+    """
+    def __init__(self,db,workers:int=None,writers:int=1,chunk_size:int=500,max_pending:int=None,verbose:bool=False):
+        self.db = db
+        self.workers = workers
+        self.writers = writers if db._parallel_io else 1
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending or 2*((workers or 1)+self.writers)
+        self.verbose = verbose
+
+    def run(self,docs:Iterable)->int:
+        """
+        inserts all documents and sets their _id and _key
+
+        Parameters
+        ----------
+        docs : Iterable
+            documents to insert. Can be a generator.
+
+        Returns
+        -------
+        int
+            number of inserted documents.
+        """
+        start = time.perf_counter()
+        self._ninserted = 0
+        serializing = deque()
+        writing = deque()
+        buffers = {}
+        existing_docs = []
+        pool = ProcessPoolExecutor(max_workers=self.workers) if self.workers else _InlineExecutor()
+        with pool, ThreadPoolExecutor(max_workers=self.writers) as writer_pool:
+            for doc in docs:
+                if (getattr(doc,"_id",None) is not None or getattr(doc,"_key",None) is not None
+                    or doc.key_for_checking_duplicates is not None):
+                    existing_docs.append(doc)
+                    continue
+                buffer = buffers.setdefault(doc.collection,[])
+                buffer.append(doc)
+                if len(buffer) >= self.chunk_size:
+                    self._submit(pool,writer_pool,serializing,writing,doc.collection,buffers.pop(doc.collection))
+            for collection_name,buffer in buffers.items():
+                self._submit(pool,writer_pool,serializing,writing,collection_name,buffer)
+            while len(serializing)>0:
+                self._write(writer_pool,writing,*serializing.popleft())
+            while len(writing)>0:
+                self._finish(writing.popleft())
+        for i in range(0,len(existing_docs),self.chunk_size):
+            self._ninserted += len(self.db.upsert_multiple(existing_docs[i:i+self.chunk_size]))
+        if self.verbose:
+            elapsed = max(time.perf_counter()-start,1e-9)
+            print(f"inserted {self._ninserted} documents in {elapsed:.2f} s ({self._ninserted/elapsed:.0f} docs/s)")
+        return self._ninserted
+
+    def _submit(self,pool,writer_pool,serializing:deque,writing:deque,collection_name:str,docs:list):
+        """submits chunk for serialization and applies backpressure"""
+        created_on = self.db._get_current_time_string()
+        for doc in docs: 
+            setattr(doc,"created_on",created_on)
+            setattr(doc,"change_stamp",changes.next_change_stamp())
+        serializing.append((collection_name,docs,pool.submit(_serialize_chunk,docs)))
+        while len(serializing)+len(writing) > self.max_pending:
+            if len(serializing)>0 and (len(writing)==0 or serializing[0][2].done()):
+                self._write(writer_pool,writing,*serializing.popleft())
+            else:
+                self._finish(writing.popleft())
+
+    def _write(self,writer_pool,writing:deque,collection_name:str,docs:list,serialized:Future):
+        """submits serialized chunk to the writer threads"""
+        coll = self.db.get_collection(collection_name)
+        serialized_docs, arrays = self.db._split_arrays(serialized.result())
+        writing.append((docs,writer_pool.submit(coll.insert_many,serialized_docs),arrays))
+
+    def _finish(self,item:tuple):
+        """waits for the bulk insert and sets _id and _key of the documents"""
+        docs,future,arrays = item
+        for doc,(docid,dockey) in zip(docs,future.result()):
+            setattr(doc,"_id",docid)
+            setattr(doc,"_key",dockey)
+        if arrays is not None: self.db._chunk_storage.write(self.db,docs,arrays)
+        if self.db._edge_collection is not None: graph.write_edges(self.db,docs)
+        self._ninserted += len(docs)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Join queries following relational fields of documents. The join is compiled by the collection
+driver into one server query (AQL FOR ... FOR, mongo $lookup or SQL JOIN) so that documents and
+the documents they reference are returned together without a client side join.
+
+Example::
+
+    mixes = Mix.range_query_template()
+    mixes.water_binder_ratio < 0.4
+    rows = db.join(Strength.range_query_template()).follow("mix",mixes).run()
+    [(row["doc"].value, row["mix"].name) for row in rows]
+"""
+from typing import List
+from .. import Documents as DocModule
+
+def _collections_of_annotation(annotation)->set:
+    """collections of the document classes in the annotation of a relational field"""
+    if isinstance(annotation,type):
+        if issubclass(annotation,DocModule.Document) and annotation.collection is not None:
+            return {annotation.collection}
+        return set()
+    out = set()
+    for arg in getattr(annotation,"__args__",()):
+        out |= _collections_of_annotation(arg)
+    return out
+
+class JoinQuery:
+    """
+    builder of a join query on documents matching the template. Each follow adds the documents
+    referenced by a relational field of the template document class.
+
+    Parameters
+    ----------
+    db : Database
+        database with the collections.
+    template : Union[ExampleDocTemplate,RangeQueryTemplate]
+        template of the documents the join starts from.
+    """
+    def __init__(self,db,template):
+        self.db = db
+        self.template = template
+        self.doc_class = template.doc_class
+        self.joins = []
+
+    def follow(self,field:str,template=None)->"JoinQuery":
+        """
+        joins documents referenced by the relational field
+
+        Parameters
+        ----------
+        field : str
+            relational field of the document class, e.g. "mix" of Strength.
+        template : Union[ExampleDocTemplate,RangeQueryTemplate], optional
+            only documents referencing joined documents matching the template are returned. Without
+            template documents are returned also when the referenced document does not exist. The
+            default is None.
+
+        Returns
+        -------
+        JoinQuery
+            this query for chaining.
+
+        """
+        relational_fields = getattr(self.doc_class,"relational_fields",None) or []
+        if field not in relational_fields:
+            raise ValueError(f"{field} is not a relational field. Relational fields are {relational_fields}")
+        if field in [name for name,_,_ in self.joins]:
+            raise ValueError(f"{field} is already joined")
+        if template is not None:
+            collection_name = template.collection
+        else:
+            collection_names = _collections_of_annotation(self.doc_class.annotations.get(field))
+            if len(collection_names) != 1:
+                raise ValueError(f"collection of {field} can not be derived from {collection_names}, give a template")
+            collection_name = collection_names.pop()
+        filters = [] if template is None else self.db._range_query_translator(template)
+        self.joins.append((field,collection_name,filters))
+        return self
+
+    def run(self,return_as_obj:bool=True)->List[dict]:
+        """
+        runs the join as one query on the database
+
+        Returns
+        -------
+        List[dict]
+            one row per document with the document under "doc" and the joined documents under
+            their field names. Joined documents are None if they do not exist.
+
+        """
+        coll = self.db.get_collection(self.template.collection)
+        filters = self.db._range_query_translator(self.template)
+        joins = [(field,self.db.get_collection(name),join_filters) for field,name,join_filters in self.joins]
+        rows = coll.join(filters,joins)
+        if not return_as_obj: return rows
+        for row in rows:
+            for name,doc in row.items():
+                row[name] = None if doc is None else self.db._convert_cursor_docs2obj([doc])[0]
+        return rows
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 from .Utilities import MetaODM,json2dict,dict2json
 from typing import   Protocol, Union, Dict, List
-from copy import copy
+from copy import copy, deepcopy
 import numpy as np 
 from . import Fields as fld
 import importlib
@@ -14,11 +14,23 @@ class dbProtocol(Protocol):
     def find(self,template:dict):
         """find document in database"""
 
+def _values_equal(val1,val2)->bool:
+    """compares field values. Values which can not be compared like nested numpy arrays are not equal"""
+    if isinstance(val1,fld.PhysicalQtyArray):
+        return val1.equals(val2)
+    try:
+        equal = val1 == val2
+        if isinstance(equal,np.ndarray):
+            return np.shape(val1) == np.shape(val2) and bool(equal.all())
+        return bool(equal)
+    except (ValueError,TypeError):
+        return False
+
 class _Serializer:
     _types_excluded_from_serialization = (int,float,str,list,dict,Union[float,int], np.ndarray,
                                          Union[float,int, list, np.ndarray], tuple,bool)
     _extra_info_stored = ["ODM_doc_type","created_on","revised_on","_key","version","_id",
-                        "_rev"]
+                        "_rev","change_stamp"]
         
     @staticmethod
     def serialize(obj:...)->dict:
@@ -26,21 +38,29 @@ class _Serializer:
         out = {}
         annotations = obj.annotations
         for k,field_type in annotations.items():
-            val = copy(getattr(obj,k))
+            val = _Serializer.serialize_field(obj,k,field_type)
             if (val is not None):
-                if field_type not in obj._types_excluded_from_serialization:
-                    if hasattr(field_type,"__origin__"):
-                        if field_type.__origin__ in (list,dict):
-                            val = _Serializer._serialize_list_and_dict(val)
-                        else:
-                            val = val.serialize()
-                    else:    
-                        val = val.serialize()
-                if type(val)== np.ndarray:
-                    val = list(val)
                 out[k] = val
         return out
     
+    @staticmethod
+    def serialize_field(obj:...,k:str,field_type:...):
+        """serializes single field of the object. Returns None if the field is not set"""
+        val = copy(getattr(obj,k))
+        if (val is not None):
+            if (field_type not in _Serializer._types_excluded_from_serialization 
+                and not isinstance(val,(int,float,str,bool))):
+                if hasattr(field_type,"__origin__"):
+                    if field_type.__origin__ in (list,dict):
+                        val = _Serializer._serialize_list_and_dict(val)
+                    else:
+                        val = val.serialize()
+                else:    
+                    val = val.serialize()
+            if type(val)== np.ndarray:
+                val = list(val)
+        return val
+    
     @staticmethod 
     def _serialize_list_and_dict(inobj: Union[list,dict])->Union[list,dict]:
         """serializes list  or dict. This is specially required for List or Dict object of typing
@@ -71,7 +91,7 @@ class _Deserializer:
     _types_excluded_from_serialization = (int,float,str,list,dict,Union[float,int], np.ndarray,
                                          Union[float,int, list, np.ndarray], tuple,bool)
     _extra_info_stored = ["ODM_doc_type","created_on","revised_on","_key","version","_id",
-                        "_rev"]
+                        "_rev","change_stamp"]
         
     @staticmethod 
     def deserialize(cls:...,doc:dict)->...:
@@ -92,19 +112,22 @@ class _Deserializer:
         """
         annotations = cls.annotations
         indict  = doc.copy()
-        for key in cls._extra_info_stored: indict.pop(key,None)
+        for key in _Deserializer._extra_info_stored: indict.pop(key,None)
         for key in cls.keygenfunc.keys():indict.pop(key,None)
         for (name, field_type) in annotations.items():
             val = doc.get(name,None)
-            if (field_type not in cls._types_excluded_from_serialization) and (val != None):
+            if (field_type not in _Deserializer._types_excluded_from_serialization) and (val != None):
                 if hasattr(field_type,"__origin__"):
                     if field_type.__origin__ in (list,dict):
                         val = _Deserializer._doc2obj_list_and_dict(val)
                     else:
+                        val = dict(val)
                         ftype = val.pop("ODM_field_type", None)
                         ftype = getattr(fld,ftype)
                         val = ftype.doc2obj(val)                        
                 else:
+                    #stored document is not changed so that cached rows can be deserialized again
+                    val = dict(val)
                     ftype = val.pop("ODM_field_type", None)
                     ftype = getattr(fld,ftype)
                     val = ftype.doc2obj(val)
@@ -181,6 +204,7 @@ class Document(metaclass = MetaODM):
     data_validators = [] #data validators are called during intialization of the object and serialization of the object. They typically raise TypeError if conditions not satisfied 
     keygenfunc={} #function to generate keys from other data of the document
     key_for_checking_duplicates=None #this is the unique keyvalue which can be used to indentify duplicate document in database if _id is  not known
+    _track_dirty_fields = True #property setters record assigned fields for partial updates
 
     def __post_init__(self):
         """
@@ -203,7 +227,7 @@ class Document(metaclass = MetaODM):
                 if val!=None:
                     if type(val)==dict:
                         for k,v in val.items():
-                            val[k] = fld.RelationalData.init_from_odm_doc(val)
+                            val[k] = fld.RelationalData.init_from_odm_doc(v)
                     elif type(val)==list:
                         for i,v in enumerate(val):
                             val[i] = fld.RelationalData.init_from_odm_doc(v)
@@ -219,11 +243,12 @@ class Document(metaclass = MetaODM):
         # newcls = copy(cls)
         args = cls.annotations.copy()
         for key in cls.keygenfunc.keys():
-            args[key]= Union(str,float,int,bool)
-        for info in cls._extra_info_stored:
-            args[key]=str
+            args[key]= Union[str,float,int,bool]
+        for info in _Serializer._extra_info_stored:
+            args[info]=Union[str,int]
         template = _RangeQueryTemplate(args) 
         template.collection = cls.collection
+        template.doc_class = cls
         return template
     
     @classmethod
@@ -231,11 +256,12 @@ class Document(metaclass = MetaODM):
         # newcls = copy(cls)
         args = cls.annotations.copy()
         for key in cls.keygenfunc.keys():
-            args[key]= Union(str,float,int,bool)
-        for info in cls._extra_info_stored:
-            args[key]=str
+            args[key]= Union[str,float,int,bool]
+        for info in _Serializer._extra_info_stored:
+            args[info]=Union[str,int]
         template = _ExampleDocTemplate(args) 
         template.collection = cls.collection
+        template.doc_class = cls
         return template 
     
     def diff(self,doc:Union[dict,"Document"]):
@@ -307,7 +333,68 @@ class Document(metaclass = MetaODM):
             Instance of the Document class is returned.
 
         """
-        return _Deserializer.deserialize(cls, doc)
+        inst = _Deserializer.deserialize(cls, doc)
+        inst._mark_clean()
+        return inst
+    
+    def _mark_clean(self):
+        """
+        marks the document as stored in the database. Assignments are recorded by the property setters. 
+        Values which can change without assignment (list, dict and field objects) are snapshot by the
+        property getter on first access, so fields which are never read cost nothing. Attributes without
+        type checked property are snapshot right away.
+        """
+        self.__dict__["_dirty_fields"] = set()
+        snapshot = {}
+        lazy = set()
+        for name in list(self.annotations.keys())+list(self.keygenfunc.keys()):
+            if name in self.__skip_type_checks__ or name in self.keygenfunc:
+                snapshot[name] = deepcopy(getattr(self,name,None))
+            elif not isinstance(self.__dict__.get("_"+name),(int,float,str,bool,type(None))):
+                lazy.add(name)
+        self.__dict__["_clean_values"] = snapshot
+        self.__dict__["_lazy_snapshot"] = lazy
+    
+    def dirty_fields(self)->List[str]:
+        """
+        fields assigned or changed since the document was read from or written to the database
+
+        Returns
+        -------
+        List[str]
+            names of the changed fields. None if the document was never read from or written to the database.
+        """
+        if "_clean_values" not in self.__dict__: return None
+        dirty = set(self.__dict__["_dirty_fields"])
+        for name,val in self.__dict__["_clean_values"].items():
+            if name not in dirty and not _values_equal(getattr(self,name,None),val):
+                dirty.add(name)
+        return sorted(dirty)
+    
+    def serialize_patch(self)->dict:
+        """
+        serializes only the changed fields and the extra info like version and _id. Fields which are 
+        changed to None are None in the patch so that they are removed from the stored document.
+
+        Returns
+        -------
+        dict
+            partial document for the update.
+        """
+        for validate in self.data_validators:
+            validate(self)
+        dirty = self.dirty_fields()
+        if dirty is None: return self.serialize()
+        out = {}
+        for name in dirty:
+            if name in self.annotations:
+                out[name] = _Serializer.serialize_field(self,name,self.annotations[name])
+            else:
+                out[name] = getattr(self,name,None)
+        for info  in _Serializer._extra_info_stored:
+            val= getattr(self,info,None)
+            if val!=None: out[info]=val
+        return out
     
     def serialize(self)->dict:
         """
@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
-from typing import Union, List
+from typing import Union, List, Dict
 from copy import copy
-from .UnitConverter.converter import convert2float
+from .UnitConverter.converter import convert2float, convert_values, conversion_factors, has_dimensions
+from .UnitConverter.parser import UnitParser
 from . import Utilities as utl
 from datetime import datetime as _datetime
 import numpy as np 
@@ -10,6 +11,8 @@ import pytz
 from dateutil.tz import tzlocal
 import importlib
 import warnings
+import threading
+from contextlib import contextmanager
 
 RelationalData=utl.RelationalData
 
@@ -305,9 +308,10 @@ class PhysicalQty(AbstractField):
                 raise ValueError("cannot check dimesnionality as dimensions for the physical qunatity are not provided ")
 
             try:
-                base_unit = self._get_base_unit_from_dimensions()
-                convert2float(self.value, self.unit, base_unit)
+                compatible = has_dimensions(self.unit, self.dimensions)
             except ValueError:
+                compatible = False
+            if not compatible:
                 raise ValueError(f"Given unit:{self.unit} is not compatible with the dimensions:{self.dimensions} for the pyhsiscal quantity")
         #set preferred unit is given in post init and then if there is already preferred unit
         #convert value to that unit
@@ -316,7 +320,11 @@ class PhysicalQty(AbstractField):
         if type(self.value)== list:
             self.value = np.array(self.value)
         if self.preferred_unit!=None and self.preferred_unit!=self.unit:
-            self.convert_to(self.preferred_unit)
+            deferred = getattr(_deferred_conversions,"quantities",None)
+            if deferred is not None:
+                deferred.append(self)
+            else:
+                self.convert_to(self.preferred_unit)
         #this hard coding is done to ensure that user defined physical qunatities are always 
         #reloaded as physical qunatities. One should be careful is inheritance is done. 
         self.ODM_field_type = "PhysicalQty"
@@ -351,7 +359,7 @@ class PhysicalQty(AbstractField):
             return False
     
     def __len__(self):
-     if type(self.value) == int or float:
+     if isinstance(self.value,(int,float)):
          raise TypeError("This is a zero dimensional physical quantity")
      else:
          return len(self.value)
@@ -477,22 +485,6 @@ class PhysicalQty(AbstractField):
         return (type(other).__name__ in ["UserDefinedPhysicalQty", "PhysicalQty"]
                 or other.__class__.__mro__[1].__name__ in ["UserDefinedPhysicalQty", "PhysicalQty"])
     
-    def _get_base_unit_from_dimensions(self):
-        """get base unit to check dimensionality of the given unit"""
-        SI_units = {    'L':'m', #length
-                        'M':'g', #mass
-                        'T':'s', #time
-                        'I':'A', #current
-                        'THETA':'K', #temprature
-                        'N':'mol', #amount of substance 
-                        'J':'cd', # luminous intensity 
-                        }
-        base_unit = ""
-        for k,v in self.dimensions:
-            if v!=0 :
-                base_unit += f"{SI_units[k]}^{v} "
-        return base_unit
-
 class PhysicalQtyRange(AbstractField):
     """
     Field for giving range of values for physical qunatities instead of specific number
@@ -518,10 +510,210 @@ class PhysicalQtyRange(AbstractField):
         if inplace:
             self.min_value =  convert2float(self.min_value, self.unit, desiredunit)
             self.max_value =  convert2float(self.max_value, self.unit, desiredunit)            
+            self.unit = desiredunit
         else:
             return (convert2float(self.min_value, self.unit, desiredunit),
                     convert2float(self.max_value, self.unit, desiredunit))            
 
+class PhysicalQtyArray(AbstractField):
+    """
+    Field for many values of a physical quantity sharing one unit, e.g. strengths of all documents
+    of a query result. Values and standard deviations are contiguous arrays, arithmetic, comparison,
+    masking and unit conversion work on the whole arrays. Indexing with an integer returns a
+    PhysicalQty, indexing with a slice, index array or boolean mask a PhysicalQtyArray.
+    """
+    value:Union[float,int, list, np.ndarray]
+    unit:str
+    std_dev:Union[float,int, list, np.ndarray]=None
+    experimental_technique:str=None
+    #numpy arrays on the left of operators defer to the reflected operators of the array
+    __array_ufunc__ = None
+
+    def __post_init__(self):
+        super().__post_init__()
+        self.value = _float_array(self.value)
+        if self.std_dev is not None:
+            self.std_dev = _float_array(self.std_dev)
+
+    def serialize(self):
+        """serializes the arrays as lists of python floats"""
+        output = super().serialize()
+        output["value"] = self.value.tolist()
+        if self.std_dev is not None:
+            output["std_dev"] = self.std_dev.tolist()
+        return output
+
+    @classmethod
+    def from_columns(cls,values:list,units:list,std_devs:list=None,unit:str=None)->"PhysicalQtyArray":
+        """
+        array from columns of scalar values, their units and standard deviations. Values in other
+        units are converted with one array operation per unit, unit defaults to the most common unit.
+        Missing values (None) are nan.
+        """
+        value = np.array([np.nan if val is None else val for val in values],dtype=float)
+        units = np.array(units,dtype=object)
+        counts = {}
+        for from_unit in units:
+            if from_unit is not None: counts[from_unit] = counts.get(from_unit,0)+1
+        if unit is None and len(counts)>0:
+            unit = max(counts,key=counts.get)
+        elif unit is None and not np.all(np.isnan(value)):
+            raise ValueError("unit of the values is not known, provide unit")
+        std_dev = None
+        if std_devs is not None and any(std is not None for std in std_devs):
+            std_dev = np.array([np.nan if std is None else std for std in std_devs],dtype=float)
+        for from_unit in counts:
+            if from_unit == unit: continue
+            mask = units == from_unit
+            value[mask] = convert_values(value[mask],from_unit,unit)
+            if std_dev is not None:
+                std_dev[mask] *= abs(conversion_factors(from_unit,unit)[0])
+        return cls(value,unit,std_dev)
+
+    @classmethod
+    def from_quantities(cls,quantities:List[PhysicalQty],unit:str=None)->"PhysicalQtyArray":
+        """array from scalar physical quantities, see from_columns"""
+        return cls.from_columns([None if qty is None else qty.value for qty in quantities],
+                                [None if qty is None else qty.unit for qty in quantities],
+                                [None if qty is None else qty.std_dev for qty in quantities],unit)
+
+    def to_quantities(self)->List[PhysicalQty]:
+        """list of scalar physical quantities of the array"""
+        return [self[i] for i in range(len(self))]
+
+    def convert_to(self,desiredunit,inplace= True):
+        scale = conversion_factors(self.unit,desiredunit)[0]
+        std_dev = None if self.std_dev is None else self.std_dev*abs(scale)
+        if inplace:
+            self.value = convert_values(self.value,self.unit,desiredunit)
+            self.std_dev = std_dev
+            self.unit = desiredunit
+        else:
+            return PhysicalQtyArray(convert_values(self.value,self.unit,desiredunit),desiredunit,std_dev,
+                                    self.experimental_technique)
+
+    def equals(self,other)->bool:
+        """true if other is an array with same unit, values and standard deviations"""
+        if not isinstance(other,PhysicalQtyArray) or self.unit != other.unit:
+            return False
+        if (self.std_dev is None) != (other.std_dev is None):
+            return False
+        return (np.array_equal(self.value,other.value,equal_nan=True) and
+                (self.std_dev is None or np.array_equal(self.std_dev,other.std_dev,equal_nan=True)))
+
+    def mean(self)->PhysicalQty:
+        return PhysicalQty(float(np.nanmean(self.value)),self.unit)
+
+    def std(self)->PhysicalQty:
+        """sample standard deviation (ddof=1) like Database.aggregate, None for less than two values"""
+        if np.count_nonzero(~np.isnan(self.value)) < 2:
+            return None
+        return PhysicalQty(float(np.nanstd(self.value,ddof=1)),self.unit)
+
+    def min(self)->PhysicalQty:
+        return PhysicalQty(float(np.nanmin(self.value)),self.unit)
+
+    def max(self)->PhysicalQty:
+        return PhysicalQty(float(np.nanmax(self.value)),self.unit)
+
+    def __len__(self):
+        return len(self.value)
+
+    def __getitem__(self,index):
+        std_dev = None if self.std_dev is None else self.std_dev[index]
+        if isinstance(index,(int,np.integer)):
+            return PhysicalQty(float(self.value[index]),self.unit,
+                               None if std_dev is None else float(std_dev),self.experimental_technique)
+        return PhysicalQtyArray(self.value[index],self.unit,std_dev,self.experimental_technique)
+
+    def _values_in_unit(self,other):
+        """values of the other operand in unit of the array. Numbers and numpy arrays are taken as in the unit"""
+        if isinstance(other,(PhysicalQtyArray,PhysicalQty)):
+            if other.unit == self.unit:
+                return other.value
+            return convert_values(other.value,other.unit,self.unit)
+        elif isinstance(other,(int,float,np.ndarray)):
+            return other
+        else:
+            raise ValueError("cannot operate on %s type"%type(other).__name__)
+
+    def _std_dev_with(self,other):
+        """standard deviation of sum or difference with the other operand, uncorrelated errors add in quadrature"""
+        other_std_dev = getattr(other,"std_dev",None)
+        if other_std_dev is None:
+            return self.std_dev
+        if other.unit != self.unit:
+            other_std_dev = np.multiply(other_std_dev,abs(conversion_factors(other.unit,self.unit)[0]))
+        if self.std_dev is None:
+            return np.broadcast_to(other_std_dev,self.value.shape).astype(float)
+        return np.sqrt(self.std_dev**2 + np.square(other_std_dev))
+
+    def __add__(self,other):
+        return PhysicalQtyArray(self.value + self._values_in_unit(other),self.unit,self._std_dev_with(other))
+
+    def __sub__(self,other):
+        return PhysicalQtyArray(self.value - self._values_in_unit(other),self.unit,self._std_dev_with(other))
+
+    def __rsub__(self,other):
+        return PhysicalQtyArray(self._values_in_unit(other) - self.value,self.unit,self._std_dev_with(other))
+
+    def __mul__(self,other):
+        if not isinstance(other,(int,float,np.ndarray)):
+            raise ValueError("PhysicalQtyArray can only be multiplied with numbers or arrays")
+        std_dev = None if self.std_dev is None else self.std_dev*np.abs(other)
+        return PhysicalQtyArray(self.value*other,self.unit,std_dev)
+
+    def __truediv__(self,other):
+        if not isinstance(other,(int,float,np.ndarray)):
+            raise ValueError("PhysicalQtyArray can only be divided by numbers or arrays")
+        std_dev = None if self.std_dev is None else self.std_dev/np.abs(other)
+        return PhysicalQtyArray(self.value/other,self.unit,std_dev)
+
+    def __rtruediv__(self,other):
+        if not isinstance(other,(int,float,np.ndarray)):
+            raise ValueError("only numbers or arrays can be divided by PhysicalQtyArray")
+        value = other/self.value
+        std_dev = None if self.std_dev is None else np.abs(value)*self.std_dev/np.abs(self.value)
+        return PhysicalQtyArray(value,_reciprocal_unit(self.unit),std_dev)
+
+    __radd__ = __add__
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return PhysicalQtyArray(-self.value,self.unit,self.std_dev)
+
+    def __eq__(self,other):
+        return self.value == self._values_in_unit(other)
+
+    def __ne__(self,other):
+        return self.value != self._values_in_unit(other)
+
+    def __lt__(self,other):
+        return self.value < self._values_in_unit(other)
+
+    def __le__(self,other):
+        return self.value <= self._values_in_unit(other)
+
+    def __gt__(self,other):
+        return self.value > self._values_in_unit(other)
+
+    def __ge__(self,other):
+        return self.value >= self._values_in_unit(other)
+
+def _reciprocal_unit(unit:str)->str:
+    """unit of the reciprocal of quantities in the unit, e.g. kg m^-3 gives kg^-1*m^3"""
+    terms = []
+    for div,symbol,power in UnitParser.unit_re.findall(unit):
+        power = float(power or 1)*(1 if div else -1)
+        terms.append(f"{symbol}^{power:g}")
+    return "*".join(terms)
+
+def _float_array(val)->np.ndarray:
+    """float32 and float64 arrays are kept, other values are converted to float64 array"""
+    if isinstance(val,np.ndarray) and val.dtype.kind == "f":
+        return val
+    return np.asarray(val,dtype=float)
+
 class Duration(PhysicalQty):
     """
     """
@@ -533,6 +725,118 @@ class SpatialCoordinates(PhysicalQty):
     check_dimensionality:bool=True
 
     
+def normalize_units(quantities:Union[List[PhysicalQty],Dict[str,PhysicalQty]],target_unit:str,
+                    inplace:bool=True)->Union[List[PhysicalQty],Dict[str,PhysicalQty]]:
+    """
+    converts list or dict of physical quantities with mixed units to the target unit. Quantities
+    are grouped on their unit so that each conversion factor is computed once, and scalar values
+    of a group are converted together with one array operation.
+
+    Parameters
+    ----------
+    quantities : Union[List[PhysicalQty],Dict[str,PhysicalQty]]
+        quantities to convert. None entries are kept.
+    target_unit : str
+        unit to convert all quantities to.
+    inplace : bool, optional
+        converts the given quantities, otherwise converted copies are returned. The default is True.
+
+    Returns
+    -------
+    Union[List[PhysicalQty],Dict[str,PhysicalQty]]
+        converted quantities in the same list or dict.
+
+    """
+    if isinstance(quantities,dict):
+        keys = list(quantities.keys())
+        out = quantities if inplace else dict(quantities)
+    else:
+        keys = range(len(quantities))
+        out = quantities if inplace else list(quantities)
+    #quantities and their values are kept in parallel lists per unit to avoid allocations per quantity
+    groups = {}
+    for key in keys:
+        qty = out[key]
+        if qty is None: continue
+        unit = qty.unit
+        if unit == target_unit: continue
+        if not inplace:
+            qty = out[key] = copy(qty)
+        group = groups.get(unit)
+        if group is None:
+            group = groups[unit] = ([],[],[],[])
+        value = qty.value
+        if isinstance(value,np.ndarray):
+            group[2].append(qty)
+            group[3].append(value)
+        else:
+            group[0].append(qty)
+            group[1].append(value)
+    for unit,(scalars,values,arrays,array_values) in groups.items():
+        if len(scalars)>0:
+            values = convert_values(np.array(values,dtype=float),unit,target_unit).tolist()
+            for qty,value in zip(scalars,values):
+                _set_converted(qty,value,target_unit)
+        for qty,value in zip(arrays,array_values):
+            _set_converted(qty,convert_values(value,unit,target_unit),target_unit)
+    return out
+
+def _set_converted(qty,value,unit):
+    """sets converted value and unit bypassing type checks of the properties as both are known to be valid"""
+    qty.__dict__["_value"] = value
+    qty.__dict__["_unit"] = unit
+
+def to_common_unit(quantities:Union[List[PhysicalQty],Dict[str,PhysicalQty]],unit:str=None,
+                   inplace:bool=True)->Union[List[PhysicalQty],Dict[str,PhysicalQty]]:
+    """
+    converts list or dict of physical quantities to one unit with normalize_units. The unit
+    defaults to the unit most of the quantities already have.
+    """
+    if unit is None:
+        values = quantities.values() if isinstance(quantities,dict) else quantities
+        counts = {}
+        for qty in values:
+            if qty is not None: counts[qty.unit] = counts.get(qty.unit,0)+1
+        if len(counts)==0:
+            return quantities if inplace else copy(quantities)
+        unit = max(counts,key=counts.get)
+    return normalize_units(quantities,unit,inplace)
+
+#quantities waiting for conversion to their preferred unit, per thread, see deferred_unit_conversion
+_deferred_conversions = threading.local()
+
+@contextmanager
+def deferred_unit_conversion():
+    """
+    defers conversion of physical quantities created inside the block to their preferred unit. On exit
+    the quantities are converted with normalize_units, one batch per preferred unit, which groups them
+    on their unit, instead of one conversion per quantity. Used when documents of a query result are built.
+    Nested blocks are converted by the outermost one.
+    """
+    if getattr(_deferred_conversions,"quantities",None) is not None:
+        yield
+        return
+    quantities = _deferred_conversions.quantities = []
+    try:
+        yield
+    finally:
+        _deferred_conversions.quantities = None
+    groups = {}
+    for qty in quantities:
+        groups.setdefault(qty.preferred_unit,[]).append(qty)
+    for unit,group in groups.items():
+        normalize_units(group,unit)
+
+def _convert_quantities(value,desiredunit,inplace):
+    """converts value of the series or profile which is a physical quantity or a list of them"""
+    if isinstance(value,list):
+        if inplace:
+            normalize_units(value,desiredunit)
+        else:
+            return [qty.convert_to(desiredunit,inplace=False) for qty in value]
+    else:
+        return value.convert_to(desiredunit,inplace=inplace)
+
 class TimeSeries(AbstractField):
     time:Union[Duration,DateTimeArray]
     value:Union[PhysicalQty,List[PhysicalQty]]
@@ -542,6 +846,10 @@ class TimeSeries(AbstractField):
             assert len(self.time)==len(self.value)
         except TypeError:
             raise TypeError("Time and value in time series dont have same dimensions")
+
+    def convert_to(self,desiredunit,inplace= True):
+        """converts values of the quantity to the desired unit with one array operation per quantity"""
+        return _convert_quantities(self.value,desiredunit,inplace)
             
 class Profile(AbstractField):
     x:SpatialCoordinates
@@ -552,6 +860,10 @@ class Profile(AbstractField):
             assert len(self.x)==len(self.value)
         except TypeError:
             raise TypeError("location and value in time series does not have same dimensions")
+
+    def convert_to(self,desiredunit,inplace= True):
+        """converts values of the quantity to the desired unit with one array operation per quantity"""
+        return _convert_quantities(self.value,desiredunit,inplace)
             
 class Profile2D(AbstractField):
     x:SpatialCoordinates
@@ -562,7 +874,11 @@ class Profile2D(AbstractField):
         try:
             assert len(self.x)==len(self.y)==len(self.value)
         except TypeError:
-            raise TypeError("x,y and value in time series does not have same dimensions" )   
+            raise TypeError("x,y and value in time series does not have same dimensions" )
+
+    def convert_to(self,desiredunit,inplace= True):
+        """converts values of the quantity to the desired unit with one array operation per quantity"""
+        return _convert_quantities(self.value,desiredunit,inplace)
 
 class Profile3D(AbstractField):
     x:SpatialCoordinates
@@ -574,7 +890,11 @@ class Profile3D(AbstractField):
         try:
             assert len(self.x)==len(self.y)==len(self.value)
         except TypeError:
-            raise TypeError("x,y and value in time series does not have same dimensions" ) 
+            raise TypeError("x,y and value in time series does not have same dimensions" )
+
+    def convert_to(self,desiredunit,inplace= True):
+        """converts values of the quantity to the desired unit with one array operation per quantity"""
+        return _convert_quantities(self.value,desiredunit,inplace)
             
 class ExperessionField:
     """
@@ -627,6 +947,8 @@ def _user_defined_physical_qty(name,preferred_unit):
     """returns custom PhysicalQty child class for user defined physical qunatities"""
     class UserDefinedPhysicalQty(PhysicalQty):
         __post_init__ = functools.partialmethod(PhysicalQty.__post_init__, preferred_unit = preferred_unit)
+    #qualname points to the module level name so that instances can be pickled e.g. for process pools
+    UserDefinedPhysicalQty.__qualname__ = name
     return UserDefinedPhysicalQty
 
 
@@ -634,6 +956,7 @@ def _user_defined_physical_qty_range(name,preferred_unit):
     """returns custom PhysicalQtyRange child class for user defined physical qunatities"""
     class UserDefinedPhysicalQtyRange(PhysicalQtyRange):
         __post_init__ = functools.partialmethod(PhysicalQtyRange.__post_init__, preferred_unit = preferred_unit)
+    UserDefinedPhysicalQtyRange.__qualname__ = name+"Range"
     return UserDefinedPhysicalQtyRange
 
 #registry function to add new user defined quantities 
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""Parse throughput of unit strings.
+
+Run with ``python -m MatODM.UnitConverter.benchmark``.
+"""
+import time
+
+from .parser import UnitParser, compile_unit
+from .converter import clear_caches, convert2float
+
+# unit strings of tests/test_functional.py and of the unittests of MatODM
+CORPUS = ['°C', 'K', '°F', 'm', 'km', 'mm', 'µm', 'kg', 'mg', 'N*m', 'N*mm',
+          'kN*mm', 'daN*mm', 'mm^2', 'm^2', 'MPa*m^0.5', 'MPa*mm^0.5', 'MPa',
+          'GPa', 'mPa', 'N/mm2', 'g', 'g cm^-3', 'kg m^-3', 'kg/m^3',
+          'mN*µm^2', 'daN*mm^2', 'kN*m^-2', 'h', 'min', 'day', 's']
+
+
+def _throughput(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for unit in CORPUS:
+            func(unit)
+    return repeat * len(CORPUS) / (time.perf_counter() - start)
+
+
+def run(repeat: int = 200) -> dict:
+    """Unit strings parsed per second without and with the caches."""
+    clear_caches()
+    results = {"UnitParser.parse": _throughput(UnitParser().parse, repeat)}
+
+    def uncached(unit):
+        compile_unit.cache_clear()
+        return compile_unit(unit)
+    results["compile_unit (uncached)"] = _throughput(uncached, repeat)
+    results["compile_unit (cached)"] = _throughput(compile_unit, repeat)
+    results["convert2float (cached)"] = _throughput(
+        lambda unit: convert2float(1., unit, unit), repeat)
+    return results
+
+
+if __name__ == "__main__":
+    for name, rate in run().items():
+        print("%-26s %12.0f units/s" % (name, rate))
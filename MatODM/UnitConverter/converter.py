@@ -2,11 +2,14 @@
 # coding=utf-8
 
 """Converter object to handle string input."""
-from typing import Union
+from typing import Union, Tuple
 
 from decimal import Decimal as D
+from functools import lru_cache
 
-from .parser import QuantityParser, UnitParser
+from .exceptions import UnConsistentUnitsError
+from .parser import QuantityParser, UnitParser, parse_unit, compile_unit, _compile_simple_unit, _symbol_table
+from .units import DIMENSIONS, Quantity
 
 import numpy as np 
 
@@ -26,7 +29,7 @@ def convert(quantity: str, desired_unit: str) -> D:
     Decimal('2.78E+10')
     """
     quantity = QuantityParser().parse(quantity)
-    desired_unit = UnitParser().parse(desired_unit)
+    desired_unit = parse_unit(desired_unit)
     return quantity.convert(desired_unit).value
 
 
@@ -47,32 +50,120 @@ def converts(quantity: str, desired_unit: str) -> str:
     return str(convert(quantity, desired_unit))
 
 
+@lru_cache(maxsize=4096)
+def conversion_factors(unit: str, desired_unit: str, precise: bool = False) -> Tuple[float, float]:
+    """
+    Scale and offset converting values in unit to desired_unit as
+    value * scale + offset. Factors are computed once per pair of units
+    from the compiled units, or with Decimal arithmetic if precise.
+
+    :param unit:
+    :param desired_unit:
+    :param precise:
+    :return:
+
+    Examples :
+    ----------
+
+    >>> conversion_factors('°C', 'K')
+    (1.0, 273.15)
+    """
+    if precise:
+        from_unit = parse_unit(unit)
+        to_unit = parse_unit(desired_unit)
+        if not to_unit.is_same_dimension(from_unit):
+            raise UnConsistentUnitsError(to_unit.name, from_unit.name)
+        scale = from_unit.coef / to_unit.coef
+        offset = (from_unit.offset - to_unit.offset) / to_unit.coef
+        return float(scale), float(offset)
+    from_unit = compile_unit(unit)
+    to_unit = compile_unit(desired_unit)
+    if not to_unit.is_same_dimension(from_unit):
+        raise UnConsistentUnitsError(desired_unit, unit)
+    return (from_unit.scale / to_unit.scale,
+            (from_unit.offset - to_unit.offset) / to_unit.scale)
+
+
+def has_dimensions(unit: str, dimensions: dict) -> bool:
+    """
+    Checks that the unit has the given exponents of the base dimensions
+    L, M, T, I, THETA, N and J. Missing dimensions have exponent 0.
+
+    >>> has_dimensions('km*h^-1', {'L': 1, 'T': -1})
+    True
+    """
+    return compile_unit(unit).dimensions == tuple(dimensions.get(name, 0) for name in DIMENSIONS)
+
+
+def clear_caches():
+    """Clears cached units and conversion factors, e.g. after changing the units data."""
+    _symbol_table.cache_clear()
+    parse_unit.cache_clear()
+    compile_unit.cache_clear()
+    _compile_simple_unit.cache_clear()
+    conversion_factors.cache_clear()
+
+
+def convert_values(values: Union[int, float, list, np.ndarray], unit: str,
+                   desired_unit: str, out: np.ndarray = None,
+                   precise: bool = False) -> Union[float, np.ndarray]:
+    """
+    Converts scalar or array values from unit to desired_unit applying both
+    scale and offset of the units. Float arrays keep their dtype, other
+    values are converted to float64. Result is written into out if given,
+    out may be the values array itself to convert in place. With precise
+    factors are computed and scalars are converted with Decimal arithmetic.
+
+    :param values:
+    :param unit:
+    :param desired_unit:
+    :param out:
+    :param precise:
+    :return:
+
+    Examples :
+    ----------
+
+    >>> convert_values(np.array([0., 100.], dtype=np.float32), '°C', 'K')
+    array([273.15, 373.15], dtype=float32)
+    """
+    if out is None and not isinstance(values, (np.ndarray, list)):
+        if precise:
+            quantity = Quantity(D(str(values)), parse_unit(unit))
+            return float(quantity.convert(parse_unit(desired_unit)).value)
+        scale, offset = conversion_factors(unit, desired_unit)
+        return float(values) * scale + offset
+    scale, offset = conversion_factors(unit, desired_unit, precise)
+    values = np.asarray(values)
+    if out is None:
+        dtype = values.dtype if values.dtype.kind == "f" else np.float64
+        out = np.empty(values.shape, dtype=dtype)
+    np.multiply(values, scale, out=out)
+    if offset != 0:
+        np.add(out, offset, out=out)
+    return out
+
+
 def convert2float(quantity: Union[int,float,np.ndarray],
-                  unit: str, desired_unit: str)-> Union[int, float, np.ndarray]:
+                  unit: str, desired_unit: str, precise: bool = False)-> Union[int, float, np.ndarray]:
     
     """
 
     :param quantity:
     :param unit:
     :param desired_unit:
+    :param precise:
     :return:
 
     Examples :
     ----------
 
-    >>> from unit_converter import convert2float
-    >>> convert(2.78, 'daN*mm^2', 'mN*µm^2')
-    Decimal('2.78E+10')
+    >>> convert2float(2.5, 'kN*m^-2', 'N*m^-2')
+    2500.0
+    >>> convert2float(2.78, 'daN*mm^2', 'mN*µm^2', precise=True)
+    27800000000.0
     """
-    
-    if type(quantity).__name__ == "ndarray":
-        iquant = QuantityParser().parse(f"1 {unit}")
-        desired_unit = UnitParser().parse(desired_unit)
-        return quantity * float(iquant.convert(desired_unit).value)
-    else:
-        iquant = QuantityParser().parse(f"{quantity} {unit}")
-        desired_unit = UnitParser().parse(desired_unit)
-        return float(iquant.convert(desired_unit).value)
+    return convert_values(quantity, unit, desired_unit, precise=precise)
         
 
 if __name__ == "__main__":
@@ -3,24 +3,91 @@
 
 import re
 from decimal import Decimal as D
-from functools import reduce
+from functools import reduce, lru_cache
 
 from .data import PREFIXES, UNITS
 from .exceptions import UnitDoesntExistError
-from .units import Unit, Quantity
+from .units import Unit, Quantity, CompiledUnit
 
 
 def parse(quantity: str) -> Quantity:
     return QuantityParser().parse(quantity)
 
 
+@lru_cache(maxsize=1024)
+def parse_unit(unit: str) -> Unit:
+    """Parse an unit string once and reuse the result.
+
+    Returned units are shared between callers and must not be modified.
+    """
+    return UnitParser().parse(unit)
+
+
+@lru_cache(maxsize=1024)
+def compile_unit(unit: str) -> CompiledUnit:
+    """Parse an unit string to a compiled unit.
+
+    Decimal arithmetic is only used once per simple unit symbol, composite
+    units are combined with float arithmetic. A unit following '/' is divided.
+    """
+    compiled = None
+    for div, symbol, power in UnitParser.unit_re.findall(unit):
+        simple = _compile_simple_unit(symbol)
+        power = float(power) if power != '' else 1
+        if div:
+            power = -power
+        if power != 1:
+            simple = simple ** power
+        compiled = simple if compiled is None else compiled * simple
+    if compiled is None:
+        raise UnitDoesntExistError(unit)
+    return compiled
+
+
+@lru_cache(maxsize=1024)
+def _compile_simple_unit(unit_s: str) -> CompiledUnit:
+    return CompiledUnit.from_unit(UnitParser._parse_simple_unit(unit_s))
+
+
+@lru_cache(maxsize=1)
+def _symbol_table() -> tuple:
+    """Table of all prefix+unit symbols and of the ambiguous ones.
+
+    A symbol which can be read as different prefix and unit combinations is
+    resolved to the reading with the longest unit symbol. The shipped units
+    have no such symbols, they appear when units are added to UNITS, e.g.
+    with the annum 'a' added 'Pa' stays pascal and is not read as peta-annum.
+    """
+    readings = {}
+    for prefix in PREFIXES.keys():
+        for unit in UNITS.keys():
+            readings.setdefault(prefix + unit, []).append((prefix, unit))
+    table = {}
+    ambiguous = {}
+    for symbol, options in readings.items():
+        options.sort(key=lambda option: (-len(option[1]), option[1]))
+        prefix, unit = options[0]
+        table[symbol] = PREFIXES[prefix] * UNITS[unit]
+        if len(options) > 1:
+            ambiguous[symbol] = options
+    return table, ambiguous
+
+
+def ambiguous_symbols() -> dict:
+    """Unit symbols with more than one (prefix, unit) reading.
+
+    Readings are in order of preference, the first one is used by the parser.
+    """
+    return {symbol: list(options) for symbol, options in _symbol_table()[1].items()}
+
+
 class QuantityParser(object):
 
     quantity_re = re.compile("(?P<value>\d+[.,]?\d*)? *(?P<unit>.*)")
 
     def parse(self, quantity: str) -> Quantity:
         r = self.quantity_re.match(quantity)
-        unit = UnitParser().parse(r.group("unit"))
+        unit = parse_unit(r.group("unit"))
         if r.group("value") is not None:
             if ',' in r.group("value"):
                 value = D(r.group("value").replace(',', '.'))
@@ -32,15 +99,17 @@ class QuantityParser(object):
 
 
 class UnitParser(object):
-    unit_re = re.compile("(?P<unit>[a-zA-Z°Ωµ%]+)\^?(?P<pow>[-+]?[0-9]*\.?[0-9]*)")
+    unit_re = re.compile("(?P<div>/?) *(?P<unit>[a-zA-Z°Ωµ%]+)\^?(?P<pow>[-+]?[0-9]*\.?[0-9]*)")
 
     def parse(self, unit: str) -> Unit:
         l_unit_s = self.unit_re.findall(unit)
-        l_unit = [self._parse_unit(unit, power) for unit, power in l_unit_s]
+        l_unit = [self._parse_unit(unit, power, div) for div, unit, power in l_unit_s]
         return reduce(lambda x, y: x * y, l_unit)
 
-    def _parse_unit(self, unit: str, power: str) -> Unit:
-        if power is '':
+    def _parse_unit(self, unit: str, power: str, div: str = '') -> Unit:
+        if div:
+            return self._parse_simple_unit(unit) ** -float(power or 1)
+        if power == '':
             return self._parse_simple_unit(unit)
         else:
             return self._parse_simple_unit(unit) ** float(power)
@@ -49,16 +118,10 @@ class UnitParser(object):
     def _parse_simple_unit(unit_s: str) -> Unit:
         """Parse a simple unit.
 
-        In other word, parse an unit without a power value.
+        In other word, parse an unit without a power value. The symbol is
+        looked up in the precompiled table of all prefix+unit symbols.
         """
-        unit = None
-        for prefix in PREFIXES.keys():
-            if unit_s.startswith(prefix) and unit_s[len(prefix):] in UNITS.keys():
-                unit = UNITS[unit_s[len(prefix):]]
-                prefix = PREFIXES[prefix]
-                break
-        
+        unit = _symbol_table()[0].get(unit_s)
         if unit is None:
             raise UnitDoesntExistError(unit_s)
-
-        return prefix*unit
+        return unit
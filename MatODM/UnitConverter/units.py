@@ -204,3 +204,64 @@ class Quantity(object):
 
     def __rtruediv__(self, other):
         return self.__truediv__(other)
+
+
+DIMENSIONS = ("L", "M", "T", "I", "THETA", "N", "J")
+
+
+class CompiledUnit(object):
+    """Unit compiled to a tuple of dimension exponents with float scale and offset.
+
+    Compiled units are immutable and interned: equal units are the same
+    object, so that they can be compared and hashed in constant time.
+    """
+
+    __slots__ = ("dimensions", "scale", "offset")
+    _interned = {}
+
+    def __new__(cls, dimensions, scale=1., offset=0.):
+        key = (tuple(dimensions), float(scale), float(offset))
+        unit = cls._interned.get(key)
+        if unit is None:
+            unit = object.__new__(cls)
+            object.__setattr__(unit, "dimensions", key[0])
+            object.__setattr__(unit, "scale", key[1])
+            object.__setattr__(unit, "offset", key[2])
+            unit = cls._interned.setdefault(key, unit)
+        return unit
+
+    @classmethod
+    def from_unit(cls, unit):
+        return cls(tuple(getattr(unit, name) for name in DIMENSIONS),
+                   unit.coef, unit.offset)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("compiled units are immutable")
+
+    def __reduce__(self):
+        return (self.__class__, (self.dimensions, self.scale, self.offset))
+
+    def __repr__(self):
+        return ("CompiledUnit(dimensions=%s, scale=%r, offset=%r)" %
+                (self.dimensions, self.scale, self.offset))
+
+    def is_same_dimension(self, other_unit):
+        return self.dimensions == other_unit.dimensions
+
+    def __mul__(self, other):
+        if isinstance(other, CompiledUnit):
+            return self.__class__(tuple(a + b for a, b in zip(self.dimensions, other.dimensions)),
+                                  self.scale * other.scale,
+                                  self.offset + other.offset)
+        else:
+            raise TypeError("unsupported operand type(s) for : '%s' and '%s'" %
+                            (type(self), type(other)))
+
+    def __pow__(self, power):
+        if type(power) in (int, float):
+            return self.__class__(tuple(d * power for d in self.dimensions),
+                                  self.scale ** power,
+                                  self.offset ** power if self.offset else 0.)
+        else:
+            raise TypeError("unsupported operand type(s) for : '%s' and '%s'" %
+                            (type(self), type(power)))
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import MatODM
 import json
+from copy import deepcopy
 from dataclasses import dataclass
 from typing import Union
 import numpy as np 
@@ -128,9 +129,18 @@ def set_property(name):
     """
     def setter(self,val):
         check_annotation(name,val,self.annotations[name])
-        if hasattr(self.field_validators):
+        if hasattr(self,"field_validators"):
             validate = self.field_validators.get(name,None)
-            if validate!=None: validate
+            if validate!=None: validate(val)
+        #stored documents assigned to relational fields are referenced like in __post_init__ of documents
+        if (name in (getattr(self,"relational_fields",None) or []) and not isinstance(val,RelationalData)
+            and hasattr(val,"ODM_doc_type") and getattr(val,"_id",None) is not None):
+            val = RelationalData.init_from_odm_doc(val)
+        #record assigned fields for partial updates of documents
+        if self._track_dirty_fields:
+            self.__dict__.setdefault("_dirty_fields",set()).add(name)
+            lazy = self.__dict__.get("_lazy_snapshot")
+            if lazy: lazy.discard(name)
         return setattr(self,"_"+name,val)
     return setter
 
@@ -139,7 +149,13 @@ def get_property(name):
     get property decorator for the ODM metaclasses
     """
     def getter(self):
-        return getattr(self,"_"+name)
+        val = getattr(self,"_"+name)
+        #stored documents snapshot mutable values before they can be changed in place, see Document._mark_clean
+        lazy = self.__dict__.get("_lazy_snapshot")
+        if lazy and name in lazy:
+            lazy.discard(name)
+            self.__dict__["_clean_values"][name] = deepcopy(val)
+        return val
     return getter 
 
 def del_property(name):
@@ -165,6 +181,8 @@ class MetaODM(type):
       newcls=dataclass(super().__new__(cls, name, bases, dct))
       if not hasattr(newcls,"__skip_type_checks__" ):
            newcls.__skip_type_checks__ = []
+      if not hasattr(newcls,"_track_dirty_fields"):
+           newcls._track_dirty_fields = False
       if hasattr(newcls,"__annotations__"):
           vardict.update(newcls.__annotations__)
       if hasattr(newcls,"relational_fields"):
@@ -97,6 +97,95 @@ class Other_tests(unittest.TestCase):
         print("***Here is an example of new physical qunatity Strength given with range of value instead of value")
         print(_)
         
+    def test_unit_conversion_cache(self):
+        from MatODM.UnitConverter import converter
+        converter.clear_caches()
+        self.assertEqual(converter.conversion_factors("°C","K"),(1.0,273.15))
+        self.assertEqual(fld.PhysicalQty(250.,"kPa",preferred_unit="MPa").value,0.25)
+        fld.PhysicalQty(2.,"kPa").convert_to("MPa")
+        self.assertEqual(converter.conversion_factors.cache_info().hits,1)
+        self.assertEqual(fld.Duration(2,"h").unit,"h")
+        with self.assertRaises(ValueError):
+            fld.Duration(2,"mm")
+
+    def test_array_conversion(self):
+        import numpy as np
+        qty = fld.PhysicalQty(np.array([0.,100.],dtype=np.float32),"°C")
+        qty.convert_to("K")
+        self.assertEqual(qty.value.dtype,np.float32)
+        self.assertTrue(np.allclose(qty.value,[273.15,373.15]))
+        profile = fld.Profile(fld.SpatialCoordinates([0,1],"m"),fld.PhysicalQty([20.,25.],"°C"))
+        profile.convert_to("K")
+        self.assertTrue(np.allclose(profile.value.value,[293.15,298.15]))
+        qty_range = fld.PhysicalQtyRange(1,2,"m",preferred_unit="mm")
+        self.assertEqual((qty_range.min_value,qty_range.max_value,qty_range.unit),(1000.,2000.,"mm"))
+
+    def test_compiled_units(self):
+        from MatODM.UnitConverter.parser import compile_unit
+        from MatODM.UnitConverter.converter import conversion_factors
+        self.assertIs(compile_unit("kN*m^-2"),compile_unit("kN m^-2"))
+        self.assertEqual(compile_unit("kg/m^3").dimensions,(-3,1,0,0,0,0,0))
+        self.assertEqual(conversion_factors("kg/m^3","g*cm^-3",precise=True),(0.001,0.))
+        self.assertAlmostEqual(conversion_factors("kg/m^3","g*cm^-3")[0],0.001,places=15)
+
+    def test_ambiguous_unit_symbols(self):
+        from MatODM.UnitConverter import data, parser, converter
+        self.assertEqual(parser.ambiguous_symbols(),{})
+        data.UNITS["a"] = data.Unit("a","annum",T=1,coef=data.D("31536000"))
+        try:
+            converter.clear_caches()
+            ambiguous = parser.ambiguous_symbols()
+            self.assertEqual(ambiguous,{"Pa":[("","Pa"),("P","a")]})
+            for symbol,readings in ambiguous.items():
+                self.assertEqual(len(readings[0][1]),max(len(unit) for _,unit in readings))
+            self.assertEqual(converter.convert2float(1,"Pa","kPa"),0.001)
+            self.assertEqual(converter.convert2float(1,"ka","year"),1000.)
+            with self.assertRaises(ValueError):
+                converter.convert2float(1,"Pa","s")
+        finally:
+            data.UNITS.pop("a")
+            converter.clear_caches()
+
+    def test_normalize_units(self):
+        import numpy as np
+        amounts = {"cement":fld.PhysicalQty(300.,"kg/m^3"),"water":fld.PhysicalQty(0.15,"g/cm^3"),
+                   "sand":fld.PhysicalQty(np.array([700.,710.]),"kg/m^3"),"air":None}
+        converted = fld.normalize_units(amounts,"g/cm^3",inplace=False)
+        self.assertEqual(amounts["cement"].unit,"kg/m^3")
+        self.assertAlmostEqual(converted["cement"].value,0.3)
+        self.assertTrue(np.allclose(converted["sand"].value,[0.7,0.71]))
+        self.assertIsNone(converted["air"])
+        temperatures = [fld.PhysicalQty(20,"°C"),fld.PhysicalQty(300.,"K"),fld.PhysicalQty(25.,"°C")]
+        fld.to_common_unit(temperatures)
+        self.assertEqual([qty.unit for qty in temperatures],["°C"]*3)
+        self.assertAlmostEqual(temperatures[1].value,26.85)
+
+    def test_physical_qty_array(self):
+        import numpy as np
+        loads = fld.PhysicalQtyArray([10.,20.,30.],"kN",[1.,1.,2.])
+        self.assertEqual((loads > fld.PhysicalQty(15000.,"N")).tolist(),[False,True,True])
+        self.assertEqual(loads[1],fld.PhysicalQty(20.,"kN",1.))
+        self.assertTrue(loads[loads >= 20.].equals(fld.PhysicalQtyArray([20.,30.],"kN",[1.,2.])))
+        self.assertEqual((loads + fld.PhysicalQtyArray([1000.,0.,0.],"N")).value.tolist(),[11.,20.,30.])
+        self.assertEqual(loads.convert_to("N",inplace=False).std_dev.tolist(),[1000.,1000.,2000.])
+        self.assertTrue(fld.PhysicalQtyArray.doc2obj(loads.serialize()).equals(loads))
+        mixed = fld.PhysicalQtyArray.from_quantities([fld.PhysicalQty(1.,"kN"),None,fld.PhysicalQty(500.,"N")])
+        self.assertEqual(mixed.unit,"kN")
+        self.assertTrue(np.isnan(mixed.value[1]))
+        self.assertEqual(mixed.mean(),fld.PhysicalQty(0.75,"kN"))
+        self.assertEqual(mixed.std(),fld.PhysicalQty(float(np.std([1.,0.5],ddof=1)),"kN"))
+        self.assertIsNone(fld.PhysicalQtyArray([1.],"kN").std())
+        remaining = 40. - loads
+        self.assertEqual(remaining.value.tolist(),[30.,20.,10.])
+        self.assertEqual(remaining.std_dev.tolist(),[1.,1.,2.])
+        self.assertEqual((np.array([40.,40.,40.]) - loads).value.tolist(),[30.,20.,10.])
+        compliance = 1/loads
+        self.assertEqual(compliance.unit,"kN^-1")
+        self.assertEqual(compliance.convert_to("N^-1",inplace=False).value.tolist(),[1e-4,5e-5,1e-4/3])
+        self.assertTrue(np.allclose(compliance.std_dev,[0.01,0.0025,2/900]))
+        total = loads + fld.PhysicalQtyArray([0.,0.,0.],"N",[3000.,0.,0.])
+        self.assertTrue(np.allclose(total.std_dev,[np.sqrt(10.),1.,2.]))
+
     def test_expression_field(self):
         y = fld.ExperessionField()
         y>=fld.PhysicalQty(100,"MPa")
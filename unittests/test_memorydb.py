@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+"""
+Test for in-memory database backend of ODM.
+"""
+import sys
+sys.path.append("..")
+from MatODM import Documents as Doc
+from MatODM import Fields as fld
+from MatODM.Databases import MemoryDatabase, ConflictError
+from typing import Dict
+import tempfile
+from unittest import mock
+import unittest
+
+class Strength(Doc.Document):
+    collection="strengths"
+    name:str
+    age:int
+    strength:fld.PhysicalQty
+
+class Mixture(Doc.Document):
+    collection="mixtures"
+    name:str
+    constituents:Dict[str,fld.PhysicalQty]
+    comment:str = None
+
+class Sample(Doc.Document):
+    collection="samples"
+    key_for_checking_duplicates = "name"
+    name:str
+    age:int
+
+class MixDesign(Doc.Document):
+    collection="mixdesigns"
+    name:str
+    water_binder_ratio:float
+
+class Cube(Doc.Document):
+    collection="cubes"
+    relational_fields=["mix"]
+    mix:MixDesign
+    strength:fld.PhysicalQty
+
+class Report(Doc.Document):
+    collection="reports"
+    relational_fields=["cube"]
+    cube:Cube
+    title:str
+
+Doc.Strength = Strength
+Doc.Report = Report
+Doc.MixDesign = MixDesign
+Doc.Cube = Cube
+Doc.Sample = Sample
+Doc.Mixture = Mixture
+
+class ForgetfulDatabase(MemoryDatabase):
+    """removes the collection object itself when the collection is dropped like some backends do"""
+    def _del_collection_from_db(self,collection_name:str):
+        super()._del_collection_from_db(collection_name)
+        self.collections.pop(collection_name)
+
+class TestMemoryDatabase(unittest.TestCase):
+
+    def setUp(self):
+        self.db = MemoryDatabase("testdb")
+        self.db.create_collection("strengths",hash_indexes=["name"],sorted_indexes=["age","strength.value"])
+        docs = [Strength(f"s{i}",i,fld.PhysicalQty(float(10*i),"MPa")) for i in range(10)]
+        self.docs = self.db.insert_multiple(docs)
+
+    def test_insert_and_get(self):
+        self.assertEqual(self.db.get_collection("strengths").ndocs,10)
+        doc = self.db.get_doc("strengths",self.docs[3]._id)
+        self.assertEqual(doc.name,"s3")
+        self.assertEqual(doc.strength,fld.PhysicalQty(30.,"MPa"))
+
+    def test_find_with_example_template(self):
+        template = Strength.example_template()
+        template.name = "s5"
+        self.assertEqual([doc.age for doc in self.db.find(template)],[5])
+
+    def test_range_query(self):
+        template = Strength.range_query_template()
+        template.age >= 2
+        template.age < 5
+        self.assertEqual(sorted(doc.name for doc in self.db.range_query(template)),["s2","s3","s4"])
+        template = Strength.range_query_template()
+        template.strength >= fld.PhysicalQty(65.,"MPa")
+        self.assertEqual(sorted(doc.age for doc in self.db.range_query(template)),[7,8,9])
+        docs = self.db.find_in_range_of_field("strengths","strength",fld.PhysicalQty(10.,"MPa"),fld.PhysicalQty(20.,"MPa"))
+        self.assertEqual(sorted(doc.age for doc in docs),[1,2])
+
+    def test_range_query_with_other_stored_units(self):
+        self.db.insert_multiple([Strength("kpa",10,fld.PhysicalQty(30000.,"kPa")),Strength("gpa",11,fld.PhysicalQty(0.02,"GPa"))])
+        template = Strength.range_query_template()
+        template.strength >= fld.PhysicalQty(25.,"MPa")
+        template.strength < fld.PhysicalQty(0.065,"GPa")
+        self.assertEqual(sorted(doc.name for doc in self.db.range_query(template)),["kpa","s3","s4","s5","s6"])
+        self.assertIn("OR",self.db.range_query(template,explain=True)["query"])
+        self.assertEqual(self.db.update_where(template,{"name":"mid"},dry_run=True),5)
+        self.assertEqual(self.db.delete_where(template),5)
+        self.assertEqual(sorted(doc["name"] for doc in self.db.get_collection("strengths").find({})),
+                         ["gpa","s0","s1","s2","s7","s8","s9"])
+
+    def test_indexes_follow_updates_and_deletes(self):
+        doc = self.docs[4]
+        doc.age = 40
+        self.db.update(doc)
+        coll = self.db.get_collection("strengths")
+        self.assertEqual(len(coll.find_in_range_of_field("age",40,40,False)),1)
+        self.assertEqual(len(coll.find_in_range_of_field("age",4,4,False)),0)
+        template = Strength.range_query_template()
+        template.age <= 1
+        self.assertEqual(self.db.delete_where(template),2)
+        self.assertEqual(coll.ndocs,8)
+        self.assertFalse(coll.has_doc_with_key("name","s0"))
+        self.assertEqual(self.db.delete_all_documents_from_collection("strengths"),8)
+        self.assertEqual(coll.get_doc_with_key("name","s5"),[])
+
+    def test_explain_and_profile(self):
+        template = Strength.range_query_template()
+        template.age >= 7
+        plan = self.db.range_query(template,explain=True)
+        self.assertEqual(plan["indexes"],["age"])
+        self.assertFalse(plan["full_scan"])
+        self.assertEqual(plan["estimated_rows"],3)
+        plan = self.db.get_doc_with_key("strengths","name","s2",profile=True)
+        self.assertEqual(plan["indexes"],["name"])
+        self.assertEqual(plan["rows_returned"],1)
+        self.assertEqual(set(plan["timing"]),{"server","network","decode","construct"})
+        template = Strength.example_template()
+        template.strength = fld.PhysicalQty(20.,"MPa")
+        self.assertTrue(self.db.find(template,explain=True)["full_scan"])
+
+    def test_update_with_version_check(self):
+        doc = self.db.get_doc("strengths",self.docs[2]._id)
+        stale = self.db.get_doc("strengths",self.docs[2]._id)
+        doc.age = 20
+        self.assertEqual(self.db.update(doc).version,1)
+        stale.age = 21
+        with self.assertRaises(ConflictError):
+            self.db.update(stale)
+        self.assertEqual(stale.version,0)
+        self.assertEqual(self.db.get_doc("strengths",doc._id).age,20)
+        self.assertEqual([doc.version for doc in self.db.update_multiple(self.docs[5:8])],[0,0,0])
+        for doc in self.docs[5:8]: doc.age += 10
+        self.assertEqual([doc.version for doc in self.db.update_multiple(self.docs[5:8])],[1,1,1])
+
+    def test_partial_updates(self):
+        self.db.create_collection("mixtures")
+        mix = self.db.insert(Mixture("m1",{"cement":fld.PhysicalQty(300.,"kg"),"water":fld.PhysicalQty(150.,"kg")},"old"))
+        self.assertEqual(mix.dirty_fields(),[])
+        self.assertEqual(self.db.update(mix).version,0)
+        mix.constituents["water"].value = 160.
+        del mix.constituents["cement"]
+        mix.comment = None
+        self.assertEqual(mix.dirty_fields(),["comment","constituents"])
+        self.assertEqual(set(mix.serialize_patch())-{"_id","_key","version","created_on","revised_on","change_stamp","ODM_doc_type"},
+                         {"comment","constituents"})
+        self.db.update(mix)
+        stored = self.db.get_doc("mixtures",mix._id,return_as_obj=False)
+        self.assertEqual(stored["version"],1)
+        self.assertEqual(list(stored["constituents"]),["water"])
+        self.assertEqual(stored["constituents"]["water"]["value"],160.)
+        self.assertNotIn("comment",stored)
+        loaded = self.db.get_doc("mixtures",mix._id)
+        self.assertEqual(loaded.dirty_fields(),[])
+        self.assertNotIn("constituents",loaded._clean_values)
+        loaded.constituents["water"].value = 170.
+        self.assertEqual(loaded.dirty_fields(),["constituents"])
+        self.assertNotIn("_dirty_fields",vars(loaded.constituents["water"]))
+
+    def test_in_filter(self):
+        coll = self.db.get_collection("strengths")
+        names = sorted(doc["name"] for doc in coll.range_query([("name","in",["s1","s4","x"]),("age","lt",4)]))
+        self.assertEqual(names,["s1"])
+        ids = [self.docs[2]._id,self.docs[5]._id]
+        self.assertEqual(sorted(doc["_id"] for doc in coll.range_query([("_id","in",ids)])),sorted(ids))
+        self.assertEqual(coll.delete_where([("age","in",[7,8,100])]),2)
+
+    def test_upsert(self):
+        self.db.create_collection("samples")
+        first = self.db.insert(Sample("a",1))
+        self.assertEqual((first.version,first.revised_on),(0,None))
+        docs = self.db.insert_multiple([Sample("a",2),Sample("b",3)])
+        self.assertEqual([doc.version for doc in docs],[1,0])
+        self.assertEqual(docs[0]._id,first._id)
+        self.assertEqual(docs[0].created_on,first.created_on)
+        self.assertIsNotNone(docs[0].revised_on)
+        self.assertEqual(self.db.get_collection("samples").ndocs,2)
+        self.assertEqual(self.db.get_doc("samples",first._id).age,2)
+        with self.assertRaises(ValueError):
+            self.db.insert(Sample(None,4))
+        self.assertEqual(self.db.get_doc("samples",first._id).age,2)
+        keyed = Strength("s1",11,fld.PhysicalQty(1.,"MPa"))
+        keyed._key = self.docs[1]._key
+        with self.assertRaises(ValueError):
+            self.db.upsert_multiple([keyed,Sample(None,5)])
+        self.assertEqual(self.db.get_doc("strengths",self.docs[1]._id).age,1)
+
+    def test_changes_since(self):
+        changes, token = self.db.changes_since("strengths",limit=4)
+        self.assertEqual([change["type"] for change in changes],["insert"]*4)
+        self.assertEqual(len(self.db.changes_since("strengths",token)[0]),6)
+        changes, token = self.db.changes_since("strengths")
+        doc = self.docs[0]
+        doc.age = 100
+        self.db.update(doc)
+        template = Strength.example_template()
+        template.name = "s1"
+        self.db.delete_where(template)
+        changes, token = self.db.changes_since("strengths",token)
+        self.assertEqual([(change["type"],change["_id"]) for change in changes],
+                         [("update",self.docs[0]._id),("delete",self.docs[1]._id)])
+        self.assertEqual(changes[0]["doc"]["age"],100)
+        self.assertEqual(self.db.changes_since("strengths",token),([],token))
+
+    def test_update_where(self):
+        changes, token = self.db.changes_since("strengths")
+        template = Strength.range_query_template()
+        template.age >= 7
+        self.assertEqual(self.db.update_where(template,{"name":"high"},dry_run=True),3)
+        self.assertEqual(self.db.update_where(template,{"name":"high","strength.unit":"N/mm2"}),3)
+        doc = self.db.get_doc("strengths",self.docs[8]._id)
+        self.assertEqual((doc.name,doc.version,doc.strength),("high",self.docs[8].version+1,fld.PhysicalQty(80.,"N/mm2")))
+        self.assertEqual(self.db.get_doc("strengths",self.docs[6]._id).name,"s6")
+        changes, token = self.db.changes_since("strengths",token,limit=2)
+        self.assertEqual(len(changes),3)
+        self.assertEqual(len({change["change_stamp"] for change in changes}),1)
+        with self.assertRaises(ValueError):
+            self.db.update_where(template,{"version":1})
+
+    def test_preferred_unit_on_load(self):
+        template = Strength.range_query_template()
+        template.age >= 7
+        self.db.update_where(template,{"strength.preferred_unit":"kPa"},bump_version=False)
+        template = Strength.range_query_template()
+        template.age >= 9
+        self.db.update_where(template,{"strength.unit":"N/mm2"},bump_version=False)
+        template = Strength.range_query_template()
+        template.age >= 7
+        with mock.patch.object(fld,"normalize_units",wraps=fld.normalize_units) as normalize_units:
+            docs = sorted(self.db.range_query(template),key=lambda doc:doc.age)
+        self.assertEqual(normalize_units.call_count,1)
+        self.assertEqual([doc.strength.unit for doc in docs],["kPa"]*3)
+        self.assertEqual([doc.strength.value for doc in docs],[70000.,80000.,90000.])
+        self.assertEqual([doc.dirty_fields() for doc in docs],[[]]*3)
+        self.assertEqual(fld.PhysicalQty(1.,"MPa",preferred_unit="kPa").value,1000.)
+
+    def test_query_cache(self):
+        self.db.enable_query_cache(max_entries=2)
+        template = Strength.range_query_template()
+        template.age >= 7
+        self.assertEqual(len(self.db.range_query(template)),3)
+        self.assertEqual(len(self.db.range_query(template)),3)
+        self.assertEqual(self.db.query_cache_stats()["hits"],1)
+        self.db.insert(Strength("s10",10,fld.PhysicalQty(100.,"MPa")))
+        self.assertEqual(len(self.db.range_query(template)),4)
+        stats = self.db.query_cache_stats()
+        self.assertEqual((stats["hits"],stats["misses"],stats["invalidations"]),(1,2,1))
+        rows = self.db.range_query(template,return_as_obj=False)
+        rows[0]["age"] = -1
+        self.assertNotIn(-1,[row["age"] for row in self.db.range_query(template,return_as_obj=False)])
+        for name in ("s1","s2","s3"):
+            template = Strength.example_template()
+            template.name = name
+            self.db.find(template)
+        self.assertEqual(self.db.query_cache_stats()["entries"],2)
+        self.assertEqual(self.db.query_cache_stats()["evictions"],2)
+        self.db.disable_query_cache()
+        with self.assertRaises(ValueError):
+            self.db.query_cache_stats()
+
+    def test_join(self):
+        self.db.create_collection("mixdesigns")
+        self.db.create_collection("cubes")
+        mixes = self.db.insert_multiple([MixDesign("low",0.35),MixDesign("high",0.5)])
+        cubes = [Cube(mixes[i%2],fld.PhysicalQty(float(40+i),"MPa")) for i in range(4)]
+        self.db.insert_multiple(cubes)
+        template = MixDesign.range_query_template()
+        template.water_binder_ratio < 0.4
+        rows = self.db.join(Cube.range_query_template()).follow("mix",template).run()
+        self.assertEqual(sorted(row["doc"].strength.value for row in rows),[40.,42.])
+        self.assertEqual({row["mix"].name for row in rows},{"low"})
+        self.db.delete_where(MixDesign.example_template())
+        rows = self.db.join(Cube.example_template()).follow("mix").run(return_as_obj=False)
+        self.assertEqual([row["mix"] for row in rows],[None]*4)
+        with self.assertRaises(ValueError):
+            self.db.join(Cube.example_template()).follow("strength")
+
+    def test_graph_traversal(self):
+        self.db.enable_graph()
+        for name in ("mixdesigns","cubes","reports"): self.db.create_collection(name)
+        mix = self.db.insert(MixDesign("low",0.35))
+        cubes = self.db.insert_multiple([Cube(mix,fld.PhysicalQty(40.,"MPa")),Cube(mix,fld.PhysicalQty(41.,"MPa"))])
+        report = self.db.insert(Report(cubes[0],"r1"))
+        self.assertEqual([doc.name for doc in self.db.traverse(report,2,doc_types=["MixDesign"])],["low"])
+        docs = self.db.traverse(mix,depth=2,direction="inbound")
+        self.assertEqual([type(doc).__name__ for doc in docs],["Cube","Cube","Report"])
+        self.assertEqual([doc.title for doc in self.db.traverse(mix._id,3,"inbound",[Report])],["r1"])
+        self.assertEqual(len(self.db.traverse(cubes[1],depth=3,direction="any")),3)
+        report.cube = cubes[1]
+        self.db.update(report)
+        self.assertEqual(self.db.traverse(report,return_as_obj=False)[0]["_id"],cubes[1]._id)
+        edges = self.db.get_collection("odm_edges")
+        self.assertEqual(edges.ndocs,3)
+        template = Cube.example_template()
+        template._id = cubes[1]._id
+        self.db.delete_where(template)
+        self.assertEqual(self.db.traverse(report,depth=2),[])
+        self.assertEqual(edges.ndocs,1)
+
+    def test_get_docs(self):
+        ids = [self.docs[i]._id for i in (7,2,7)]+["strengths/missing","nocollection/1"]
+        docs = self.db.get_docs(ids,chunk_size=2,workers=2)
+        self.assertEqual([None if doc is None else doc.name for doc in docs],["s7","s2","s7",None,None])
+        with self.assertRaises(ValueError):
+            self.db.get_docs(ids,raise_missing=True)
+        docs = self.db.get_docs_with_key("strengths","name",["s3","x","s1"],return_as_obj=False)
+        self.assertEqual([None if doc is None else doc["age"] for doc in docs],[3,None,1])
+
+    def test_get_column(self):
+        doc = self.docs[9]
+        doc.strength = fld.PhysicalQty(90000.,"kPa")
+        self.db.update(doc)
+        template = Strength.range_query_template()
+        template.age >= 5
+        strengths = self.db.get_column(template,"strength")
+        self.assertEqual(strengths.unit,"MPa")
+        self.assertEqual(sorted(strengths.value.tolist()),[50.,60.,70.,80.,90.])
+        self.assertEqual(len(strengths[strengths > fld.PhysicalQty(65.,"MPa")]),3)
+        self.assertEqual(strengths.convert_to("GPa",inplace=False).max(),fld.PhysicalQty(0.09,"GPa"))
+        template = Strength.range_query_template()
+        template.age >= 100
+        self.assertEqual(len(self.db.get_column(template,"strength")),0)
+
+    def test_chunked_storage(self):
+        self.db.enable_chunked_storage(threshold=10,chunk_size=4)
+        doc = self.db.insert(Strength("series",1,fld.PhysicalQty([float(i) for i in range(25)],"MPa")))
+        chunks = self.db.get_collection("odm_chunks")
+        raw = self.db.get_doc("strengths",doc._id,return_as_obj=False)
+        self.assertEqual(raw["strength"]["value"]["length"],25)
+        self.assertEqual(raw["strength"]["value"]["max"],24.)
+        self.assertEqual(len(chunks.find({"parent":doc._id})),7)
+        self.assertEqual(list(self.db.load_chunks([raw])[0]["strength"]["value"]),[float(i) for i in range(25)])
+        stored = self.db.get_doc("strengths",doc._id)
+        self.assertEqual(list(stored.strength.value),[float(i) for i in range(25)])
+        stored.strength = fld.PhysicalQty([1.]*11,"MPa")
+        self.db.update(stored)
+        self.assertEqual(list(self.db.get_doc("strengths",doc._id).strength.value),[1.]*11)
+        self.assertEqual(len(chunks.find({"parent":doc._id})),3)
+        deletes = []
+        delete_where = chunks.delete_where
+        chunks.delete_where = lambda filters,**kwargs: deletes.append(filters) or delete_where(filters,**kwargs)
+        stored.age = 2
+        self.db.update(stored)
+        self.assertEqual(deletes,[])
+        template = Strength.range_query_template()
+        template.age <= 2
+        self.db.delete_where(template)
+        self.assertEqual(len(deletes),1)
+        self.assertEqual(len(chunks.find({"parent":doc._id})),0)
+
+    def test_del_collection(self):
+        db = ForgetfulDatabase("testdb")
+        db.create_collection("strengths")
+        db.enable_chunked_storage(threshold=10,chunk_size=4)
+        db.insert(Strength("series",1,fld.PhysicalQty([float(i) for i in range(25)],"MPa")))
+        changes, token = db.changes_since("strengths")
+        db.del_collection("strengths")
+        self.assertFalse(db.has_collection("strengths"))
+        self.assertEqual(db.get_collection("odm_chunks").ndocs,0)
+        self.assertEqual([change["type"] for change in db.changes_since("strengths",token)[0]],["clear"])
+
+    def test_random_docs(self):
+        sample = self.db.get_random_docs("strengths",3,seed=42,return_as_obj=False)
+        self.assertEqual(len(sample),3)
+        self.assertEqual(sample,self.db.get_random_docs("strengths",3,seed=42,return_as_obj=False))
+
+    def test_aggregate_with_unit_conversion(self):
+        self.db.insert(Strength("gpa",1,fld.PhysicalQty(0.1,"GPa")))
+        template = Strength.range_query_template()
+        template.age <= 1
+        rows = sorted(self.db.aggregate("strengths",["age"],{"strength":["mean","count","std"]},"MPa",template),
+                      key=lambda row:row["age"])
+        self.assertEqual([row["age"] for row in rows],[0,1])
+        self.assertEqual(rows[1]["strength"]["count"],2)
+        self.assertAlmostEqual(rows[1]["strength"]["mean"],55.)
+        self.assertIsNone(rows[0]["strength"]["std"])
+        with self.assertRaises(ValueError):
+            self.db.aggregate("strengths",["age"],{"strength":["median"]})
+
+    def test_aggregate_without_target_unit(self):
+        rows = self.db.aggregate("strengths",metrics={"strength":["mean","count"],"age":["max"]})
+        self.assertEqual(rows[0]["strength"],{"mean":45.,"count":10})
+        self.assertEqual(rows[0]["age"],{"max":9})
+        self.db.insert(Strength("gpa",1,fld.PhysicalQty(0.1,"GPa")))
+        with self.assertRaises(ValueError):
+            self.db.aggregate("strengths",metrics={"strength":["mean"]})
+
+    def test_dump_and_restore(self):
+        with tempfile.TemporaryDirectory() as path:
+            self.assertEqual(self.db.dump(path,page_size=3,shard_size=4,verbose=False),{"strengths":10})
+            db = MemoryDatabase("restored")
+            self.assertEqual(db.restore(path,chunk_size=3,verbose=False),{"strengths":10})
+        doc = db.get_doc("strengths",self.docs[7]._id,return_as_obj=False)
+        self.assertEqual(doc,self.db.get_doc("strengths",self.docs[7]._id,return_as_obj=False))
+        new = db.insert(Strength("new",1,fld.PhysicalQty(1.,"MPa")))
+        self.assertEqual(db.get_collection("strengths").ndocs,11)
+        self.assertNotIn(new._id,[doc._id for doc in self.docs])
+
+if __name__ == "__main__":
+    unittest.main()
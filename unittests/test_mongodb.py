@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Test for mongodb database backend of ODM. The tests run on mongomock and are skipped if it is not installed.
+"""
+import sys
+sys.path.append("..")
+from MatODM import Documents as Doc
+from MatODM import Fields as fld
+from MatODM.Databases import MongoDB, ConflictError
+from unittest import mock
+import unittest
+try:
+    import mongomock
+    from pymongo.results import BulkWriteResult
+except ImportError:
+    mongomock = None
+
+class Strength(Doc.Document):
+    collection="strengths"
+    name:str
+    age:int
+    strength:fld.PhysicalQty
+
+class Sample(Doc.Document):
+    collection="samples"
+    key_for_checking_duplicates = "name"
+    name:str
+    age:int
+
+class MixDesign(Doc.Document):
+    collection="mixdesigns"
+    name:str
+    water_binder_ratio:float
+
+class Cube(Doc.Document):
+    collection="cubes"
+    relational_fields=["mix"]
+    mix:MixDesign
+    strength:fld.PhysicalQty
+
+class Report(Doc.Document):
+    collection="reports"
+    relational_fields=["cube"]
+    cube:Cube
+    title:str
+
+Doc.Strength = Strength
+Doc.Report = Report
+Doc.MixDesign = MixDesign
+Doc.Cube = Cube
+Doc.Sample = Sample
+
+def _bulk_write(self,requests,ordered=True,*args,**kwargs):
+    """
+    bulk_write of UpdateOne requests run one by one. The bulk builder of mongomock does not take the 
+    arguments of newer pymongo and numbers upserts in order of the upserts instead of the requests.
+    """
+    result = {"nMatched":0,"nModified":0,"nUpserted":0,"nInserted":0,"nRemoved":0,"upserted":[],
+              "writeErrors":[],"writeConcernErrors":[]}
+    for i,request in enumerate(requests):
+        out = self.update_one(request._filter,request._doc,upsert=request._upsert)
+        result["nMatched"] += out.matched_count
+        result["nModified"] += out.modified_count
+        if out.upserted_id is not None:
+            result["nUpserted"] += 1
+            result["upserted"].append({"index":i,"_id":out.upserted_id})
+    return BulkWriteResult(result,True)
+
+@unittest.skipIf(mongomock is None,"mongomock and pymongo are not installed")
+class TestMongoDatabase(unittest.TestCase):
+
+    def setUp(self):
+        client = mongomock.MongoClient()
+        for patcher in (mock.patch.object(MongoDB,"MongoClient",lambda url,*args,**kwargs: client),
+                        mock.patch.object(mongomock.collection.Collection,"bulk_write",_bulk_write)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.db = MongoDB.MongoDatabase("testdb","mongodb://localhost")
+        self.db.create_collection("strengths")
+        docs = [Strength(f"s{i}",i,fld.PhysicalQty(float(10*i),"MPa")) for i in range(10)]
+        self.docs = self.db.insert_multiple(docs)
+
+    def test_insert_and_get(self):
+        self.assertEqual(self.db.get_collection("strengths").ndocs,10)
+        self.assertEqual(self.docs[3]._id,"strengths/"+self.docs[3]._key)
+        doc = self.db.get_doc("strengths",self.docs[3]._id)
+        self.assertEqual(doc.name,"s3")
+        self.assertEqual(doc.strength,fld.PhysicalQty(30.,"MPa"))
+
+    def test_range_query(self):
+        template = Strength.range_query_template()
+        template.age >= 2
+        template.age < 5
+        self.assertEqual(sorted(doc.name for doc in self.db.range_query(template)),["s2","s3","s4"])
+        self.db.insert(Strength("kpa",10,fld.PhysicalQty(70000.,"kPa")))
+        template = Strength.range_query_template()
+        template.strength >= fld.PhysicalQty(65.,"MPa")
+        self.assertEqual(sorted(doc.name for doc in self.db.range_query(template)),["kpa","s7","s8","s9"])
+        self.assertEqual(self.db.delete_where(template),4)
+
+    def test_in_filter(self):
+        coll = self.db.get_collection("strengths")
+        names = sorted(doc["name"] for doc in coll.range_query([("name","in",["s1","s4","x"]),("age","lt",4)]))
+        self.assertEqual(names,["s1"])
+        self.assertEqual(coll.count([("age","in",[7,8,100])]),2)
+        self.assertEqual(sorted(coll.delete_where([("age","in",[7,8,100])],return_ids=True)),
+                         sorted([self.docs[7]._id,self.docs[8]._id]))
+
+    def test_update_with_version_check(self):
+        doc = self.db.get_doc("strengths",self.docs[2]._id)
+        stale = self.db.get_doc("strengths",self.docs[2]._id)
+        doc.age = 20
+        self.assertEqual(self.db.update(doc).version,1)
+        stale.age = 21
+        with self.assertRaises(ConflictError):
+            self.db.update(stale)
+        self.assertEqual(stale.version,0)
+        self.assertEqual(self.db.get_doc("strengths",doc._id).age,20)
+        for doc in self.docs[5:8]: doc.age += 10
+        self.assertEqual([doc.version for doc in self.db.update_multiple(self.docs[5:8])],[1,1,1])
+
+    def test_upsert(self):
+        self.db.create_collection("samples")
+        first = self.db.insert(Sample("a",1))
+        self.assertEqual((first.version,first.revised_on),(0,None))
+        self.assertEqual(first._id,"samples/"+first._key)
+        docs = self.db.insert_multiple([Sample("a",2),Sample("b",3)])
+        self.assertEqual([doc.version for doc in docs],[1,0])
+        self.assertEqual(docs[0]._id,first._id)
+        self.assertEqual(docs[0].created_on,first.created_on)
+        self.assertIsNotNone(docs[0].revised_on)
+        self.assertEqual(self.db.get_collection("samples").ndocs,2)
+        self.assertEqual(self.db.get_doc("samples",first._id).age,2)
+        stored = self.db.get_doc("samples",docs[1]._id)
+        self.assertEqual((stored.version,stored.revised_on),(0,None))
+        with self.assertRaises(ValueError):
+            self.db.insert(Sample(None,4))
+
+    def test_changes_since(self):
+        changes, token = self.db.changes_since("strengths")
+        self.assertEqual({change["type"] for change in changes},{"insert"})
+        doc = self.docs[0]
+        doc.age = 100
+        self.db.update(doc)
+        template = Strength.example_template()
+        template.name = "s1"
+        self.db.delete_where(template)
+        changes, token = self.db.changes_since("strengths",token)
+        self.assertEqual([(change["type"],change["_id"]) for change in changes],
+                         [("update",self.docs[0]._id),("delete",self.docs[1]._id)])
+        self.db.create_collection("samples")
+        _, token = self.db.changes_since("samples")
+        self.db.insert(Sample("a",1))
+        self.assertEqual([change["type"] for change in self.db.changes_since("samples",token)[0]],["insert"])
+
+    def test_update_where(self):
+        template = Strength.range_query_template()
+        template.age >= 7
+        self.assertEqual(self.db.update_where(template,{"name":"high"},dry_run=True),3)
+        self.assertEqual(self.db.update_where(template,{"name":"high","strength.unit":"N/mm2"}),3)
+        doc = self.db.get_doc("strengths",self.docs[8]._id)
+        self.assertEqual((doc.name,doc.version,doc.strength),("high",1,fld.PhysicalQty(80.,"N/mm2")))
+        self.assertEqual(self.db.get_doc("strengths",self.docs[6]._id).name,"s6")
+
+    def test_get_docs(self):
+        ids = [self.docs[i]._id for i in (7,2,7)]+["strengths/missing"]
+        docs = self.db.get_docs(ids)
+        self.assertEqual([None if doc is None else doc.name for doc in docs],["s7","s2","s7",None])
+        sample = self.db.get_random_docs("strengths",3,return_as_obj=False)
+        self.assertEqual(len({doc["_id"] for doc in sample}),3)
+
+    def test_aggregate_without_target_unit(self):
+        self.db.insert(Strength("gpa",1,fld.PhysicalQty(0.1,"GPa")))
+        #mongomock has no $stdDevSamp used by the aggregation, the metric specs are checked before it
+        with self.assertRaises(ValueError):
+            self.db.aggregate("strengths",[],{"strength":["median"]},"MPa")
+        with self.assertRaises(ValueError):
+            self.db.aggregate("strengths",metrics={"strength":["mean"]})
+
+    def test_join(self):
+        self.db.create_collection("mixdesigns")
+        self.db.create_collection("cubes")
+        mixes = self.db.insert_multiple([MixDesign("low",0.35),MixDesign("high",0.5)])
+        self.db.insert_multiple([Cube(mixes[i%2],fld.PhysicalQty(float(40+i),"MPa")) for i in range(4)])
+        template = MixDesign.range_query_template()
+        template.water_binder_ratio < 0.4
+        rows = self.db.join(Cube.range_query_template()).follow("mix",template).run()
+        self.assertEqual(sorted(row["doc"].strength.value for row in rows),[40.,42.])
+        self.assertEqual({row["mix"].name for row in rows},{"low"})
+
+    def test_graph_traversal(self):
+        self.db.enable_graph()
+        for name in ("mixdesigns","cubes","reports"): self.db.create_collection(name)
+        mix = self.db.insert(MixDesign("low",0.35))
+        cubes = self.db.insert_multiple([Cube(mix,fld.PhysicalQty(40.,"MPa")),Cube(mix,fld.PhysicalQty(41.,"MPa"))])
+        self.db.insert(Report(cubes[0],"r1"))
+        docs = self.db.traverse(mix,depth=2,direction="inbound")
+        self.assertEqual(sorted(type(doc).__name__ for doc in docs),["Cube","Cube","Report"])
+        template = Cube.example_template()
+        self.assertEqual(self.db.delete_where(template),2)
+        self.assertEqual(self.db.get_collection(self.db._edge_collection).ndocs,0)
+
+    def test_chunked_storage(self):
+        self.db.enable_chunked_storage(threshold=10,chunk_size=4)
+        doc = self.db.insert(Strength("series",1,fld.PhysicalQty([float(i) for i in range(25)],"MPa")))
+        chunks = self.db.get_collection("odm_chunks")
+        self.assertEqual(chunks.count([("parent","eq",doc._id)]),7)
+        stored = self.db.get_doc("strengths",doc._id)
+        self.assertEqual(list(stored.strength.value),[float(i) for i in range(25)])
+        stored.strength = fld.PhysicalQty([1.]*11,"MPa")
+        self.db.update(stored)
+        self.assertEqual(list(self.db.get_doc("strengths",doc._id).strength.value),[1.]*11)
+        self.assertEqual(chunks.count([("parent","eq",doc._id)]),3)
+
+    def test_del_collection(self):
+        self.db.del_collection("strengths")
+        self.assertFalse(self.db.has_collection("strengths"))
+
+if __name__=="__main__":
+    unittest.main()
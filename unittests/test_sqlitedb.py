@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Test for sqlite database backend of ODM.
+"""
+import sys
+sys.path.append("..")
+from MatODM import Documents as Doc
+from MatODM import Fields as fld
+from MatODM.Databases import SqliteDatabase, ConflictError
+import tempfile
+import unittest
+
+class Strength(Doc.Document):
+    collection="strengths"
+    name:str
+    age:int
+    strength:fld.PhysicalQty
+
+class MixDesign(Doc.Document):
+    collection="mixdesigns"
+    name:str
+    water_binder_ratio:float
+
+class Cube(Doc.Document):
+    collection="cubes"
+    relational_fields=["mix"]
+    mix:MixDesign
+    strength:fld.PhysicalQty
+
+class Report(Doc.Document):
+    collection="reports"
+    relational_fields=["cube"]
+    cube:Cube
+    title:str
+
+Doc.Strength = Strength
+Doc.Report = Report
+Doc.MixDesign = MixDesign
+Doc.Cube = Cube
+
+class TestSqliteDatabase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = SqliteDatabase("testdb",self.tmpdir.name)
+        self.db.create_collection("strengths",indexes=["name","strength.value"])
+        docs = [Strength(f"s{i}",i,fld.PhysicalQty(float(10*i),"MPa")) for i in range(10)]
+        self.docs = self.db.insert_multiple(docs)
+
+    def tearDown(self):
+        self.db.db.close()
+        self.tmpdir.cleanup()
+
+    def test_insert_and_get(self):
+        self.assertEqual(self.db.get_collection("strengths").ndocs,10)
+        doc = self.db.get_doc("strengths",self.docs[3]._id)
+        self.assertEqual(doc.name,"s3")
+        self.assertEqual(doc.strength,fld.PhysicalQty(30.,"MPa"))
+
+    def test_reopen_database(self):
+        db = SqliteDatabase("testdb",self.tmpdir.name)
+        self.assertEqual(db.collection_names,["strengths"])
+        self.assertEqual(db.get_collection("strengths").ndocs,10)
+        db.db.close()
+
+    def test_queries(self):
+        template = Strength.example_template()
+        template.name = "s5"
+        self.assertEqual([doc.age for doc in self.db.find(template)],[5])
+        template = Strength.range_query_template()
+        template.strength >= fld.PhysicalQty(65.,"MPa")
+        self.assertEqual(sorted(doc.age for doc in self.db.range_query(template)),[7,8,9])
+        plan = self.db.range_query(template,profile=True)
+        self.assertFalse(plan["full_scan"])
+        self.assertEqual(plan["rows_returned"],3)
+        plan = self.db.find_in_range_of_field("strengths","age",2,4,profile=True)
+        self.assertTrue(plan["full_scan"])
+        self.assertEqual((plan["rows_scanned"],plan["rows_returned"]),(10,3))
+        self.assertEqual(self.db.get_doc_with_key("strengths","name","s5",explain=True)["indexes"],["idx_strengths_name"])
+        plan = self.db.explain_query('SELECT doc FROM strengths WHERE json_extract(doc,\'$."name"\') = ?',("s5",))
+        self.assertIn("idx_strengths_name",str(plan))
+
+    def test_range_query_with_other_stored_units(self):
+        self.db.insert(Strength("kpa",10,fld.PhysicalQty(30000.,"kPa")))
+        template = Strength.range_query_template()
+        template.strength >= fld.PhysicalQty(25.,"MPa")
+        template.strength <= fld.PhysicalQty(40.,"MPa")
+        self.assertEqual(sorted(doc.name for doc in self.db.range_query(template)),["kpa","s3","s4"])
+        self.assertEqual(self.db.delete_where(template),3)
+
+    def test_aggregate_with_unit_conversion(self):
+        self.db.insert(Strength("gpa",1,fld.PhysicalQty(0.1,"GPa")))
+        rows = self.db.aggregate("strengths",[],{"strength":["mean","count","std","sum"]},"MPa")
+        self.assertEqual(rows[0]["strength"]["count"],11)
+        self.assertAlmostEqual(rows[0]["strength"]["sum"],550.)
+        self.assertAlmostEqual(rows[0]["strength"]["std"],33.1662479,5)
+
+    def test_aggregate_std_of_large_values(self):
+        self.db.insert_multiple([Strength("big",i,fld.PhysicalQty(1e9+0.1*i,"MPa")) for i in range(3)])
+        rows = self.db.aggregate("strengths",["name"],{"strength":["mean","std"]},"MPa")
+        big = [row for row in rows if row["name"]=="big"][0]
+        self.assertAlmostEqual(big["strength"]["std"],0.1,5)
+        self.assertIsNone([row for row in rows if row["name"]=="s1"][0]["strength"]["std"])
+
+    def test_upsert_with_key(self):
+        doc = Strength("s3",33,fld.PhysicalQty(1.,"MPa"))
+        doc._key = self.docs[3]._key
+        self.db.insert(doc)
+        self.assertEqual((doc._id,doc.version),(self.docs[3]._id,1))
+        self.assertEqual(doc.created_on,self.docs[3].created_on)
+        self.assertEqual(self.db.get_doc("strengths",doc._id).age,33)
+        doc = Strength("new",1,fld.PhysicalQty(1.,"MPa"))
+        doc._key = "newkey"
+        self.assertEqual(self.db.insert(doc)._id,"strengths/newkey")
+        self.assertEqual(self.db.get_collection("strengths").ndocs,11)
+
+    def test_ingest_with_existing_documents(self):
+        docs = [Strength(f"i{i}",i,fld.PhysicalQty(1.,"MPa")) for i in range(300)]
+        for i in range(0,300,3): docs[i]._key = f"k{i}"
+        docs[1]._key = self.docs[1]._key
+        self.db.insert_multiple(docs,workers=2,chunk_size=100)
+        self.assertEqual(self.db.get_collection("strengths").ndocs,309)
+        self.assertEqual(self.db.get_doc("strengths",self.docs[1]._id).name,"i1")
+        self.assertEqual(docs[3]._id,"strengths/k3")
+
+    def test_upsert_matches_one_document(self):
+        coll = self.db.get_collection("strengths")
+        with self.assertRaises(ValueError):
+            coll.upsert_many([{"code":None,"v":99}],"code","now")
+        coll.upsert_many([{"code":"c1","v":1}],"code","now")
+        self.assertEqual(coll.upsert_many([{"code":"c1","v":2}],"code","later")[0][2:],(1,"now","later"))
+        self.assertEqual([doc["v"] for doc in coll.find({"code":"c1"})],[2])
+        self.assertEqual(len(coll.find({"v":2})),1)
+        coll.insert({"name":"s1"})
+        with self.assertRaises(ValueError):
+            coll.upsert_many([{"name":"s1"}],"name","now")
+
+    def test_update_versioned_matches_one_document(self):
+        coll = self.db.get_collection("strengths")
+        coll.insert_many([{"code":"c1","version":0},{"code":"c1","version":0},{"version":0}])
+        with self.assertRaises(ValueError):
+            coll.update_versioned([{"code":None,"version":1,"v":1}],"code")
+        self.assertIsNotNone(coll.update_versioned([{"code":"c1","version":1,"v":1}],"code")[0])
+        self.assertEqual(sorted(doc.get("v",0) for doc in coll.find({"code":"c1"})),[0,1])
+
+    def test_join(self):
+        self.db.create_collection("mixdesigns")
+        self.db.create_collection("cubes")
+        mixes = self.db.insert_multiple([MixDesign("low",0.35),MixDesign("high",0.5)])
+        cubes = [Cube(mixes[i%2],fld.PhysicalQty(float(40+i),"MPa")) for i in range(4)]
+        self.db.insert_multiple(cubes)
+        template = MixDesign.range_query_template()
+        template.water_binder_ratio < 0.4
+        rows = self.db.join(Cube.range_query_template()).follow("mix",template).run()
+        self.assertEqual(sorted(row["doc"].strength.value for row in rows),[40.,42.])
+        self.assertEqual({row["mix"].name for row in rows},{"low"})
+        self.db.delete_where(MixDesign.example_template())
+        rows = self.db.join(Cube.example_template()).follow("mix").run(return_as_obj=False)
+        self.assertEqual([row["mix"] for row in rows],[None]*4)
+        with self.assertRaises(ValueError):
+            self.db.join(Cube.example_template()).follow("strength")
+
+    def test_graph_traversal(self):
+        self.db.enable_graph()
+        for name in ("mixdesigns","cubes","reports"): self.db.create_collection(name)
+        mix = self.db.insert(MixDesign("low",0.35))
+        cubes = self.db.insert_multiple([Cube(mix,fld.PhysicalQty(40.,"MPa")),Cube(mix,fld.PhysicalQty(41.,"MPa"))])
+        report = self.db.insert(Report(cubes[0],"r1"))
+        self.assertEqual([doc.name for doc in self.db.traverse(report,2,doc_types=["MixDesign"])],["low"])
+        docs = self.db.traverse(mix,depth=2,direction="inbound")
+        self.assertEqual([type(doc).__name__ for doc in docs],["Cube","Cube","Report"])
+        self.assertEqual([doc.title for doc in self.db.traverse(mix._id,3,"inbound",[Report])],["r1"])
+        self.assertEqual(len(self.db.traverse(cubes[1],depth=3,direction="any")),3)
+        report.cube = cubes[1]
+        self.db.update(report)
+        self.assertEqual(self.db.traverse(report,return_as_obj=False)[0]["_id"],cubes[1]._id)
+        template = Cube.example_template()
+        template._id = cubes[1]._id
+        self.db.delete_where(template)
+        self.assertEqual(self.db.traverse(report,depth=2),[])
+
+    def test_get_docs(self):
+        ids = [self.docs[i]._id for i in (7,2,7)]+["strengths/missing","nocollection/1"]
+        docs = self.db.get_docs(ids,chunk_size=2,workers=2)
+        self.assertEqual([None if doc is None else doc.name for doc in docs],["s7","s2","s7",None,None])
+        with self.assertRaises(ValueError):
+            self.db.get_docs(ids,raise_missing=True)
+        docs = self.db.get_docs_with_key("strengths","name",["s3","x","s1"],return_as_obj=False)
+        self.assertEqual([None if doc is None else doc["age"] for doc in docs],[3,None,1])
+
+    def test_update_and_delete(self):
+        doc = self.docs[4]
+        doc.age = 40
+        self.db.update(doc)
+        coll = self.db.get_collection("strengths")
+        self.assertEqual(len(coll.find_in_range_of_field("age",40,40,False)),1)
+        stale = self.db.get_doc("strengths",doc._id)
+        stale.version = 0
+        stale.age = 41
+        with self.assertRaises(ConflictError):
+            self.db.update(stale)
+        template = Strength.range_query_template()
+        template.age <= 1
+        self.assertEqual(self.db.delete_where(template),2)
+        self.assertEqual(coll.ndocs,8)
+        changes, token = self.db.changes_since("strengths",self.docs[9].change_stamp)
+        self.assertEqual([change["type"] for change in changes],["update","delete","delete"])
+        self.assertEqual(self.db.delete_all_documents_from_collection("strengths"),8)
+        self.assertEqual(self.db.changes_since("strengths",token)[0][0]["type"],"clear")
+
+    def test_count_and_delete_returning_ids(self):
+        coll = self.db.get_collection("strengths")
+        self.assertEqual(coll.count([("age","le",3)]),4)
+        self.assertEqual(coll.count([("name","in",["s1","s3","x"])]),2)
+        self.assertEqual(coll.delete_where([("age","eq",3)],return_ids=True),[self.docs[3]._id])
+        self.assertEqual(coll.delete_where([("age","eq",3)],return_ids=True),[])
+        self.assertEqual(coll.count(),9)
+
+    def test_update_where(self):
+        template = Strength.range_query_template()
+        template.age >= 7
+        self.assertEqual(self.db.update_where(template,{"name":"high"},dry_run=True),3)
+        self.assertEqual(self.db.update_where(template,{"name":"high","strength.unit":"N/mm2"}),3)
+        doc = self.db.get_doc("strengths",self.docs[8]._id)
+        self.assertEqual((doc.name,doc.version,doc.strength),("high",self.docs[8].version+1,fld.PhysicalQty(80.,"N/mm2")))
+        self.assertEqual(self.db.get_doc("strengths",self.docs[6]._id).name,"s6")
+        changes, token = self.db.changes_since("strengths",self.docs[9].change_stamp,limit=2)
+        self.assertEqual([change["type"] for change in changes],["update"]*3)
+        with self.assertRaises(ValueError):
+            self.db.update_where(template,{"strength":None,"strength.unit":"MPa"})
+
+    def test_chunked_storage(self):
+        self.db.enable_chunked_storage(threshold=10,chunk_size=4,workers=2)
+        docs = self.db.insert_multiple([Strength(f"series{i}",i,fld.PhysicalQty([float(i)]*(20+i),"MPa")) for i in range(3)])
+        raw = self.db.get_doc("strengths",docs[2]._id,return_as_obj=False)
+        self.assertEqual((raw["strength"]["value"]["length"],raw["strength"]["value"]["mean"]),(22,2.))
+        self.assertEqual(self.db.get_collection("odm_chunks").ndocs,5+6+6)
+        stored = self.db.get_docs([doc._id for doc in docs])
+        self.assertEqual([list(doc.strength.value) for doc in stored],[[float(i)]*(20+i) for i in range(3)])
+        self.assertEqual(self.db.delete_all_documents_from_collection("strengths"),13)
+        self.assertEqual(self.db.get_collection("odm_chunks").ndocs,0)
+
+if __name__ == "__main__":
+    unittest.main()